@@ -1,11 +1,36 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routers.auth import router as auth_router
+from .database import is_connected, dispose_engines
+from .schema_cache import warm_start_schema_cache
+from .concurrency import run_in_db_pool, shutdown_executors
+from .render_pool import prewarm_render_pool, shutdown_render_pool
+from backend.routers.auth import router as auth_router, bind_connection
 from .routers.query import router as query_router
 from .routers.graph import router as graph_router
+from .routers.schema import router as schema_router
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the persisted schema snapshot (checked against the live table versions) on a
+    # database thread so startup isn't held up by the database; requests that need the
+    # schema meanwhile wait for it instead of loading it again
+    warm = asyncio.create_task(run_in_db_pool(warm_start_schema_cache)) if is_connected() else None
+    # Start the chart render processes in the background so startup isn't held up by them
+    prewarm = asyncio.create_task(prewarm_render_pool())
+    yield
+    if warm is not None:
+        warm.cancel()
+    prewarm.cancel()
+    shutdown_executors()
+    shutdown_render_pool()
+    dispose_engines()
+
+
+# Every request is routed to the database connection named by its X-Connection-Id header
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(bind_connection)])
 
 # CORS for local dev (adjust in prod)
 app.add_middleware(
@@ -20,6 +45,7 @@ app.add_middleware(
 app.include_router(auth_router)
 app.include_router(query_router)
 app.include_router(graph_router)
+app.include_router(schema_router)
 
 
 @app.get("/")
@@ -0,0 +1,140 @@
+import decimal
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+def _widen(data_type):
+    """
+    Type to use for a column given the type inferred from its first batch. Later
+    batches must fit the same schema, so decimals get the widest precision and
+    all-NULL columns fall back to strings.
+    """
+    if pa.types.is_null(data_type):
+        return pa.string()
+    if pa.types.is_decimal(data_type):
+        return pa.decimal128(38, data_type.scale)
+    return data_type
+
+
+def _column_values(values, data_type):
+    if pa.types.is_string(data_type):
+        return [None if value is None else value if isinstance(value, str) else str(value) for value in values]
+    if pa.types.is_decimal(data_type):
+        return [value.quantize(decimal.Decimal(1).scaleb(-data_type.scale))
+                if isinstance(value, decimal.Decimal) else value for value in values]
+    return values
+
+
+def infer_schema(columns, rows):
+    """Arrow schema for a result set, inferred from its first batch of row tuples"""
+    column_values = list(zip(*rows)) if rows else [() for _ in columns]
+    fields = [
+        pa.field(name, _widen(pa.array(values).type if values else pa.null()))
+        for name, values in zip(columns, column_values)
+    ]
+    return pa.schema(fields)
+
+
+def rows_to_record_batch(rows, schema):
+    """Converts a batch of row tuples into a RecordBatch column by column (no per-row dicts)"""
+    column_values = list(zip(*rows)) if rows else [() for _ in schema]
+    arrays = [
+        pa.array(_column_values(values, field.type), type=field.type)
+        for values, field in zip(column_values, schema)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def rows_to_table(columns, rows):
+    """
+    Converts a whole result (row tuples) into a Table, inferring each column's type
+    from all of its values. All-NULL columns, and columns whose values don't share
+    one Arrow type, are stored as strings.
+    """
+    column_values = list(zip(*rows)) if rows else [() for _ in columns]
+    arrays = []
+    for values in column_values:
+        try:
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array(_column_values(values, pa.string()), type=pa.string())
+        if pa.types.is_null(array.type):
+            array = pa.nulls(len(values), pa.string())
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def table_to_rows(table):
+    """Row tuples of Python values for a Table (or a slice of one)"""
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+class _ChunkSink:
+    """Write-only file object that collects bytes until they are drained to the client"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ArrowStreamEncoder:
+    """Incrementally encodes row batches as an Arrow IPC stream"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._sink = _ChunkSink()
+        self._writer = pa.ipc.new_stream(pa.PythonFile(self._sink, mode="w"), schema)
+
+    def encode(self, rows):
+        return self.encode_batch(rows_to_record_batch(rows, self.schema))
+
+    def encode_batch(self, record_batch):
+        self._writer.write_batch(record_batch)
+        return self._sink.drain()
+
+    def finish(self):
+        self._writer.close()
+        return self._sink.drain()
+
+
+class ParquetStreamEncoder:
+    """Incrementally encodes row batches as a Parquet file, one row group per batch"""
+
+    def __init__(self, schema, compression="zstd"):
+        self.schema = schema
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(pa.PythonFile(self._sink, mode="w"), schema, compression=compression)
+
+    def encode(self, rows):
+        return self.encode_batch(rows_to_record_batch(rows, self.schema))
+
+    def encode_batch(self, record_batch):
+        self._writer.write_batch(record_batch)
+        return self._sink.drain()
+
+    def finish(self):
+        self._writer.close()
+        return self._sink.drain()
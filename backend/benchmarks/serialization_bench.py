@@ -0,0 +1,80 @@
+"""
+Compares the old per-row dict(row._mapping) serialization of /execute_sql with
+the shared serializer in backend/serialization.py.
+
+Run from the repository root:
+    python -m backend.benchmarks.serialization_bench --rows 100000
+"""
+import time
+import json
+import random
+import decimal
+import datetime
+import argparse
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.engine.result import result_tuple
+from ..serialization import dumps, shape_rows, orjson
+
+COLUMNS = ["id", "name", "amount", "created_at", "is_active", "notes"]
+
+
+def make_rows(count):
+    """SQLAlchemy Row objects, so the legacy path pays the same per-row costs as in production"""
+    random.seed(0)
+    base = datetime.datetime(2024, 1, 1)
+    make_row = result_tuple(COLUMNS)
+    return [
+        make_row((i, f"customer_{i}", decimal.Decimal(f"{random.uniform(0, 10000):.2f}"),
+                  base + datetime.timedelta(minutes=i), i % 3 == 0, None if i % 5 else "follow up"))
+        for i in range(count)
+    ]
+
+
+def legacy(rows):
+    """The loop previously in routers/query.py, followed by FastAPI's response encoding"""
+    serialized_rows = []
+    for row in rows:
+        if hasattr(row, "_mapping"):
+            serialized_rows.append(dict(row._mapping))
+        else:
+            try:
+                serialized_rows.append(dict(row))
+            except Exception:
+                serialized_rows.append({"values": list(row)})
+    body = jsonable_encoder({"results": serialized_rows, "optimization_tips": ""})
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def shared(shape):
+    def run(rows):
+        return dumps({**shape_rows(COLUMNS, rows, shape), "optimization_tips": ""})
+    return run
+
+
+def measure(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{args.rows} rows, encoder: {'orjson' if orjson is not None else 'json'}")
+    baseline = None
+    for label, fn in [("legacy dict(row._mapping)", legacy), ("records", shared("records")),
+                      ("compact", shared("compact")), ("columns", shared("columns"))]:
+        seconds, size = measure(fn, rows, args.repeat)
+        baseline = baseline or seconds
+        print(f"{label:<28} {seconds * 1000:9.1f} ms  {size / 1e6:7.2f} MB  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import pandas as pd
+from .cache_utils import TTLCache
+from .chart_renderer import (
+    CHART_RENDERER_VERSION, MAX_CATEGORY_VALUES, MAX_BAR_CATEGORIES, MAX_PIE_SLICES, MAX_POINTS
+)
+from .graph_generator import CHART_RENDERER, OPENAI_MODEL
+
+# How long a rendered chart and its insights are reused for the same data
+CHART_CACHE_TTL_SECONDS = int(os.getenv("CHART_CACHE_TTL_SECONDS", "86400"))
+# Charts kept in memory (0 disables the cache)
+CHART_CACHE_MAX_ENTRIES = int(os.getenv("CHART_CACHE_MAX_ENTRIES", "200"))
+# Optional directory where charts are also persisted, so they survive restarts and are shared by workers
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "")
+# Bytes of persisted charts kept before the least recently used are deleted
+CHART_CACHE_DISK_BYTES = int(os.getenv("CHART_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+
+def data_fingerprint(df: pd.DataFrame):
+    """
+    Short content hash of a DataFrame: column names, dtypes and every value in
+    row order, hashed column-wise by pandas without converting rows to Python.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode("utf-8"))
+    try:
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    except TypeError:
+        # Values pandas can't hash (e.g. lists from JSON columns) fall back to their text form
+        digest.update(df.to_csv(index=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chart_cache_key(df: pd.DataFrame, chart_type: str, chart_name: str, summary=None):
+    """
+    Cache key for a chart of this data: the data fingerprint plus everything else
+    that shapes the image and insights (chart type and title, renderer mode and
+    version, drawing limits, the model, and for a reduced chart the summary of the
+    full result its insights were written from).
+    """
+    parts = [
+        data_fingerprint(df), (chart_type or "").lower(), chart_name or "", CHART_RENDERER,
+        CHART_RENDERER_VERSION, MAX_CATEGORY_VALUES, MAX_BAR_CATEGORIES, MAX_PIE_SLICES, MAX_POINTS, OPENAI_MODEL,
+        summary
+    ]
+    return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """
+    Rendered charts (image and insights) by content key. A bounded in-memory LRU
+    answers repeat requests; when `directory` is set, charts are also written
+    there as JSON files, read back on a memory miss and pruned to `disk_bytes`
+    by last use.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, directory, disk_bytes):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self._memory = TTLCache(max_entries, ttl_seconds)
+        self.disk_hits = 0
+
+    @property
+    def enabled(self):
+        return self._memory.max_entries > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        chart = self._memory.get(key)
+        if chart is not None or not self.directory:
+            return chart
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) >= self._memory.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                chart = json.load(f)
+            # The modification time doubles as last use for pruning
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[CHART CACHE] Ignoring unreadable chart {path}: {e}")
+            return None
+        self.disk_hits += 1
+        self._memory.set(key, chart)
+        return chart
+
+    def set(self, key, chart):
+        if not self.enabled:
+            return
+        self._memory.set(key, chart)
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial chart
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(chart, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path(key))
+            self._prune()
+        except Exception as e:
+            print(f"[CHART CACHE] Failed to write chart: {e}")
+
+    def _prune(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        used = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            used -= size
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats['directory'] = self.directory or None
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+
+chart_cache = ChartCache(CHART_CACHE_MAX_ENTRIES, CHART_CACHE_TTL_SECONDS, CHART_CACHE_DIR, CHART_CACHE_DISK_BYTES)
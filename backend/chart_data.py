@@ -0,0 +1,148 @@
+import os
+import pandas as pd
+from .chart_renderer import prepare_frame, plan_chart, shape_data, MAX_POINTS
+from .downsampling import downsample_line, thin_scatter
+
+# Results up to this many rows are charted as they are; larger ones are reduced in SQL or while streaming
+GRAPH_MAX_ROWS = int(os.getenv("GRAPH_MAX_ROWS", "50000"))
+# Most groups a pushed-down GROUP BY returns for a bar or pie chart (largest first)
+GRAPH_MAX_GROUPS = int(os.getenv("GRAPH_MAX_GROUPS", "10000"))
+
+_SQL_AGGREGATES = {"sum": "SUM", "mean": "AVG", "min": "MIN", "max": "MAX"}
+
+
+def plan_reduction(sample: pd.DataFrame, chart_type: str):
+    """
+    Decides how to chart a result that has more than GRAPH_MAX_ROWS rows, from the
+    first rows of it. Returns (plan, strategy) where strategy is:
+      "aggregate" - push a GROUP BY down to MySQL (bar and pie charts, lines with repeated x)
+      "stream"    - stream only the plotted columns and downsample as they arrive (line, scatter)
+    or (None, None) when no template fits and the sample is charted instead.
+    """
+    frame, roles = prepare_frame(sample)
+    plan = plan_chart(roles, (chart_type or "").lower())
+    if plan is None:
+        return None, None
+    ordered_x = plan["x"] in roles["temporal"] or plan["x"] in roles["numeric"]
+    if plan["chart_type"] in ("bar", "pie"):
+        return plan, "aggregate"
+    if plan["chart_type"] == "line" and frame[plan["x"]].duplicated().any():
+        return plan, "aggregate"
+    if ordered_x:
+        return plan, "stream"
+    return None, None
+
+
+def reduce_frame(df: pd.DataFrame, chart_type: str):
+    """
+    In-memory counterpart of the SQL reduction, for results already held by the
+    result store: a frame over GRAPH_MAX_ROWS is aggregated or downsampled as the
+    chart will be, so only the plotted rows are sent to a render worker.
+    """
+    if len(df) <= GRAPH_MAX_ROWS:
+        return df
+    frame, roles = prepare_frame(df)
+    plan = plan_chart(roles, (chart_type or "").lower())
+    if plan is None:
+        return df.iloc[:GRAPH_MAX_ROWS]
+    data, y, _ = shape_data(frame, {**plan, "limit": GRAPH_MAX_GROUPS if plan["chart_type"] == "bar" else None})
+    if len(data) > GRAPH_MAX_GROUPS:
+        data = data.nlargest(GRAPH_MAX_GROUPS, y[0])
+    return data[[plan["x"]] + [column for column in y if column != plan["x"]]].reset_index(drop=True)
+
+
+def aggregate_sql(sql_query, plan, quote):
+    """
+    GROUP BY over the query as a derived table: one row per x value with each y
+    summed (or the row count). Bar and pie charts keep the GRAPH_MAX_GROUPS
+    largest groups. `quote` quotes an identifier for the connection's dialect.
+    """
+    x = quote(plan["x"])
+    function = _SQL_AGGREGATES.get(plan.get("aggregation") or "sum", "SUM")
+    if plan["y"]:
+        values = ", ".join(f"{function}({quote(column)}) AS {quote(column)}" for column in plan["y"])
+    else:
+        values = f"COUNT(*) AS {quote('count')}"
+    inner = sql_query.strip().rstrip(";")
+    aggregated = f"SELECT {x}, {values} FROM ({inner}) AS _chart GROUP BY {x}"
+    if plan["chart_type"] in ("bar", "pie"):
+        aggregated += f" ORDER BY 2 DESC LIMIT {GRAPH_MAX_GROUPS}"
+    return aggregated
+
+
+def projection_sql(sql_query, plan, quote):
+    """Selects only the plotted columns, so the rows streamed for a line or scatter chart stay narrow"""
+    columns = ", ".join(quote(column) for column in [plan["x"]] + plan["y"])
+    return f"SELECT {columns} FROM ({sql_query.strip().rstrip(';')}) AS _chart"
+
+
+def summary_sql(sql_query, columns, quote):
+    """
+    Row count plus the count, mean, min and max of each given column over the
+    query's whole result, in one pass; these stand in for describe() when the
+    chart is drawn from reduced rows.
+    """
+    values = ["COUNT(*)"]
+    for column in columns:
+        quoted = quote(column)
+        values += [f"COUNT({quoted})", f"AVG({quoted})", f"MIN({quoted})", f"MAX({quoted})"]
+    return f"SELECT {', '.join(values)} FROM ({sql_query.strip().rstrip(';')}) AS _summary"
+
+
+def summarize_result(sample: pd.DataFrame, columns, row):
+    """
+    Description of a whole result for the insights prompt (see
+    key_insights.summarize_frame), from its first rows and the summary_sql row.
+    """
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return float("nan")
+
+    stats = pd.DataFrame(
+        {column: [number(value) for value in row[1 + 4 * i:5 + 4 * i]] for i, column in enumerate(columns)},
+        index=["count", "mean", "min", "max"]
+    )
+    return {
+        'row_count': int(row[0]),
+        'columns': sample.columns.tolist(),
+        'preview': sample.head(3).to_csv(index=False),
+        'summary_stats': stats.to_string() if columns else ""
+    }
+
+
+class StreamingReducer:
+    """
+    Downsamples a line or scatter series batch by batch, so memory stays bounded
+    by a few multiples of MAX_POINTS however many rows the query returns. Lines
+    are compacted with min-max buckets (extremes survive every round); the
+    renderer's final LTTB pass then picks the points actually drawn.
+    """
+
+    def __init__(self, plan, max_points=MAX_POINTS):
+        self.plan = plan
+        self.max_points = max_points
+        self._frames = []
+        self._buffered = 0
+        self.rows_seen = 0
+
+    def _reduce(self, frame, max_points):
+        x, y = self.plan["x"], self.plan["y"]
+        if self.plan["chart_type"] == "scatter":
+            return thin_scatter(frame, x, y[0], max_points)
+        return downsample_line(frame.sort_values(x), x, y, max_points, method="minmax")
+
+    def add(self, columns, rows):
+        frame, _ = prepare_frame(pd.DataFrame.from_records(rows, columns=columns))
+        self._frames.append(frame)
+        self._buffered += len(frame)
+        self.rows_seen += len(frame)
+        if self._buffered > 4 * self.max_points:
+            compacted = self._reduce(pd.concat(self._frames, ignore_index=True), 2 * self.max_points)
+            self._frames, self._buffered = [compacted], len(compacted)
+
+    def result(self):
+        if not self._frames:
+            return pd.DataFrame()
+        return pd.concat(self._frames, ignore_index=True)
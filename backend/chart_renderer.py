@@ -0,0 +1,362 @@
+import io
+import os
+import base64
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from .downsampling import downsample_line, thin_scatter
+
+# Text columns with at most this many distinct values are treated as categories
+MAX_CATEGORY_VALUES = int(os.getenv("CHART_MAX_CATEGORY_VALUES", "50"))
+# Bars and pie slices beyond these are dropped (bars) or folded into "Other" (pie), largest kept
+MAX_BAR_CATEGORIES = int(os.getenv("CHART_MAX_BAR_CATEGORIES", "30"))
+MAX_PIE_SLICES = int(os.getenv("CHART_MAX_PIE_SLICES", "8"))
+# Numeric columns drawn as separate series on one bar or line chart
+MAX_SERIES = 4
+# Points drawn per line or scatter chart; larger series are downsampled (LTTB, min-max or grid thinning)
+MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "5000"))
+
+# Bump when a change to the templates alters the images they draw, so cached charts are re-rendered
+CHART_RENDERER_VERSION = 1
+
+FIGURE_SIZE = (14, 8)
+CHART_TYPES = ("bar", "line", "pie", "scatter")
+# Values a chart spec may use for "aggregation" and "sort"
+AGGREGATIONS = ("none", "sum", "mean", "count", "min", "max")
+SORTS = ("none", "x", "y_asc", "y_desc")
+
+
+def _as_numeric(series):
+    """Numeric version of an object column (e.g. MySQL DECIMALs), or None if it isn't numeric"""
+    values = series.dropna()
+    if values.empty or values.map(lambda v: isinstance(v, (bool, str, bytes))).any():
+        return None
+    converted = pd.to_numeric(series, errors='coerce')
+    return converted if converted.notna().sum() == len(values) else None
+
+
+def _as_datetime(series):
+    """Datetime version of an object column of date/datetime values, or None"""
+    values = series.dropna()
+    if values.empty or not values.map(lambda v: hasattr(v, 'year') and hasattr(v, 'month')).all():
+        return None
+    return pd.to_datetime(series, errors='coerce')
+
+
+def _is_identifier(name, series):
+    """Integer keys (id, *_id) label rows rather than measure anything"""
+    lowered = str(name).lower()
+    return (lowered == 'id' or lowered.endswith('_id')) and pd.api.types.is_integer_dtype(series)
+
+
+def prepare_frame(df: pd.DataFrame):
+    """
+    Converts object columns holding numbers or dates to proper dtypes and sorts the
+    columns into roles by dtype and cardinality.
+
+    Returns (frame, roles) where roles maps "temporal", "numeric", "categorical",
+    "label" (text with too many distinct values to group by) and "identifier" to
+    column names, in the order the columns appear.
+    """
+    frame = df.copy()
+    roles = {"temporal": [], "numeric": [], "categorical": [], "label": [], "identifier": []}
+    for name in frame.columns:
+        series = frame[name]
+        if series.dtype == object:
+            converted = _as_numeric(series)
+            if converted is None:
+                converted = _as_datetime(series)
+            if converted is not None:
+                frame[name] = series = converted
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            roles["temporal"].append(name)
+        elif pd.api.types.is_bool_dtype(series):
+            roles["categorical"].append(name)
+        elif _is_identifier(name, series):
+            roles["identifier"].append(name)
+        elif pd.api.types.is_numeric_dtype(series):
+            roles["numeric"].append(name)
+        elif series.nunique(dropna=True) <= MAX_CATEGORY_VALUES:
+            roles["categorical"].append(name)
+        else:
+            roles["label"].append(name)
+    return frame, roles
+
+
+def plan_chart(roles, chart_type: str):
+    """
+    Picks the columns for a chart from the column roles.
+
+    Returns {"chart_type", "x", "y"} where y is a list of numeric columns (empty for
+    bar and pie charts that count rows per x value), or None when the result has no
+    columns that fit the chart type.
+    """
+    temporal, numeric = roles["temporal"], roles["numeric"]
+    # Keys only label the x axis when there is no descriptive column
+    groups = roles["categorical"] + roles["label"] + roles["identifier"]
+
+    if chart_type in ("bar", "pie"):
+        candidates = groups + temporal
+        if candidates:
+            x = candidates[0]
+            y = numeric
+        elif len(numeric) >= 2:
+            # e.g. (year, total): the first number labels the bars
+            x, y = numeric[0], numeric[1:]
+        else:
+            return None
+        return {"chart_type": chart_type, "x": x, "y": y[:1] if chart_type == "pie" else y[:MAX_SERIES]}
+
+    if chart_type == "line":
+        if temporal and numeric:
+            x, y = temporal[0], numeric
+        elif groups and numeric:
+            x, y = groups[0], numeric
+        elif len(numeric) >= 2:
+            x, y = numeric[0], numeric[1:]
+        else:
+            return None
+        return {"chart_type": chart_type, "x": x, "y": y[:MAX_SERIES]}
+
+    if chart_type == "scatter":
+        if len(numeric) >= 2:
+            return {"chart_type": chart_type, "x": numeric[0], "y": [numeric[1]]}
+        if temporal and numeric:
+            return {"chart_type": chart_type, "x": temporal[0], "y": [numeric[0]]}
+        return None
+
+    return None
+
+
+def _role_of(roles, column):
+    return next((role for role, columns in roles.items() if column in columns), None)
+
+
+def describe_columns(frame, roles):
+    """
+    Compact summary of a prepared frame for a chart-spec prompt: each column's
+    dtype, role, distinct count and range or most common values. Its size depends
+    on the number of columns, not rows.
+    """
+    columns = []
+    for name in frame.columns:
+        series = frame[name]
+        role = _role_of(roles, name)
+        summary = {"name": str(name), "dtype": str(series.dtype), "role": role,
+                   "distinct": int(series.nunique(dropna=True)), "nulls": int(series.isna().sum())}
+        if role == "numeric" and series.notna().any():
+            summary.update(min=float(series.min()), max=float(series.max()), mean=round(float(series.mean()), 4))
+        elif role == "temporal" and series.notna().any():
+            summary.update(min=series.min().isoformat(), max=series.max().isoformat())
+        else:
+            summary["top_values"] = [str(value)[:40] for value in series.value_counts().index[:3]]
+        columns.append(summary)
+    return {"row_count": len(frame), "columns": columns}
+
+
+def plan_from_spec(spec, roles, chart_type: str):
+    """
+    Validates a chart spec ({"x", "y", "aggregation", "sort", "limit"}) against the
+    prepared columns and returns it as a plan for the requested chart type, or None
+    if it names unknown columns or options.
+    """
+    if not isinstance(spec, dict):
+        return None
+    columns = {column for names in roles.values() for column in names}
+    x = spec.get("x")
+    y = spec.get("y") or []
+    y = [y] if isinstance(y, str) else y
+    aggregation = spec.get("aggregation") or None
+    sort = spec.get("sort") or None
+    limit = spec.get("limit")
+    if x not in columns or not isinstance(y, list) or any(column not in roles["numeric"] for column in y):
+        return None
+    if aggregation not in (None, *AGGREGATIONS) or sort not in (None, *SORTS):
+        return None
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        return None
+    if not y and (chart_type in ("line", "scatter") or aggregation not in (None, "count")):
+        return None
+    if chart_type == "scatter" and aggregation not in (None, "none"):
+        return None
+    return {
+        "chart_type": chart_type, "x": x, "y": y[:1] if chart_type in ("pie", "scatter") else y[:MAX_SERIES],
+        "aggregation": aggregation, "sort": sort, "limit": limit
+    }
+
+
+def _aggregate(frame, x, y, aggregation):
+    """One row per x value: each y column aggregated, or the row count when y is empty"""
+    grouped = frame.groupby(x, sort=False, dropna=False)
+    if aggregation == "count" or not y:
+        return grouped.size().rename("count").reset_index(), ["count"]
+    if aggregation == "sum":
+        return grouped[y].sum(min_count=1).reset_index(), y
+    return grouped[y].agg(aggregation).reset_index(), y
+
+
+def _is_ordered(series):
+    return pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.is_numeric_dtype(series)
+
+
+def _default_aggregation(frame, plan):
+    if plan["chart_type"] in ("bar", "pie"):
+        return "sum" if plan["y"] else "count"
+    if plan["chart_type"] == "line" and frame[plan["x"]].duplicated().any():
+        return "sum"
+    return "none"
+
+
+def _default_sort(data, plan):
+    if plan["chart_type"] == "pie":
+        return "y_desc"
+    if plan["chart_type"] in ("bar", "line") and _is_ordered(data[plan["x"]]):
+        return "x"
+    return "none"
+
+
+def shape_data(frame, plan):
+    """
+    Applies a plan's aggregation, limit and sort (or the chart type's defaults for
+    those the plan leaves out) to the columns it uses, then downsamples line and
+    scatter charts to MAX_POINTS.
+
+    Returns (data, y, total_groups) where y names the plotted value columns
+    ("count" for row counts) and total_groups is the number of x values before
+    the limit was applied, or None when no limit was needed.
+    """
+    x, y = plan["x"], list(plan["y"])
+    data = frame[[x] + [column for column in y if column != x]]
+    if plan["chart_type"] != "scatter":
+        data = data.dropna(subset=[x])
+    aggregation = plan.get("aggregation") or _default_aggregation(data, plan)
+    if aggregation != "none":
+        data, y = _aggregate(data, x, y, aggregation)
+
+    total_groups = None
+    limit = plan.get("limit") or (MAX_BAR_CATEGORIES if plan["chart_type"] == "bar" else None)
+    if limit and len(data) > limit:
+        # Keep the largest values; the pie folds its tail into "Other" when drawn instead
+        total_groups = len(data)
+        if plan["chart_type"] != "pie":
+            data = data.nlargest(limit, y[0])
+
+    sort = plan.get("sort") or _default_sort(data, plan)
+    if sort == "x":
+        data = data.sort_values(x)
+    elif sort in ("y_asc", "y_desc"):
+        data = data.sort_values(y[0], ascending=sort == "y_asc")
+
+    if plan["chart_type"] == "line":
+        data = downsample_line(data, x, y, MAX_POINTS)
+    elif plan["chart_type"] == "scatter":
+        data = thin_scatter(data, x, y[0], MAX_POINTS)
+    return data, y, total_groups
+
+
+def _label_axes(ax, x, y):
+    ax.set_xlabel(str(x))
+    ax.set_ylabel(", ".join(str(column) for column in y))
+    ax.grid(True, alpha=0.3)
+    if len(y) > 1:
+        ax.legend()
+
+
+def _draw_bar(ax, data, x, y, plan):
+    labels = data[x].astype(str).tolist()
+    positions = np.arange(len(labels))
+    width = 0.8 / len(y)
+    for i, column in enumerate(y):
+        ax.bar(positions + (i - (len(y) - 1) / 2) * width, data[column].fillna(0), width, label=str(column))
+    ax.set_xticks(positions)
+    ax.set_xticklabels(labels, rotation=45 if len(labels) > 8 or max(map(len, labels), default=0) > 12 else 0,
+                       ha="right" if len(labels) > 8 else "center")
+    _label_axes(ax, x, y)
+
+
+def _draw_line(ax, data, x, y, plan):
+    x_values = data[x] if _is_ordered(data[x]) else data[x].astype(str)
+    marker = 'o' if len(data) <= 100 else None
+    for column in y:
+        ax.plot(x_values, data[column], marker=marker, linewidth=2, label=str(column))
+    if not _is_ordered(data[x]) and len(data) > 8:
+        ax.tick_params(axis='x', labelrotation=45)
+    _label_axes(ax, x, y)
+
+
+def _draw_pie(ax, data, x, y, plan):
+    values = data.set_index(data[x].astype(str))[y[0]].fillna(0)
+    values = values[values > 0]
+    slices = plan.get("limit") or MAX_PIE_SLICES
+    if len(values) > slices:
+        # Fold the smallest slices into one so the labels stay readable
+        values = values.sort_values(ascending=False)
+        values = pd.concat([values.iloc[:slices - 1], pd.Series({"Other": values.iloc[slices - 1:].sum()})])
+    ax.pie(values, labels=values.index, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+
+
+def _draw_scatter(ax, data, x, y, plan):
+    data = data.dropna(subset=[x, y[0]])
+    # Smaller, fainter points once they start to overlap
+    size, alpha = (80, 0.7) if len(data) <= 1000 else (10, 0.4)
+    ax.scatter(data[x], data[y[0]], s=size, alpha=alpha)
+    _label_axes(ax, x, y[:1])
+
+
+_DRAW = {"bar": _draw_bar, "line": _draw_line, "pie": _draw_pie, "scatter": _draw_scatter}
+
+
+def render_chart(frame, plan, chart_name: str | None = None) -> str:
+    """
+    Draws a planned chart and returns it as base64 PNG. Uses the object-oriented
+    Figure API rather than pyplot, so renders share no global state and can run
+    in parallel on the render pool.
+    """
+    data, y, total_groups = shape_data(frame, plan)
+    fig = Figure(figsize=FIGURE_SIZE)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    _DRAW[plan["chart_type"]](ax, data, plan["x"], y, plan)
+    if total_groups is not None and plan["chart_type"] != "pie":
+        ax.set_title(f"Top {len(data)} of {total_groups}", fontsize=10, loc="right")
+    fig.suptitle(chart_name or f"{', '.join(str(column) for column in y)} by {plan['x']}", fontsize=16)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+
+def render_spec_png_base64(frame, roles, spec, chart_type: str, chart_name: str | None = None) -> str | None:
+    """Renders a chart spec chosen by the model for a prepared frame; None if the spec is invalid"""
+    try:
+        plan = plan_from_spec(spec, roles, chart_type)
+        if plan is None:
+            print(f"[GRAPH] Ignoring invalid chart spec: {spec}")
+            return None
+        print(f"[GRAPH] Rendering {chart_type} chart from spec: {plan}")
+        return render_chart(frame, plan, chart_name)
+    except Exception as e:
+        print(f"[GRAPH] Spec rendering failed: {e}")
+        return None
+
+
+def render_chart_png_base64(df: pd.DataFrame, chart_type: str, chart_name: str | None = None) -> str | None:
+    """Plans and renders a chart with the built-in templates; None if no template fits the data"""
+    chart_type = (chart_type or "").lower()
+    if df.empty or chart_type not in CHART_TYPES:
+        return None
+    try:
+        frame, roles = prepare_frame(df)
+        plan = plan_chart(roles, chart_type)
+        if plan is None:
+            print(f"[GRAPH] No {chart_type} chart template fits columns {roles}")
+            return None
+        print(f"[GRAPH] Rendering {chart_type} chart: x={plan['x']}, y={plan['y']}")
+        return render_chart(frame, plan, chart_name)
+    except Exception as e:
+        print(f"[GRAPH] Template rendering failed: {e}")
+        return None
@@ -0,0 +1,36 @@
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking SQLAlchemy work (queries, schema introspection) runs on this bounded pool
+DB_THREAD_POOL_SIZE = int(os.getenv("DB_THREAD_POOL_SIZE", "16"))
+# CPU-bound work (pandas, CSV encoding) runs on its own pool so it can't starve DB calls
+RENDER_THREAD_POOL_SIZE = int(os.getenv("RENDER_THREAD_POOL_SIZE", "4"))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREAD_POOL_SIZE, thread_name_prefix="db")
+render_executor = ThreadPoolExecutor(max_workers=RENDER_THREAD_POOL_SIZE, thread_name_prefix="render")
+
+
+async def _run_in_executor(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the request's connection) into the worker thread
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(executor, call)
+
+
+async def run_in_db_pool(fn, *args, **kwargs):
+    """Runs a blocking database call without blocking the event loop"""
+    return await _run_in_executor(db_executor, fn, *args, **kwargs)
+
+
+async def run_in_render_pool(fn, *args, **kwargs):
+    """Runs CPU-bound work (dataframes, plotting) without blocking the event loop"""
+    return await _run_in_executor(render_executor, fn, *args, **kwargs)
+
+
+def shutdown_executors():
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    render_executor.shutdown(wait=False, cancel_futures=True)
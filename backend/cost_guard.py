@@ -0,0 +1,168 @@
+import os
+import json
+import sqlparse
+from sqlalchemy import text
+from .sql_rewrite import has_top_level_limit, inject_limit
+
+# What to do with a query whose estimated cost is over budget:
+#   off    - don't run EXPLAIN at all
+#   warn   - run it anyway and report the estimate
+#   limit  - cap its rows with a LIMIT when the plan can stop early, otherwise reject it
+#   reject - refuse to run it
+COST_GUARD_MODE = os.getenv("COST_GUARD_MODE", "warn").lower()
+# Budget on the rows MySQL expects to examine (all tables, all join loops)
+COST_GUARD_MAX_ROWS_EXAMINED = int(os.getenv("COST_GUARD_MAX_ROWS_EXAMINED", "10000000"))
+# Full scans of tables at least this large are reported even within budget
+COST_GUARD_FULL_SCAN_ROWS = int(os.getenv("COST_GUARD_FULL_SCAN_ROWS", "1000000"))
+# Row cap applied in "limit" mode
+COST_GUARD_ROW_LIMIT = int(os.getenv("COST_GUARD_ROW_LIMIT", "1000"))
+
+# Plan steps that need every row before producing the first one, so a LIMIT doesn't reduce the work
+_BLOCKING_KEYS = ('grouping_operation', 'duplicates_removal', 'windowing')
+_BLOCKING_FLAGS = ('using_filesort', 'using_temporary_table')
+
+
+def _number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class _PlanStats:
+    def __init__(self):
+        self.rows_examined = 0.0
+        self.tables = []
+        self.blocking = False
+
+
+def _account_table(table, prefix_rows, stats, schema):
+    """Adds one table access to the stats; returns the rows produced by the join so far"""
+    name = table.get('table_name', '')
+    estimated_rows = schema.get('table_metadata', {}).get(name, {}).get('estimated_rows', 0)
+    per_scan = _number(table.get('rows_examined_per_scan'), estimated_rows)
+    examined = prefix_rows * per_scan
+    stats.rows_examined += examined
+    stats.tables.append({
+        'table': name,
+        'access_type': table.get('access_type'),
+        'key': table.get('key'),
+        'rows_examined': int(examined),
+        'estimated_table_rows': estimated_rows
+    })
+    if any(table.get(flag) for flag in _BLOCKING_FLAGS):
+        stats.blocking = True
+    # Subqueries materialized for this table have their own plans
+    for key, value in table.items():
+        if isinstance(value, (dict, list)):
+            _walk(value, stats, schema)
+    return _number(table.get('rows_produced_per_join'), per_scan)
+
+
+def _walk(node, stats, schema):
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, stats, schema)
+        return
+    if not isinstance(node, dict):
+        return
+    if any(node.get(flag) for flag in _BLOCKING_FLAGS) or any(key in node for key in _BLOCKING_KEYS):
+        stats.blocking = True
+    for key, value in node.items():
+        if key == 'nested_loop':
+            # Each table is scanned once per row produced by the tables joined before it
+            prefix_rows = 1.0
+            for step in value:
+                if 'table' in step:
+                    prefix_rows = _account_table(step['table'], prefix_rows, stats, schema)
+                else:
+                    _walk(step, stats, schema)
+        elif key == 'table':
+            _account_table(value, 1.0, stats, schema)
+        elif isinstance(value, (dict, list)):
+            _walk(value, stats, schema)
+
+
+def _index_hints(table_name, schema):
+    """Indexed column lists of a table, to suggest filters that avoid a full scan"""
+    indexes = schema.get('indexes', {}).get(table_name, {})
+    primary_keys = schema.get('tables', {}).get(table_name, {}).get('primary_keys', [])
+    hints = [primary_keys] if primary_keys else []
+    hints += [index.get('columns', []) for index in indexes.values()]
+    return [', '.join(columns) for columns in hints if columns]
+
+
+def explain_query(connection, sql_query, schema):
+    """
+    Runs EXPLAIN FORMAT=JSON for a SELECT and summarizes the plan: estimated rows
+    examined, optimizer cost, full scans of large tables (with the indexes that
+    could avoid them), and whether the plan could stop early under a LIMIT.
+    """
+    plan = json.loads(connection.execute(text(f"EXPLAIN FORMAT=JSON {sql_query}")).scalar())
+    query_block = plan.get('query_block', {})
+    stats = _PlanStats()
+    _walk(query_block, stats, schema)
+
+    full_scans = [
+        {
+            'table': table['table'],
+            'estimated_table_rows': table['estimated_table_rows'],
+            'indexed_columns': _index_hints(table['table'], schema)
+        }
+        for table in stats.tables
+        if table['access_type'] == 'ALL' and table['estimated_table_rows'] >= COST_GUARD_FULL_SCAN_ROWS
+    ]
+    return {
+        'rows_examined': int(stats.rows_examined),
+        'query_cost': _number(query_block.get('cost_info', {}).get('query_cost')),
+        'tables': stats.tables,
+        'full_scans': full_scans,
+        'can_stop_early': not stats.blocking,
+        'budget_rows_examined': COST_GUARD_MAX_ROWS_EXAMINED
+    }
+
+
+def guard_query(engine, sql_query, schema):
+    """
+    Checks a statement against the cost budget before it is executed.
+
+    Returns (sql_to_run, estimate, error). `estimate` is None when the guard is off or
+    the query can't be explained (not a SELECT, not MySQL); `error` is a message when
+    the query must not run. In "limit" mode `sql_to_run` may carry an added LIMIT.
+    """
+    if COST_GUARD_MODE == "off" or engine is None or engine.dialect.name != "mysql":
+        return sql_query, None, None
+    statements = [s for s in sqlparse.parse(sql_query) if s.token_first(skip_cm=True) is not None]
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        return sql_query, None, None
+
+    try:
+        with engine.connect() as connection:
+            estimate = explain_query(connection, sql_query, schema or {})
+    except Exception as e:
+        # A query EXPLAIN can't handle will fail the same way when executed; let that report it
+        print(f"[COST GUARD] EXPLAIN failed: {e}")
+        return sql_query, None, None
+
+    # EXPLAIN's row estimates ignore LIMIT; a plan that streams rows stops as soon as the limit is reached
+    stops_at_limit = estimate['can_stop_early'] and has_top_level_limit(statements[0])
+    over_budget = estimate['rows_examined'] > COST_GUARD_MAX_ROWS_EXAMINED and not stops_at_limit
+    estimate['over_budget'] = over_budget
+    estimate['action'] = "none"
+    if not over_budget or COST_GUARD_MODE == "warn":
+        return sql_query, estimate, None
+
+    limited_sql = inject_limit(sql_query, COST_GUARD_ROW_LIMIT) if COST_GUARD_MODE == "limit" else None
+    if limited_sql is not None and estimate['can_stop_early']:
+        estimate['action'] = "limited"
+        estimate['limit'] = COST_GUARD_ROW_LIMIT
+        print(f"[COST GUARD] Limiting query to {COST_GUARD_ROW_LIMIT} rows "
+              f"(~{estimate['rows_examined']} rows examined)")
+        return limited_sql, estimate, None
+
+    estimate['action'] = "rejected"
+    scans = ', '.join(scan['table'] for scan in estimate['full_scans'])
+    error = (f"Query rejected: it would examine about {estimate['rows_examined']:,} rows "
+             f"(budget {COST_GUARD_MAX_ROWS_EXAMINED:,})"
+             f"{f'; full scans of {scans}' if scans else ''}. Add filters on indexed columns or a LIMIT.")
+    return sql_query, estimate, error
@@ -1,44 +1,118 @@
 import os
-from sqlalchemy import create_engine, text
+import hmac
+import time
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from sqlalchemy import create_engine, text, bindparam
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
 from urllib.parse import quote_plus
 from dotenv import load_dotenv, find_dotenv
 
 # Load environment variables
 load_dotenv(find_dotenv())
 
-# Global variables for database connection
-engine = None
-MYSQL_HOST = None
-MYSQL_USER = None
-MYSQL_PASSWORD = None
-MYSQL_DATABASE = None
-MYSQL_PORT = None
-DATABASE_URL = None
+# Connection pool sizing for every engine in the registry
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Most engines kept at once; the least recently used beyond this are disposed
+MAX_ENGINES = int(os.getenv("MAX_ENGINES", "16"))
+# Engines not used for this long are disposed (the environment-configured one is kept)
+ENGINE_IDLE_SECONDS = int(os.getenv("ENGINE_IDLE_SECONDS", "3600"))
+
+# Engines by connection id (a keyed fingerprint of the credentials), least recently used first
+_engines = OrderedDict()
+_engine_last_used = {}
+_engines_lock = threading.Lock()
+# Connection id of the engine configured from the environment, used when a request names none
+_default_connection_id = None
+# Connection id for the current request, set from the X-Connection-Id header
+_current_connection_id = contextvars.ContextVar("current_connection_id", default=None)
+# Fingerprints are keyed per process so a connection id can't be used to test password guesses offline
+_FINGERPRINT_KEY = os.urandom(32)
+
+
+def credential_fingerprint(database_url):
+    """Stable id for a set of credentials (including the password) that does not reveal them"""
+    rendered = make_url(database_url).render_as_string(hide_password=False)
+    return hmac.new(_FINGERPRINT_KEY, rendered.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def _create_engine(database_url):
+    return create_engine(
+        database_url,
+        echo=False,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    )
+
+
+def _evict_engines(now):
+    """Picks engines to dispose (idle or beyond MAX_ENGINES); caller holds the lock"""
+    evicted = []
+    for connection_id in list(_engines):
+        if connection_id == _default_connection_id:
+            continue
+        over_limit = len(_engines) > MAX_ENGINES
+        idle = now - _engine_last_used.get(connection_id, now) >= ENGINE_IDLE_SECONDS
+        if over_limit or idle:
+            evicted.append((connection_id, _engines.pop(connection_id)))
+            _engine_last_used.pop(connection_id, None)
+    return evicted
+
+
+def _dispose(evicted):
+    for connection_id, old_engine in evicted:
+        # Idle pooled connections are closed now; checked-out ones when they are returned
+        old_engine.dispose()
+        print(f"[DB] Disposed engine {connection_id[:8]}")
+
+
+def register_engine(database_url):
+    """Returns the connection id for database_url, creating its engine on first use"""
+    connection_id = credential_fingerprint(database_url)
+    now = time.time()
+    with _engines_lock:
+        if connection_id not in _engines:
+            _engines[connection_id] = _create_engine(database_url)
+        _engines.move_to_end(connection_id)
+        _engine_last_used[connection_id] = now
+        evicted = _evict_engines(now)
+    _dispose(evicted)
+    return connection_id
+
+
+def use_connection(connection_id):
+    """Routes database calls in the current context (request) to the given connection's engine"""
+    return _current_connection_id.set(connection_id)
+
+
+def current_connection_id():
+    return _current_connection_id.get() or _default_connection_id
+
+
+def _normalize_url(database_url):
+    # Convert mysql:// to mysql+mysqlconnector:// for SQLAlchemy
+    if database_url.startswith("mysql://"):
+        return database_url.replace("mysql://", "mysql+mysqlconnector://", 1)
+    return database_url
+
 
 def load_from_env():
     """Load database connection from environment variables"""
-    global engine, DATABASE_URL, MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, MYSQL_PORT
-    
-    # Try to get MYSQL_PUBLIC_URL from environment (for Railway - highest priority)
-    mysql_public_url = os.getenv("MYSQL_PUBLIC_URL")
-    if mysql_public_url:
-        # Convert mysql:// to mysql+mysqlconnector:// for SQLAlchemy
-        if mysql_public_url.startswith("mysql://"):
-            mysql_public_url = mysql_public_url.replace("mysql://", "mysql+mysqlconnector://")
-        
-        DATABASE_URL = mysql_public_url
-        engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
-        return True
-    
-    # Try to get MYSQL_URL from environment (for production)
-    mysql_url = os.getenv("MYSQL_URL")
+    global _default_connection_id
+
+    # MYSQL_PUBLIC_URL (Railway) takes priority over MYSQL_URL (production)
+    mysql_url = os.getenv("MYSQL_PUBLIC_URL") or os.getenv("MYSQL_URL")
     if mysql_url:
-        # Convert mysql:// to mysql+mysqlconnector:// for SQLAlchemy
-        if mysql_url.startswith("mysql://"):
-            mysql_url = mysql_url.replace("mysql://", "mysql+mysqlconnector://")
-        
-        DATABASE_URL = mysql_url
-        engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
+        _default_connection_id = register_engine(_normalize_url(mysql_url))
         return True
     
     # Try to get individual environment variables (for local development)
@@ -49,51 +123,96 @@ def load_from_env():
     env_port = os.getenv("MYSQL_PORT", "41854")
     
     if all([env_host, env_user, env_password, env_database]):
-        MYSQL_HOST = env_host
-        MYSQL_USER = env_user
-        MYSQL_PASSWORD = env_password
-        MYSQL_DATABASE = env_database
-        MYSQL_PORT = int(env_port)
-        
-        DATABASE_URL = f"mysql+mysqlconnector://{MYSQL_USER}:{quote_plus(MYSQL_PASSWORD)}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
-        engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
+        _default_connection_id = register_engine(
+            build_database_url(env_host, env_user, env_password, env_database, int(env_port))
+        )
         return True
     
     return False
 
-def set_database_credentials(host, user, password, database, port=41854):
-    """Set database credentials and create engine"""
-    global engine, MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, MYSQL_PORT, DATABASE_URL
-    
-    MYSQL_HOST = host
-    MYSQL_USER = user
-    MYSQL_PASSWORD = password
-    MYSQL_DATABASE = database
-    MYSQL_PORT = port
-    
+
+def build_database_url(host, user, password, database, port):
     # Database URL with URL-encoded password
-    DATABASE_URL = f"mysql+mysqlconnector://{MYSQL_USER}:{quote_plus(MYSQL_PASSWORD)}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
-    
-    # Create the SQLAlchemy engine
-    engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
-    
-    return engine
+    return f"mysql+mysqlconnector://{user}:{quote_plus(password)}@{host}:{port}/{database}"
+
+
+def set_database_credentials(host, user, password, database, port=41854):
+    """
+    Registers an engine for the credentials and routes the current request to it.
+    Returns the connection id the client sends back as X-Connection-Id, or None if
+    the database can't be reached with them. The credentials are checked on a
+    throwaway engine first, so a failed login keeps no engine and can't push other
+    sessions' engines out of the registry.
+    """
+    database_url = build_database_url(host, user, password, database, port)
+    probe = create_engine(database_url, poolclass=NullPool)
+    try:
+        reachable = _can_connect(probe)
+    finally:
+        probe.dispose()
+    if not reachable:
+        return None
+    connection_id = register_engine(database_url)
+    use_connection(connection_id)
+    return connection_id
+
 
 def get_engine():
-    """Get the current database engine"""
+    """Engine for the current request's connection (or the environment-configured one)"""
+    if _default_connection_id is None and _current_connection_id.get() is None:
+        load_from_env()
+    connection_id = current_connection_id()
+    if connection_id is None:
+        return None
+    with _engines_lock:
+        engine = _engines.get(connection_id)
+        if engine is not None:
+            _engine_last_used[connection_id] = time.time()
+            _engines.move_to_end(connection_id)
     return engine
 
+
+def dispose_engines():
+    """Closes every pool; used at shutdown"""
+    with _engines_lock:
+        evicted = list(_engines.items())
+        _engines.clear()
+        _engine_last_used.clear()
+    _dispose(evicted)
+
+
+def engine_stats():
+    with _engines_lock:
+        return {
+            'engines': len(_engines),
+            'max_engines': MAX_ENGINES,
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'checked_out_connections': sum(engine.pool.checkedout() for engine in _engines.values())
+        }
+
+
+def get_connection_key():
+    """Identify the current connection (server, user and database) without the password"""
+    engine = get_engine()
+    if engine is None:
+        return None
+    url = engine.url
+    return (f"{url.username}@{url.host}:{url.port}", url.database)
+
 def is_connected():
     """Check if database is connected"""
-    if engine is None:
-        load_from_env()
-    return engine is not None
+    return get_engine() is not None
 
 def test_connection():
     """Test the database connection"""
+    engine = get_engine()
     if engine is None:
         return False
-    
+    return _can_connect(engine)
+
+
+def _can_connect(engine):
     try:
         with engine.connect() as connection:
             result = connection.execute(text("SELECT DATABASE()"))
@@ -102,14 +221,72 @@ def test_connection():
         return False
 
 
-def get_schema():
-    """Retrieves comprehensive database schema information including relationships"""
+def get_database_name():
+    """Name of the database the current engine points at"""
+    engine = get_engine()
+    if engine is None:
+        return None
+    return engine.url.database
+
+
+def get_table_versions():
+    """
+    Returns {table_name: {'created': ..., 'updated': ...}} for every base table.
+
+    This is a single cheap information_schema.tables scan, used to find which
+    tables changed since the schema was last introspected.
+    """
+    engine = get_engine()
+    if engine is None:
+        return None
+
+    versions_query = """
+    SELECT 
+        table_name,
+        create_time,
+        update_time
+    FROM information_schema.tables
+    WHERE table_schema = :database
+      AND table_type = 'BASE TABLE'
+    """
+
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(text(versions_query), {"database": get_database_name()}).fetchall()
+        return {
+            table_name: {
+                'created': str(created) if created else '',
+                'updated': str(updated) if updated else ''
+            }
+            for table_name, created, updated in rows
+        }
+    except Exception as e:
+        print(f"Error fetching table versions: {e}")
+        return None
+
+
+def get_schema(tables=None):
+    """
+    Retrieves comprehensive database schema information including relationships
+
+    Args:
+        tables: Optional list of table names to restrict introspection to.
+                None introspects the whole database.
+    """
+    engine = get_engine()
     if engine is None:
         return {}
+    if tables is not None and not tables:
+        return {'tables': {}, 'relationships': [], 'table_metadata': {}, 'indexes': {}}
     
     try:
+        # Optional per-query filters for partial (incremental) introspection
+        column_filter = "AND c.table_name IN :tables" if tables is not None else ""
+        fk_filter = "AND kcu.table_name IN :tables" if tables is not None else ""
+        table_filter = "AND table_name IN :tables" if tables is not None else ""
+
         # Query 1: Get table and column information
-        columns_query = """
+        columns_query = f"""
         SELECT 
             c.table_name,
             c.column_name,
@@ -122,11 +299,12 @@ def get_schema():
             c.column_comment
         FROM information_schema.columns c
         WHERE c.table_schema = :database
+          {column_filter}
         ORDER BY c.table_name, c.ordinal_position
         """
         
         # Query 2: Get foreign key relationships
-        fk_query = """
+        fk_query = f"""
         SELECT 
             kcu.table_name,
             kcu.column_name,
@@ -136,11 +314,12 @@ def get_schema():
         FROM information_schema.key_column_usage kcu
         WHERE kcu.table_schema = :database
           AND kcu.referenced_table_name IS NOT NULL
+          {fk_filter}
         ORDER BY kcu.table_name, kcu.column_name
         """
         
         # Query 3: Get table comments/descriptions
-        table_query = """
+        table_query = f"""
         SELECT 
             table_name,
             table_comment,
@@ -149,11 +328,12 @@ def get_schema():
         FROM information_schema.tables
         WHERE table_schema = :database
           AND table_type = 'BASE TABLE'
+          {table_filter}
         ORDER BY table_name
         """
         
         # Query 4: Get indexes
-        index_query = """
+        index_query = f"""
         SELECT 
             table_name,
             index_name,
@@ -163,15 +343,26 @@ def get_schema():
         FROM information_schema.statistics
         WHERE table_schema = :database
           AND index_name != 'PRIMARY'
+          {table_filter}
         ORDER BY table_name, index_name, seq_in_index
         """
 
+        params = {"database": get_database_name()}
+        if tables is not None:
+            params["tables"] = list(tables)
+
+        def _query(sql):
+            statement = text(sql)
+            if tables is not None:
+                statement = statement.bindparams(bindparam("tables", expanding=True))
+            return statement
+
         with engine.connect() as connection:
             # Fetch all data
-            columns_result = connection.execute(text(columns_query), {"database": MYSQL_DATABASE}).fetchall()
-            fk_result = connection.execute(text(fk_query), {"database": MYSQL_DATABASE}).fetchall()
-            table_result = connection.execute(text(table_query), {"database": MYSQL_DATABASE}).fetchall()
-            index_result = connection.execute(text(index_query), {"database": MYSQL_DATABASE}).fetchall()
+            columns_result = connection.execute(_query(columns_query), params).fetchall()
+            fk_result = connection.execute(_query(fk_query), params).fetchall()
+            table_result = connection.execute(_query(table_query), params).fetchall()
+            index_result = connection.execute(_query(index_query), params).fetchall()
             
             # Build schema dictionary
             schema_dict = {
@@ -246,14 +437,6 @@ def get_schema():
                     }
                 
                 schema_dict['indexes'][table][idx_name]['columns'].append(column)
-            
-            # Print the schema_dict for debugging
-            import json
-            print("\n" + "="*80)
-            print("SCHEMA_DICT OUTPUT:")
-            print("="*80)
-            print(json.dumps(schema_dict, indent=2, default=str))
-            print("="*80 + "\n")
         
         return schema_dict
         
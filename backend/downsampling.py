@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_float(series):
+    """Values of an ordered column as float64 (datetimes as nanoseconds since the epoch)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points (first and last
+    included) that keep the visual shape of a series sorted by x. Each bucket
+    keeps the point forming the largest triangle with the previously kept point
+    and the next bucket's average; the per-bucket work is vectorized.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    # Average of each bucket, then the last point standing in for the bucket after the final one
+    avg_x = np.append(np.add.reduceat(x[:n - 1], starts) / counts, x[n - 1])
+    avg_y = np.append(np.add.reduceat(y[:n - 1], starts) / counts, y[n - 1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Indices of the minimum and maximum of y in each of n_buckets equal-count
+    buckets of a series sorted by x, plus its first and last points. Extremes
+    always survive, so repeated reduction never flattens a peak.
+    """
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0:
+        return np.array([0, n - 1])
+    buckets = valid * n_buckets // n
+    # Sorted by bucket, then value: each bucket's first entry is its minimum and its last the maximum
+    order = valid[np.lexsort((y[valid], buckets))]
+    sorted_buckets = order * n_buckets // n
+    firsts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    lasts = np.r_[firsts[1:] - 1, len(order) - 1]
+    return np.unique(np.concatenate(([0, n - 1], order[firsts], order[lasts])))
+
+
+def downsample_line(data, x, y_columns, max_points, method="auto"):
+    """
+    Reduces a line chart's rows (sorted by x) to about max_points. "lttb" keeps
+    the shape of a single series; "minmax" keeps every series' extremes and is
+    used for several series ("auto") or when reducing in stages.
+    """
+    if len(data) <= max_points:
+        return data
+    if method == "auto":
+        method = "lttb" if len(y_columns) == 1 else "minmax"
+
+    if method == "lttb":
+        data = data.dropna(subset=y_columns)
+        ordered = pd.api.types.is_datetime64_any_dtype(data[x]) or pd.api.types.is_numeric_dtype(data[x])
+        xs = _as_float(data[x]) if ordered else np.arange(len(data), dtype=np.float64)
+        return data.iloc[lttb_indices(xs, _as_float(data[y_columns[0]]), max_points)]
+
+    n_buckets = max(max_points // (2 * len(y_columns)), 1)
+    indices = np.unique(np.concatenate([minmax_indices(_as_float(data[column]), n_buckets) for column in y_columns]))
+    return data.iloc[indices]
+
+
+def thin_scatter(data, x, y, max_points):
+    """
+    Reduces a scatter plot to at most max_points by keeping one point per cell of
+    a grid over the plotted range: the overall shape and the outliers stay
+    visible while dense regions stop being redrawn thousands of times. A second
+    grid over the 1st-99th percentile range keeps a few outliers from squeezing
+    the bulk of the points into a handful of cells.
+    """
+    data = data.dropna(subset=[x, y])
+    if len(data) <= max_points:
+        return data
+    cells = max(int(np.sqrt(max_points / 2)), 1)
+    xs, ys = _as_float(data[x]), _as_float(data[y])
+
+    def cell_of(values, low, high):
+        if high <= low:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.clip(((values - low) / (high - low) * cells).astype(np.int64), 0, cells - 1)
+
+    keep = []
+    for percentiles in ((0, 100), (1, 99)):
+        (x_low, x_high), (y_low, y_high) = np.percentile(xs, percentiles), np.percentile(ys, percentiles)
+        grid = cell_of(xs, x_low, x_high) * cells + cell_of(ys, y_low, y_high)
+        keep.append(np.unique(grid, return_index=True)[1])
+    return data.iloc[np.unique(np.concatenate(keep))]
@@ -2,6 +2,8 @@ import os
 import openai
 import pandas as pd
 from dotenv import load_dotenv, find_dotenv
+from .llm_client import create_chat_completion
+from .concurrency import run_in_render_pool
 
 load_dotenv(find_dotenv())
 openai.api_key = os.getenv("OPEN_AI_API_KEY")
@@ -10,34 +12,48 @@ openai.api_key = os.getenv("OPEN_AI_API_KEY")
 OPENAI_MODEL = os.getenv("OPEN_AI_MODEL")
 
 
-def generate_key_insights(df: pd.DataFrame, chart_type: str = None) -> str | None:
+def summarize_frame(df: pd.DataFrame) -> dict:
+    """
+    What the insights prompt is told about a result: row count, column names, the
+    first 3 rows as CSV and summary statistics of the numeric columns.
+    """
+    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+    return {
+        'row_count': len(df),
+        'columns': df.columns.tolist(),
+        'preview': df.head(3).to_csv(index=False),
+        'summary_stats': df[numeric_cols].describe().to_string() if numeric_cols else ""
+    }
+
+
+async def generate_key_insights(df: pd.DataFrame, chart_type: str = None, summary: dict = None) -> str | None:
     """
     Generate key insights from the data
     
     Args:
         df: pandas DataFrame containing the query results
         chart_type: Optional chart type for context (bar, line, pie, scatter)
+        summary: Optional summarize_frame-style description of the full result, used
+            instead of df's own when df holds only the rows a chart was drawn from
     
     Returns:
         String containing 5-6 bullet-pointed insights, or None if generation fails
     """
     try:
-        if df.empty:
+        if summary is None:
+            if df.empty:
+                return "No data available for analysis."
+            # describe() scans every row, so keep it off the event loop
+            summary = await run_in_render_pool(summarize_frame, df)
+        elif summary['row_count'] == 0:
             return "No data available for analysis."
         
         # Get basic info about the dataset
-        row_count = len(df)
-        col_count = len(df.columns)
-        columns = df.columns.tolist()
-        
-        # Get a preview of the data (first 3 rows)
-        csv_preview = df.head(3).to_csv(index=False)
-        
-        # Get summary statistics for numeric columns
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-        summary_stats = ""
-        if numeric_cols:
-            summary_stats = df[numeric_cols].describe().to_string()
+        row_count = summary['row_count']
+        columns = summary['columns']
+        col_count = len(columns)
+        csv_preview = summary['preview']
+        summary_stats = summary['summary_stats']
         
         # Build context-aware prompt
         chart_context = f"The data will be visualized as a {chart_type} chart." if chart_type else ""
@@ -64,7 +80,7 @@ Format as bullet points starting with •
 Keep each insight concise and specific to this data.
 """
         
-        response = openai.chat.completions.create(
+        response = await create_chat_completion(
             model=OPENAI_MODEL,
             messages=[
                 {
@@ -0,0 +1,40 @@
+import os
+import json
+import hashlib
+import openai
+from dotenv import load_dotenv, find_dotenv
+from .singleflight import SingleFlight
+
+load_dotenv(find_dotenv())
+
+# Identical prompts issued concurrently (e.g. a dashboard loading for several users) share one API call
+_llm_calls = SingleFlight()
+_async_client = None
+
+
+def get_async_client():
+    """Shared AsyncOpenAI client, so LLM calls don't tie up the event loop or a thread"""
+    global _async_client
+    if _async_client is None:
+        _async_client = openai.AsyncOpenAI(api_key=os.getenv("OPEN_AI_API_KEY"))
+    return _async_client
+
+
+def prompt_fingerprint(model, messages, **kwargs):
+    """Stable hash of everything that determines a chat completion request"""
+    payload = json.dumps({"model": model, "messages": messages, "kwargs": kwargs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def create_chat_completion(model, messages, **kwargs):
+    """Awaitable chat completion that coalesces concurrent identical requests"""
+    key = prompt_fingerprint(model, messages, **kwargs)
+    return await _llm_calls.do_async(
+        key,
+        lambda: get_async_client().chat.completions.create(model=model, messages=messages, **kwargs)
+    )
+
+
+def coalesced_call_count():
+    """Number of LLM calls that were served by joining an in-flight identical request"""
+    return _llm_calls.coalesced
@@ -0,0 +1,257 @@
+import os
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from sqlalchemy import text
+from .concurrency import run_in_db_pool
+
+# Longest a query may run for an interactive request (0 disables the limit)
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "60"))
+# Longest a streamed query (NDJSON, Arrow, Parquet and CSV exports) may take to open or to produce its
+# next batch; a stream that keeps producing rows is never cut off, however long the export takes (0 disables)
+STREAM_IDLE_TIMEOUT_SECONDS = float(os.getenv("STREAM_IDLE_TIMEOUT_SECONDS", str(QUERY_TIMEOUT_SECONDS)))
+# How often a running request checks whether its client has gone away
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+# The RunningQuery for the current request; worker threads see it through the copied context
+_running_query = contextvars.ContextVar("running_query", default=None)
+_EXHAUSTED = object()
+
+
+class QueryCancelled(Exception):
+    """Raised in the worker when its query was cancelled before it started"""
+
+
+def server_thread_id(connection):
+    """MySQL thread id of a SQLAlchemy connection, or None for other databases"""
+    if connection.dialect.name != "mysql":
+        return None
+    dbapi_connection = connection.connection.dbapi_connection
+    thread_id = getattr(dbapi_connection, "connection_id", None)
+    if thread_id is None:
+        thread_id = connection.execute(text("SELECT CONNECTION_ID()")).scalar()
+    return thread_id
+
+
+def kill_query(engine, thread_id):
+    """
+    Stops the statement running on a MySQL thread. The KILL goes over a new
+    connection outside the engine's pool, so a pool exhausted by the very
+    queries being killed can't hold it up.
+    """
+    try:
+        cargs, cparams = engine.dialect.create_connect_args(engine.url)
+        side_connection = engine.dialect.connect(*cargs, **cparams)
+        try:
+            cursor = side_connection.cursor()
+            cursor.execute(f"KILL QUERY {int(thread_id)}")
+            cursor.close()
+        finally:
+            side_connection.close()
+        print(f"[QUERY] Killed query on MySQL thread {thread_id}")
+    except Exception as e:
+        print(f"[QUERY] Failed to kill query on MySQL thread {thread_id}: {e}")
+
+
+class RunningQuery:
+    """
+    Lets the event loop cancel a query that a worker thread is executing.
+
+    The worker attaches its connection while the statement runs; cancel() then
+    issues KILL QUERY for that connection's server thread. A cancel that arrives
+    before the worker attaches makes the attach raise QueryCancelled instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._thread_id = None
+        self.cancelled = False
+        self.reason = None
+
+    def attach(self, engine, thread_id):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled(self.reason)
+            self._engine, self._thread_id = engine, thread_id
+
+    def detach(self):
+        with self._lock:
+            self._engine = self._thread_id = None
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            engine, thread_id = self._engine, self._thread_id
+        if engine is not None and thread_id is not None:
+            kill_query(engine, thread_id)
+
+
+def _limit_session(connection, timeout):
+    """Sets MAX_EXECUTION_TIME on the connection's session; returns whether it was set"""
+    if timeout <= 0:
+        return False
+    try:
+        # Only applies to SELECT; anything else is stopped by the KILL QUERY watchdog
+        connection.execute(text(f"SET SESSION MAX_EXECUTION_TIME = {int(timeout * 1000)}"))
+        return True
+    except Exception as e:
+        print(f"[QUERY] MAX_EXECUTION_TIME not supported: {e}")
+        return False
+
+
+def _unlimit_session(connection):
+    try:
+        # Pooled connections are shared with schema introspection, which must not inherit the limit
+        connection.execute(text("SET SESSION MAX_EXECUTION_TIME = 0"))
+    except Exception:
+        connection.invalidate()
+
+
+@contextmanager
+def track_query(connection):
+    """
+    Wraps the execution of a request's query: caps its server-side run time with
+    MAX_EXECUTION_TIME and registers it so the request can KILL it. Does nothing
+    outside run_cancellable() or on non-MySQL databases.
+    """
+    running = _running_query.get()
+    thread_id = server_thread_id(connection) if running is not None else None
+    limited = thread_id is not None and _limit_session(connection, QUERY_TIMEOUT_SECONDS)
+    if running is not None:
+        running.attach(connection.engine, thread_id)
+    try:
+        yield
+    finally:
+        if running is not None:
+            running.detach()
+        if limited:
+            _unlimit_session(connection)
+
+
+def track_stream(connection, thread_id):
+    """
+    track_query() for a query whose rows are read after it returns (stream_query):
+    the query stays registered for KILL while its rows are streamed. No
+    MAX_EXECUTION_TIME is set, since it would cap the whole export; the idle
+    timeout in stream_cancellable() stops a stalled stream instead. Returns
+    release(completed), to be called when the stream ends.
+    """
+    running = _running_query.get()
+    if running is not None:
+        running.attach(connection.engine, thread_id)
+
+    def release(completed):
+        if running is not None:
+            running.detach()
+
+    return release
+
+
+async def _wait_for_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def run_cancellable(request, fn, *args, timeout=None, running=None):
+    """
+    Runs a blocking query function on the DB pool, cancelling its statement if it
+    outlives `timeout` (QUERY_TIMEOUT_SECONDS by default) or the HTTP client
+    disconnects, so the connection and worker thread are released right away.
+
+    Returns (result, status) where status is "ok", "timeout" or "disconnected".
+    """
+    timeout = QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+    running = running or RunningQuery()
+    token = _running_query.set(running)
+    try:
+        # The task copies the context now, so the worker thread sees `running`
+        query_task = asyncio.ensure_future(run_in_db_pool(fn, *args))
+    finally:
+        _running_query.reset(token)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request)) if request is not None else None
+
+    waiting = {query_task} | ({watcher} if watcher else set())
+    try:
+        done, _ = await asyncio.wait(
+            waiting, timeout=timeout if timeout > 0 else None, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+    if query_task in done:
+        return query_task.result(), "ok"
+
+    status = "disconnected" if watcher is not None and watcher in done else "timeout"
+    print(f"[QUERY] Cancelling query ({status})")
+    # KILL runs off the DB pool's queue so a saturated pool can't delay it
+    await asyncio.get_running_loop().run_in_executor(None, running.cancel, status)
+    # Don't wait for the worker: without KILL support (non-MySQL) it may run on regardless
+    query_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return None, status
+
+
+async def stream_cancellable(request, fn, *args, timeout=None):
+    """
+    Opens a streaming query with fn (returning (columns, batches), like stream_query)
+    and keeps it cancellable while its rows are read: the statement is killed if
+    opening it or fetching any one batch takes longer than `timeout`
+    (STREAM_IDLE_TIMEOUT_SECONDS by default), or the HTTP client disconnects. The
+    stream as a whole has no time limit.
+
+    Returns (opened, status): opened is (columns, async iterator of batches), or
+    None if fn failed or status is "timeout" or "disconnected". The iterator raises
+    QueryCancelled when the statement is cancelled mid-stream.
+    """
+    timeout = STREAM_IDLE_TIMEOUT_SECONDS if timeout is None else timeout
+    running = RunningQuery()
+    opened, status = await run_cancellable(request, fn, *args, timeout=timeout, running=running)
+    if opened is None:
+        return None, status
+    columns, batches = opened
+    return (columns, _iterate_cancellable(request, running, batches, timeout)), status
+
+
+async def _iterate_cancellable(request, running, batches, timeout):
+    """
+    Advances a stream's batch generator on the DB pool, racing each fetch against
+    the idle timeout and a disconnect. Time the consumer spends between batches
+    (e.g. a slow client) doesn't count.
+    """
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request)) if request is not None else None
+    completed = False
+    try:
+        while True:
+            fetch = asyncio.ensure_future(run_in_db_pool(next, batches, _EXHAUSTED))
+            waiting = {fetch} | ({watcher} if watcher else set())
+            done, _ = await asyncio.wait(
+                waiting, timeout=timeout if timeout > 0 else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if fetch not in done:
+                status = "disconnected" if watcher is not None and watcher in done else "timeout"
+                print(f"[QUERY] Cancelling streamed query ({status})")
+                await loop.run_in_executor(None, running.cancel, status)
+                # The killed fetch fails, and the generator then releases its connection
+                fetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+                raise QueryCancelled(status)
+            batch = fetch.result()
+            if batch is _EXHAUSTED:
+                completed = True
+                return
+            yield batch
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if not completed:
+            # Stopped early, e.g. the response was cancelled on disconnect. Nothing can be awaited
+            # once the response task is cancelled, so KILL and close the generator in the background
+            loop.run_in_executor(None, running.cancel, "closed")
+            closing = asyncio.ensure_future(run_in_db_pool(batches.close))
+            # ValueError: still fetching on another thread; the KILL ends that fetch and its generator
+            closing.add_done_callback(lambda task: task.cancelled() or task.exception())
@@ -1,8 +1,18 @@
 import os
+import re
+import json
+import base64
+import hashlib
 import openai
 import sqlparse
-import re
-from .database import get_engine, get_schema, format_schema_for_llm
+from .database import get_engine, get_schema
+from .schema_cache import get_cached_schema_entry, on_schema_change
+from .schema_retrieval import build_schema_context
+from .cache_utils import TTLCache
+from .semantic_cache import SemanticCache
+from .llm_client import create_chat_completion
+from .concurrency import run_in_db_pool, run_in_render_pool
+from .query_control import track_query, track_stream, server_thread_id, kill_query
 from dotenv import load_dotenv, find_dotenv
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
@@ -13,14 +23,84 @@ openai.api_key = os.getenv("OPEN_AI_API_KEY")
 # Load OpenAI model from environment (default to gpt-4o if not specified)
 OPENAI_MODEL = os.getenv("OPEN_AI_MODEL")
 
-def generate_sql_query(n1_query: str):
+# Rows fetched per round trip when streaming results from a server-side cursor
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "5000"))
+# Default and maximum page sizes for paginated /execute_sql requests
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "10000"))
+# Rows returned by /execute_sql in preview mode unless the request asks for another size
+PREVIEW_ROWS = int(os.getenv("PREVIEW_ROWS", "200"))
+
+# Cache of generated SQL keyed by (normalized question, schema version, model)
+SQL_CACHE_TTL_SECONDS = int(os.getenv("SQL_CACHE_TTL_SECONDS", "86400"))
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1000"))
+sql_cache = TTLCache(SQL_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS)
+
+# Paraphrase cache: reuses SQL for a rewording of a past question (same content words and literals).
+# Off by default (0 entries); a wrong hit silently answers a different question
+SQL_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SQL_SEMANTIC_CACHE_MAX_ENTRIES", "0"))
+semantic_sql_cache = SemanticCache(SQL_SEMANTIC_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS)
+
+
+@on_schema_change
+def _invalidate_sql_cache(key, old_version, new_version):
+    """SQL generated against an old schema version may reference dropped or renamed columns"""
+    removed = sql_cache.remove_where(lambda cache_key: cache_key[1] == old_version)
+    removed += semantic_sql_cache.invalidate_version(old_version)
+    if removed:
+        print(f"[SQL CACHE] Dropped {removed} entries for schema {old_version}")
+
+
+def normalize_question(n1_query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question"""
+    normalized = re.sub(r"\s+", " ", n1_query.strip().lower())
+    return normalized.rstrip(" ?!.;")
+
+
+async def generate_sql_query_with_cache_status(n1_query: str):
+    """
+    Same as generate_sql_query(), but served from the SQL cache when the same
+    question was already answered for this schema version and model.
+
+    Paraphrases of earlier questions are answered from the semantic cache.
+    Returns (sql_query, cache_status) where cache_status is "hit", "semantic_hit",
+    "miss" or "bypass" (no schema available, so the result isn't cacheable).
+    """
+    schema_entry = await run_in_db_pool(get_cached_schema_entry)
+    if not schema_entry:
+        return await generate_sql_query(n1_query, schema_entry), "bypass"
+
+    normalized = normalize_question(n1_query)
+    cache_key = (normalized, schema_entry['version'], OPENAI_MODEL)
+    cached = sql_cache.get(cache_key)
+    if cached is not None:
+        print(f"[SQL CACHE] Hit for: {normalized[:100]}")
+        return cached, "hit"
+
+    match = semantic_sql_cache.lookup(normalized, schema_entry['version'], OPENAI_MODEL)
+    if match is not None:
+        sql_query, matched_question = match
+        print(f"[SQL CACHE] Semantic hit for: {normalized[:100]} ~ {matched_question[:100]}")
+        sql_cache.set(cache_key, sql_query)
+        return sql_query, "semantic_hit"
+
+    sql_query = await generate_sql_query(n1_query, schema_entry)
+    # Don't cache failures or the model's refusal message
+    if sql_query and not sql_query.startswith("ERROR"):
+        sql_cache.set(cache_key, sql_query)
+        semantic_sql_cache.add(normalized, schema_entry['version'], OPENAI_MODEL, sql_query)
+    return sql_query, "miss"
+
+
+async def generate_sql_query(n1_query: str, schema_entry=None):
     """Converts a natural language query to an SQL query"""
-    schema = get_schema()
-    if not schema:
+    if schema_entry is None:
+        schema_entry = await run_in_db_pool(get_cached_schema_entry)
+    if not schema_entry:
         print("Warning: Empty schema retrieved from database")
     
-    # Use the comprehensive schema formatter for LLM
-    schema_text = format_schema_for_llm(schema)
+    # Only the tables relevant to the question (plus their FK neighbours) go into the prompt
+    schema_text = await run_in_render_pool(build_schema_context, schema_entry, n1_query)
     prompt = f"""
     Given the following MySQL DDL, read and understand the schema carefully before generating the SQL query:
 
@@ -59,8 +139,8 @@ Return the SQL query only, with no additional explanations or comments or any sp
     Please provide only the SQL query without any explanations or additional text.
     """
 
-    def _call_model(model_name: str):
-        return openai.chat.completions.create(
+    async def _call_model(model_name: str):
+        return await create_chat_completion(
             model=model_name,
             messages=[
                 {"role": "system", "content": "You are a SQL query generator expert."},
@@ -76,7 +156,7 @@ Return the SQL query only, with no additional explanations or comments or any sp
         
         for model_name in try_order:
             try:
-                response = _call_model(model_name)
+                response = await _call_model(model_name)
                 raw_sql_query = response.choices[0].message.content.strip()
                 print(f"[DEBUG] Model {model_name} returned: {raw_sql_query[:200]}")
                 # clean_query = clean_sql_output(raw_sql_query)
@@ -121,8 +201,9 @@ def execute_query(sql_query: str):
         return None
     
     try:
-        with engine.connect() as connection:
+        with engine.connect() as connection, track_query(connection):
             result = connection.execute(text(sql_query))
+            columns = list(result.keys()) if result.returns_rows else []
             try:
                 fetched_results = result.fetchall()
                 print(f"[DEBUG] Fetched {len(fetched_results)} rows")
@@ -130,12 +211,162 @@ def execute_query(sql_query: str):
                 print("[DEBUG] fetchall() not supported, returning empty list")
                 fetched_results = []
 
-        return {"result": fetched_results}
+        return {"result": fetched_results, "columns": columns}
     except SQLAlchemyError as e:
         print(f"[ERROR] SQLAlchemyError: {e}")
         return None
 
 
+def _open_unbuffered_cursor(connection):
+    """
+    Returns a DBAPI cursor that leaves rows on the server until fetched, or None
+    if the driver has no such option. SQLAlchemy's stream_results is a no-op on
+    mysql-connector (the dialect forces buffered cursors), so ask the driver directly.
+    """
+    try:
+        return connection.connection.dbapi_connection.cursor(buffered=False)
+    except TypeError:
+        return None
+
+
+def stream_query(sql_query: str, batch_size: int = None):
+    """
+    Executes the SQL query with a server-side cursor, so rows are never all in memory.
+
+    Returns (columns, batches) where batches is a generator of lists of row tuples
+    (at most batch_size rows each). The connection is held until the generator is
+    exhausted or closed. Returns None if the query can't be executed.
+    """
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    print(f"[DEBUG] Streaming SQL: {sql_query}")
+    engine = get_engine()
+    if engine is None:
+        print("[ERROR] Database engine is None")
+        return None
+
+    is_valid, error_msg = validate_sql_query(sql_query)
+    if not is_valid:
+        print(f"[ERROR] SQL validation failed: {error_msg}")
+        return None
+
+    connection = engine.connect()
+    cursor = None
+    thread_id = None
+    release = None
+    try:
+        thread_id = server_thread_id(connection)
+        # Under stream_cancellable() the statement can be killed (on a stall or disconnect) until the stream ends
+        release = track_stream(connection, thread_id)
+        cursor = _open_unbuffered_cursor(connection)
+        if cursor is not None:
+            cursor.execute(sql_query)
+            columns = [column[0] for column in cursor.description] if cursor.description else []
+            fetch_batch = cursor.fetchmany
+        else:
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(text(sql_query))
+            columns = list(result.keys()) if result.returns_rows else []
+            fetch_batch = result.fetchmany
+    except Exception as e:
+        print(f"[ERROR] Streaming execution failed: {e}")
+        if release is not None:
+            release(False)
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        connection.invalidate()
+        connection.close()
+        return None
+
+    def batches():
+        completed = False
+        try:
+            if columns:
+                while True:
+                    rows = fetch_batch(batch_size)
+                    if not rows:
+                        break
+                    yield [tuple(row) for row in rows]
+            completed = True
+        finally:
+            try:
+                if cursor is not None:
+                    cursor.close()
+            except Exception:
+                completed = False
+            release(completed)
+            if not completed:
+                # Closed early (e.g. the client disconnected): stop the statement on the server,
+                # and don't hand a connection with unread rows back to the pool
+                if thread_id is not None:
+                    kill_query(engine, thread_id)
+                connection.invalidate()
+            connection.close()
+
+    return columns, batches()
+
+
+def encode_page_token(sql_query: str, offset: int, result_id: str | None = None) -> str:
+    """Opaque token for the next page of a query's results, naming the stored result the pages are read from"""
+    payload = {"o": offset, "q": _query_fingerprint(sql_query)}
+    if result_id:
+        payload["r"] = result_id
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(sql_query: str, page_token: str):
+    """Returns (row offset, result_id or None) from a page token, or None if it's invalid for this query"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(page_token.encode("ascii")))
+    except Exception:
+        return None
+    if payload.get("q") != _query_fingerprint(sql_query) or not isinstance(payload.get("o"), int):
+        return None
+    result_id = payload.get("r")
+    return max(payload["o"], 0), result_id if isinstance(result_id, str) else None
+
+
+def _query_fingerprint(sql_query: str) -> str:
+    return hashlib.sha256(sql_query.strip().rstrip(";").encode("utf-8")).hexdigest()[:16]
+
+
+def is_select(sql_query: str) -> bool:
+    statements = sqlparse.parse(sql_query)
+    return bool(statements) and statements[0].get_type() == "SELECT"
+
+
+def execute_query_page(sql_query: str, page_size: int, offset: int = 0):
+    """
+    Executes one page of a SELECT query by wrapping it in LIMIT/OFFSET.
+
+    Returns {"result", "columns", "next_offset"} where next_offset is None on the
+    last page, or None if the query can't be executed. Only SELECT statements with
+    unique column names can be paged; MySQL still reads and discards `offset` rows
+    for each page, and since every page runs the query again, pages are only
+    consistent with each other for a query ordered by unique columns. /execute_sql
+    uses this only for results too large for the result store.
+    """
+    if not is_select(sql_query):
+        print("[ERROR] Only SELECT statements can be paginated")
+        return None
+
+    inner_query = sql_query.strip().rstrip(";")
+    # Fetch one extra row to know whether there is a next page
+    paged_query = f"SELECT * FROM ({inner_query}) AS _page LIMIT {int(page_size) + 1} OFFSET {int(offset)}"
+    results = execute_query(paged_query)
+    if results is None:
+        return None
+
+    rows = results["result"]
+    has_more = len(rows) > page_size
+    return {
+        "result": rows[:page_size],
+        "columns": results["columns"],
+        "next_offset": offset + page_size if has_more else None
+    }
+
+
 def validate_sql_query(sql_query):
     """Validates the SQL query syntax before execution."""
     try:
@@ -0,0 +1,156 @@
+import os
+import queue
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from . import render_worker
+
+# Chart rendering runs in worker processes, so renders use every core and a crash or leak can't take the API down
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", str(min(os.cpu_count() or 1, 4))))
+# Wall-clock limit per render; a worker that overruns it is killed and replaced
+RENDER_JOB_TIMEOUT_SECONDS = float(os.getenv("RENDER_JOB_TIMEOUT_SECONDS", "30"))
+# CPU seconds a single render may use inside its worker (0 disables)
+RENDER_JOB_CPU_SECONDS = int(os.getenv("RENDER_JOB_CPU_SECONDS", "20"))
+# Address-space cap for each worker process (0 disables)
+RENDER_WORKER_MEMORY_BYTES = int(os.getenv("RENDER_WORKER_MEMORY_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# spawn, not fork: the API process runs threads, and a forked copy of their locks can deadlock
+_context = multiprocessing.get_context("spawn")
+
+
+class RenderJobFailed(Exception):
+    """A render job timed out, exceeded a resource limit, or lost its worker process"""
+
+
+class _RenderWorker:
+    """One render process and the pipe jobs are sent over; used by one job at a time"""
+
+    def __init__(self):
+        self.conn, child_conn = _context.Pipe()
+        self.process = _context.Process(
+            target=render_worker.serve, args=(child_conn, RENDER_WORKER_MEMORY_BYTES), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def call(self, fn, args, timeout):
+        """Runs fn(*args) in the process; raises TimeoutError or EOFError if the process must be replaced"""
+        self.conn.send((RENDER_JOB_CPU_SECONDS, fn, args))
+        if not self.conn.poll(timeout if timeout > 0 else None):
+            raise TimeoutError
+        ok, value = self.conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class RenderPool:
+    """
+    A fixed set of render processes handed out one job at a time. Each job waits
+    for its reply in a dispatch thread; a job that overruns its time limit or whose
+    process dies gets its own process killed and replaced, while renders running in
+    the other processes carry on.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._dispatch = ThreadPoolExecutor(max_workers=processes, thread_name_prefix="render-dispatch")
+        self.restarts = 0
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.processes):
+            self._idle.put(_RenderWorker())
+
+    def _run(self, fn, args, timeout):
+        self._start()
+        worker = self._idle.get()
+        try:
+            result = worker.call(fn, args, timeout)
+        except TimeoutError:
+            self._replace(worker)
+            raise RenderJobFailed(f"render exceeded the {timeout:g} second limit")
+        except (EOFError, OSError):
+            self._replace(worker)
+            raise RenderJobFailed("render worker process died")
+        except (render_worker.RenderCpuLimitExceeded, MemoryError) as e:
+            self._idle.put(worker)
+            raise RenderJobFailed(str(e) or "render worker ran out of memory")
+        except BaseException:
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        return result
+
+    def _replace(self, worker):
+        worker.kill()
+        with self._lock:
+            self.restarts += 1
+        if not self._closed:
+            self._idle.put(_RenderWorker())
+        print("[RENDER] Render worker process restarted")
+
+    async def run(self, fn, *args, timeout):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._dispatch, self._run, fn, args, timeout)
+
+    def shutdown(self):
+        self._closed = True
+        self._dispatch.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+render_pool = RenderPool(RENDER_PROCESSES)
+
+
+async def prewarm_render_pool():
+    """Starts every worker (importing matplotlib and building its caches) before the first chart is requested"""
+    try:
+        # One warm-up job per dispatch thread, each holding a worker until the process answers
+        await asyncio.gather(*(
+            render_pool.run(render_worker.warm_up, timeout=0) for _ in range(RENDER_PROCESSES)
+        ))
+        print(f"[RENDER] {RENDER_PROCESSES} render worker(s) ready")
+    except Exception as e:
+        print(f"[RENDER] Failed to start render workers: {e}")
+
+
+async def run_in_render_process(fn, *args, timeout=None):
+    """
+    Runs a picklable, module-level function in a render worker under the job's CPU
+    and wall-clock limits, returning its result. Raises RenderJobFailed when the
+    job times out, hits a limit, or its worker dies; only that job's worker is
+    replaced.
+    """
+    timeout = RENDER_JOB_TIMEOUT_SECONDS if timeout is None else timeout
+    return await render_pool.run(fn, *args, timeout=timeout)
+
+
+def render_pool_stats():
+    return {
+        'processes': RENDER_PROCESSES,
+        'job_timeout_seconds': RENDER_JOB_TIMEOUT_SECONDS,
+        'job_cpu_seconds': RENDER_JOB_CPU_SECONDS,
+        'restarts': render_pool.restarts
+    }
+
+
+def shutdown_render_pool():
+    render_pool.shutdown()
@@ -0,0 +1,86 @@
+"""
+Code that runs inside the chart rendering processes (see render_pool). Kept free
+of the web app's imports so a worker starts with little more than pandas and
+matplotlib loaded.
+"""
+import io
+import gc
+import signal
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; workers then run without CPU and memory limits
+    resource = None
+
+class RenderCpuLimitExceeded(Exception):
+    """Raised in a worker whose job used up its CPU time allowance"""
+
+
+def _cpu_limit_exceeded(signum, frame):
+    raise RenderCpuLimitExceeded("render job exceeded its CPU time limit")
+
+
+def init_worker(memory_limit_bytes):
+    """Process initializer: caps the worker's address space and warms up matplotlib"""
+    if resource is not None:
+        if memory_limit_bytes > 0:
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, hard))
+        signal.signal(signal.SIGXCPU, _cpu_limit_exceeded)
+    # Build the font cache and the Agg canvas once, not on the first chart
+    fig = plt.figure()
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close('all')
+
+
+def warm_up():
+    """No-op job, sent once per worker at startup so every process is ready before the first chart"""
+    return True
+
+
+def serve(conn, memory_limit_bytes):
+    """
+    Worker process main loop: receives (cpu_seconds, fn, args) jobs over `conn` and
+    answers each with (True, result) or (False, exception), until the pipe closes.
+    """
+    init_worker(memory_limit_bytes)
+    while True:
+        try:
+            cpu_seconds, fn, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (True, run_job(cpu_seconds, fn, *args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # e.g. an exception or result that can't be pickled
+            conn.send((False, RuntimeError(f"render job result could not be returned: {e}")))
+
+
+def run_job(cpu_seconds, fn, *args):
+    """
+    Runs one job under a CPU time limit: the soft RLIMIT_CPU is set to the CPU time
+    used so far plus `cpu_seconds`, and SIGXCPU turns into RenderCpuLimitExceeded.
+    A job stuck inside one long C call never sees the signal; the pool's wall-clock
+    timeout covers that case. Figures are always closed afterwards so nothing
+    accumulates across jobs.
+    """
+    limited = resource is not None and cpu_seconds > 0
+    if limited:
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+    try:
+        return fn(*args)
+    finally:
+        if limited:
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        plt.close('all')
+        gc.collect()
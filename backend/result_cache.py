@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import threading
+import sqlparse
+from sqlparse import sql as sql_tokens
+from sqlparse import tokens as T
+from .cache_utils import TTLCache
+from .database import get_table_versions
+
+# How long an executed SELECT result may be served from the cache
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "60"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "500"))
+# information_schema UPDATE_TIMEs are re-read at most this often per connection; hits in between never touch MySQL
+RESULT_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("RESULT_CACHE_VERSION_CHECK_SECONDS", "2"))
+
+# Queries whose result can change without any table changing
+NON_DETERMINISTIC = re.compile(
+    r"\b(NOW|SYSDATE|CURDATE|CURTIME|UNIX_TIMESTAMP|UTC_DATE|UTC_TIME|UTC_TIMESTAMP|RAND|UUID|UUID_SHORT|"
+    r"CONNECTION_ID|LAST_INSERT_ID|FOUND_ROWS|ROW_COUNT|SLEEP|GET_LOCK|USER|CURRENT_USER)\s*\(|"
+    r"\bCURRENT_(DATE|TIME|TIMESTAMP|USER)\b|\bLOCALTIME(STAMP)?\b|\bFOR\s+UPDATE\b|\bLOCK\s+IN\s+SHARE\s+MODE\b|"
+    r"\bINTO\s+(OUTFILE|DUMPFILE)\b|@",
+    re.IGNORECASE
+)
+
+_TABLE_KEYWORDS = {'FROM', 'JOIN', 'STRAIGHT_JOIN'}
+
+
+def normalize_sql(sql_query):
+    """Comment-, whitespace- and keyword-case-insensitive form of a statement; literals are left untouched"""
+    formatted = sqlparse.format(sql_query, strip_comments=True, keyword_case='upper')
+    parts = []
+    for statement in sqlparse.parse(formatted):
+        for token in statement.flatten():
+            if not token.is_whitespace:
+                parts.append(token.value)
+            elif parts and parts[-1] != " ":
+                parts.append(" ")
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _is_table_keyword(token):
+    return token.ttype in T.Keyword and (token.normalized in _TABLE_KEYWORDS or token.normalized.endswith(' JOIN'))
+
+
+def _collect_tables(token_list, tables, ctes):
+    expect_table = False
+    for token in token_list.tokens:
+        if token.is_whitespace or token.ttype in T.Comment:
+            continue
+        if token.ttype in T.Keyword.CTE:
+            # Names defined by WITH are not tables
+            for cte in token_list.tokens[token_list.token_index(token) + 1:]:
+                if isinstance(cte, sql_tokens.Identifier):
+                    ctes.add(cte.get_real_name())
+                elif isinstance(cte, sql_tokens.IdentifierList):
+                    ctes.update(i.get_real_name() for i in cte.get_identifiers() if isinstance(i, sql_tokens.Identifier))
+                elif not cte.is_whitespace:
+                    break
+        if _is_table_keyword(token):
+            expect_table = True
+            continue
+        if expect_table:
+            identifiers = token.get_identifiers() if isinstance(token, sql_tokens.IdentifierList) else [token]
+            for identifier in identifiers:
+                if isinstance(identifier, sql_tokens.Identifier) and not isinstance(identifier.token_first(), sql_tokens.Parenthesis):
+                    tables.add((identifier.get_parent_name(), identifier.get_real_name()))
+            expect_table = False
+        if token.is_group:
+            _collect_tables(token, tables, ctes)
+
+
+def extract_tables(sql_query):
+    """
+    Returns the set of (schema or None, table) pairs a statement reads, found after
+    FROM/JOIN at any nesting level (subqueries, CTE bodies). CTE names are excluded.
+    """
+    tables, ctes = set(), set()
+    for statement in sqlparse.parse(sql_query):
+        _collect_tables(statement, tables, ctes)
+    return {(schema, name) for schema, name in tables if not (schema is None and name in ctes)}
+
+
+def is_cacheable(sql_query):
+    """Single read-only SELECT whose result depends only on table contents"""
+    statements = [s for s in sqlparse.parse(sql_query) if s.token_first(skip_cm=True) is not None]
+    if len(statements) != 1 or statements[0].get_type() != 'SELECT':
+        return False
+    return NON_DETERMINISTIC.search(normalize_sql(sql_query)) is None
+
+
+def is_write(sql_query):
+    """Whether any statement in the text is something other than a SELECT (conservatively, a possible write)"""
+    statements = [s for s in sqlparse.parse(sql_query) if s.token_first(skip_cm=True) is not None]
+    return any(statement.get_type() != 'SELECT' for statement in statements)
+
+
+class ResultCache:
+    """
+    Maps (connection, normalized SQL) to a result_id in the result store.
+
+    Each entry records the UPDATE_TIME of the tables the query reads when it was
+    stored. A lookup is only a hit while those are unchanged and the entry is
+    younger than `ttl_seconds`. Tables without an UPDATE_TIME (views, tables in
+    other schemas, some storage engines) are covered by the TTL alone.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, version_check_seconds, load_table_versions):
+        self.version_check_seconds = version_check_seconds
+        self._entries = TTLCache(max_entries, ttl_seconds)
+        self._load_table_versions = load_table_versions
+        self._versions = {}  # connection -> (checked_at, {table: update_time})
+        self._versions_lock = threading.Lock()
+        self.stale = 0
+
+    def _table_versions(self, connection):
+        now = time.time()
+        with self._versions_lock:
+            checked = self._versions.get(connection)
+        if checked is not None and now - checked[0] < self.version_check_seconds:
+            return checked[1]
+        loaded = self._load_table_versions() or {}
+        versions = {table: info.get('updated', '') for table, info in loaded.items()}
+        with self._versions_lock:
+            self._versions[connection] = (now, versions)
+        return versions
+
+    def dependencies(self, sql_query, connection):
+        """
+        {table: update_time} for the tables the query reads in the connection's database.
+        Take this before running the query: a snapshot older than the result can only
+        cause a needless re-run, while a newer one could hide a change.
+        """
+        versions = self._table_versions(connection)
+        database = connection[1] if connection else None
+        return {
+            name: versions.get(name, '')
+            for schema, name in extract_tables(sql_query)
+            if schema is None or schema == database
+        }
+
+    def lookup(self, sql_query, connection):
+        """Returns (result_id, status); status is "hit", "miss", "stale" or "bypass" """
+        if self._entries.max_entries <= 0 or not is_cacheable(sql_query):
+            return None, "bypass"
+        key = (connection, normalize_sql(sql_query))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, "miss"
+        if self.dependencies(sql_query, connection) != entry['tables']:
+            self._entries.pop(key)
+            self.stale += 1
+            return None, "stale"
+        return entry['result_id'], "hit"
+
+    def add(self, sql_query, connection, result_id, tables):
+        """Caches result_id; `tables` is the dependencies() snapshot taken before the query ran"""
+        if not result_id or self._entries.max_entries <= 0 or not is_cacheable(sql_query):
+            return
+        self._entries.set((connection, normalize_sql(sql_query)), {'result_id': result_id, 'tables': tables})
+
+    def discard_connection(self, connection):
+        """
+        Forgets a connection's cached results and its UPDATE_TIME snapshot after a
+        write through it, so the next read neither trusts a snapshot up to
+        version_check_seconds old nor relies on the TTL for tables without an UPDATE_TIME.
+        """
+        self._entries.remove_where(lambda key: key[0] == connection)
+        with self._versions_lock:
+            self._versions.pop(connection, None)
+
+    def clear(self):
+        self._entries.clear()
+        with self._versions_lock:
+            self._versions.clear()
+
+    def stats(self):
+        stats = self._entries.stats()
+        stats['stale'] = self.stale
+        stats['version_check_seconds'] = self.version_check_seconds
+        return stats
+
+
+result_cache = ResultCache(
+    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_VERSION_CHECK_SECONDS, get_table_versions
+)
@@ -0,0 +1,239 @@
+import os
+import time
+import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+import pyarrow as pa
+from .arrow_export import rows_to_table, table_to_rows
+
+# How long a result handle returned by /execute_sql stays usable
+RESULT_STORE_TTL_SECONDS = int(os.getenv("RESULT_STORE_TTL_SECONDS", "900"))
+# Bytes of Arrow result tables kept in memory before the least recently used are spilled to disk
+RESULT_STORE_MEMORY_BYTES = int(os.getenv("RESULT_STORE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+# Bytes of spilled results kept on disk before the least recently used are dropped
+RESULT_STORE_DISK_BYTES = int(os.getenv("RESULT_STORE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+RESULT_STORE_DIR = os.getenv(
+    "RESULT_STORE_DIR", os.path.join(tempfile.gettempdir(), "sql_query_generator", "results")
+)
+
+
+class StoredResult:
+    """
+    A query result held by the store as an Arrow table. Tables read back from disk
+    are memory-mapped: slices are zero-copy views of the file and conversion to
+    pandas reads the column buffers directly, with no re-parsing.
+    """
+
+    def __init__(self, sql, table):
+        self.sql = sql
+        self.table = table
+
+    @property
+    def columns(self):
+        return self.table.column_names
+
+    @property
+    def schema(self):
+        return self.table.schema
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def slice(self, offset=0, length=None):
+        """Zero-copy view of rows [offset, offset + length)"""
+        return self.table.slice(offset, length)
+
+    def rows(self, offset=0, length=None):
+        """Row tuples of Python values for rows [offset, offset + length)"""
+        return table_to_rows(self.slice(offset, length))
+
+    def to_pandas(self):
+        return self.table.to_pandas()
+
+
+class ResultStore:
+    """
+    Keeps executed query results addressable by an opaque handle, so the CSV
+    download, graph and key insights reuse them instead of re-running the SQL.
+
+    Results are kept as columnar Arrow tables. Entries expire after `ttl_seconds`.
+    Once the in-memory tables exceed `memory_bytes`, the least recently used are
+    written to `directory` as uncompressed Arrow IPC files and memory-mapped on
+    read, so their pages are file-backed rather than part of the worker's heap;
+    once spilled files exceed `disk_bytes`, the least recently used are deleted.
+    A handle is only honoured for the database connection that produced it.
+    """
+
+    def __init__(self, ttl_seconds, memory_bytes, disk_bytes, directory):
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        # handle -> {'connection', 'sql', 'table' (None once spilled), 'path', 'size', 'created_at'}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_used = 0
+        self._disk_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+
+    def _path(self, handle):
+        return os.path.join(self.directory, f"result-{handle}.arrow")
+
+    def _drop(self, handle):
+        """Removes an entry; returns the spill file to delete, if any. Caller holds the lock."""
+        entry = self._entries.pop(handle)
+        if entry['table'] is not None:
+            self._memory_used -= entry['size']
+            return None
+        self._disk_used -= entry['size']
+        return entry['path']
+
+    def _expire(self, now):
+        """Drops expired entries; caller holds the lock and deletes the returned files"""
+        expired = [handle for handle, entry in self._entries.items() if now - entry['created_at'] >= self.ttl_seconds]
+        return [path for path in (self._drop(handle) for handle in expired) if path]
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def put(self, connection, sql, columns, rows):
+        """Stores a result (column names and row tuples) and returns its handle, or None if it is too large to keep"""
+        return self.put_table(connection, sql, rows_to_table(columns, rows))
+
+    @property
+    def max_result_bytes(self):
+        """Size of the largest table the store will keep"""
+        return max(self.memory_bytes, self.disk_bytes if self.directory else 0)
+
+    def put_table(self, connection, sql, table):
+        size = table.nbytes
+        if size > self.max_result_bytes:
+            return None
+
+        handle = uuid.uuid4().hex
+        with self._lock:
+            stale_files = self._expire(time.time())
+            self._entries[handle] = {
+                'connection': connection, 'sql': sql, 'table': table, 'path': None, 'size': size, 'created_at': time.time()
+            }
+            self._memory_used += size
+        self._remove_files(stale_files)
+        self._enforce_limits()
+        return handle
+
+    def _enforce_limits(self):
+        """Spills least recently used in-memory entries, then trims the disk tier"""
+        while True:
+            with self._lock:
+                if self._memory_used <= self.memory_bytes:
+                    break
+                victim = next((h for h, e in self._entries.items() if e['table'] is not None), None)
+                if victim is None:
+                    break
+                table = self._entries[victim]['table']
+
+            path = self._spill(victim, table) if self.directory else None
+            with self._lock:
+                entry = self._entries.get(victim)
+                if entry is None or entry['table'] is None:
+                    # Dropped or spilled by another thread in the meantime
+                    if path:
+                        self._remove_files([path])
+                    continue
+                self._memory_used -= entry['size']
+                if path is None:
+                    del self._entries[victim]
+                    self.evictions += 1
+                    continue
+                entry['table'] = None
+                entry['path'] = path
+                entry['size'] = os.path.getsize(path)
+                self._disk_used += entry['size']
+                self.spills += 1
+
+        stale_files = []
+        with self._lock:
+            for handle in list(self._entries):
+                if self._disk_used <= self.disk_bytes:
+                    break
+                if self._entries[handle]['table'] is None:
+                    stale_files.append(self._drop(handle))
+                    self.evictions += 1
+        self._remove_files(stale_files)
+
+    def _spill(self, handle, table):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".arrow")
+            # Uncompressed so readers can memory-map the buffers directly
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            path = self._path(handle)
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            print(f"[RESULT STORE] Failed to spill result {handle}: {e}")
+            return None
+
+    def get(self, handle, connection, sql=None):
+        """
+        Returns the StoredResult for a live handle of this connection, else None.
+        When `sql` is given the handle must also have been produced by that query.
+        """
+        if not handle:
+            return None
+        with self._lock:
+            stale_files = self._expire(time.time())
+            entry = self._entries.get(handle)
+            if entry is None or entry['connection'] != connection or (sql is not None and entry['sql'] != sql):
+                self.misses += 1
+                entry = None
+            else:
+                self._entries.move_to_end(handle)
+                self.hits += 1
+                sql, table, path = entry['sql'], entry['table'], entry['path']
+        self._remove_files(stale_files)
+        if entry is None:
+            return None
+        if table is None:
+            try:
+                table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            except Exception as e:
+                print(f"[RESULT STORE] Failed to read spilled result {handle}: {e}")
+                return None
+        return StoredResult(sql, table)
+
+    def clear(self):
+        with self._lock:
+            stale_files = [path for path in (self._drop(handle) for handle in list(self._entries)) if path]
+        self._remove_files(stale_files)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'spilled_entries': sum(1 for entry in self._entries.values() if entry['table'] is None),
+                'memory_bytes': self._memory_used,
+                'max_memory_bytes': self.memory_bytes,
+                'disk_bytes': self._disk_used,
+                'max_disk_bytes': self.disk_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'spills': self.spills,
+                'evictions': self.evictions
+            }
+
+
+result_store = ResultStore(
+    RESULT_STORE_TTL_SECONDS, RESULT_STORE_MEMORY_BYTES, RESULT_STORE_DISK_BYTES, RESULT_STORE_DIR
+)
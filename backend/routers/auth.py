@@ -1,6 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
 from pydantic import BaseModel
-from ..database import set_database_credentials, test_connection, is_connected
+from ..database import set_database_credentials, is_connected, use_connection, current_connection_id
+from ..schema_cache import invalidate_schema_cache
+from ..concurrency import run_in_db_pool
 
 
 router = APIRouter(prefix="", tags=["auth"])
@@ -14,26 +16,40 @@ class DatabaseCredentials(BaseModel):
     port: int = 3306
 
 
+async def bind_connection(x_connection_id: str | None = Header(default=None)):
+    """
+    App-wide dependency: routes the request's database calls to the engine named by
+    the X-Connection-Id header (returned by /connect_database). Without the header
+    the environment-configured connection is used.
+    """
+    if x_connection_id:
+        use_connection(x_connection_id)
+
+
 @router.post("/connect_database")
 async def connect_database(credentials: DatabaseCredentials):
     try:
-        set_database_credentials(
+        # Registers an engine only once the credentials have connected
+        connection_id = await run_in_db_pool(
+            set_database_credentials,
             credentials.host,
             credentials.user,
             credentials.password,
             credentials.database,
             credentials.port,
         )
-        if test_connection():
-            return {"message": "Successfully connected to database", "status": "success"}
-        else:
+        if connection_id is None:
             return {"error": "Failed to connect to database", "status": "error"}
+        # The connection was chosen in a worker thread, so it is routed here too
+        use_connection(connection_id)
+        # Reconnecting should always pick up the current schema
+        invalidate_schema_cache()
+        return {"message": "Successfully connected to database", "status": "success", "connection_id": connection_id}
     except Exception as e:
         return {"error": f"Connection error: {str(e)}", "status": "error"}
 
 
 @router.get("/database_status")
 async def database_status():
-    return {"connected": is_connected()}
-
-
+    connected = is_connected()
+    return {"connected": connected, "connection_id": current_connection_id() if connected else None}
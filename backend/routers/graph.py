@@ -1,10 +1,22 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 import pandas as pd
-from ..database import is_connected
-from ..query_generator import execute_query
+from ..database import is_connected, get_connection_key, get_engine
+from ..query_generator import execute_query, stream_query
 from ..graph_generator import generate_graph_png_base64
-from ..key_insights import generate_key_insights
+from ..key_insights import generate_key_insights, summarize_frame
+from ..concurrency import run_in_render_pool
+from ..query_control import stream_cancellable, QueryCancelled, STREAM_IDLE_TIMEOUT_SECONDS
+from ..result_store import result_store
+from ..chart_cache import chart_cache, chart_cache_key
+from ..sql_rewrite import inject_limit
+from ..chart_renderer import prepare_frame
+from ..chart_data import (
+    plan_reduction, reduce_frame, aggregate_sql, projection_sql, summary_sql, summarize_result,
+    StreamingReducer, GRAPH_MAX_ROWS
+)
+from .query import run_query, check_query_cost, raise_if_cancelled
 
 
 router = APIRouter(prefix="", tags=["graph"])
@@ -14,43 +26,196 @@ class GraphRequest(BaseModel):
     sql_query: str
     chart_type: str
     chart_name: str | None = None
+    # Handle returned by /execute_sql; reuses that result instead of re-running the query
+    result_id: str | None = None
+
+
+class InsightsRequest(BaseModel):
+    sql_query: str
+    chart_type: str | None = None
+    result_id: str | None = None
+
+
+async def load_dataframe(http_request: Request, sql_query: str, result_id: str | None = None):
+    """
+    DataFrame for a query's results, taken from the result store when result_id is
+    still live for this query and connection, otherwise by executing the query.
+    Returns None if the query fails.
+    """
+    stored = None
+    if result_id:
+        stored = await run_in_render_pool(result_store.get, result_id, get_connection_key(), sql_query)
+    if stored is not None:
+        # Arrow columns convert straight to pandas, without going through Python rows
+        return await run_in_render_pool(stored.to_pandas)
+
+    return await execute_to_dataframe(http_request, sql_query)
+
+
+async def execute_to_dataframe(http_request: Request, sql_query: str):
+    """Runs a query under the cost guard and time limit; None if it fails"""
+    sql_to_run, _ = await check_query_cost(sql_query)
+    exec_result = await run_query(http_request, execute_query, sql_to_run)
+    if exec_result is None:
+        return None
+    columns, rows = exec_result.get("columns", []), exec_result["result"]
+
+    def to_dataframe():
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+
+    return await run_in_render_pool(to_dataframe)
+
+
+async def stream_reduced(http_request: Request, sql_query: str, plan):
+    """
+    Streams a query from a server-side cursor through a StreamingReducer, after the
+    cost guard, under the stream time limit and cancelled if the client
+    disconnects; None if it fails.
+    """
+    sql_to_run, _ = await check_query_cost(sql_query)
+    opened, status = await stream_cancellable(http_request, stream_query, sql_to_run)
+    raise_if_cancelled(status, STREAM_IDLE_TIMEOUT_SECONDS)
+    if opened is None:
+        return None
+    columns, batches = opened
+    reducer = StreamingReducer(plan)
+    try:
+        async for batch in batches:
+            await run_in_render_pool(reducer.add, columns, batch)
+    except QueryCancelled as e:
+        raise_if_cancelled(str(e), STREAM_IDLE_TIMEOUT_SECONDS)
+        raise
+    print(f"[GRAPH] Reduced {reducer.rows_seen} streamed rows")
+    return await run_in_render_pool(reducer.result)
+
+
+async def summarize_full_result(http_request: Request, sql_query: str, sample: pd.DataFrame):
+    """
+    Summary of a result too large to chart directly, for its key insights: the row
+    count and numeric column statistics come from one aggregate query over the
+    whole result, the preview from its first rows. None if that query fails.
+    """
+    _, roles = await run_in_render_pool(prepare_frame, sample)
+    quote = get_engine().dialect.identifier_preparer.quote
+    try:
+        stats = await execute_to_dataframe(http_request, summary_sql(sql_query, roles["numeric"], quote))
+    except HTTPException as e:
+        if e.status_code != 422:
+            raise
+        # Rejected by the cost guard; the insights fall back to the charted rows
+        stats = None
+    if stats is None or stats.empty:
+        return None
+    return await run_in_render_pool(summarize_result, sample, roles["numeric"], stats.iloc[0].tolist())
+
+
+async def reduce_large_result(http_request: Request, sql_query: str, sample: pd.DataFrame, chart_type: str):
+    """
+    Chart rows for a result of more than GRAPH_MAX_ROWS rows: bar and pie charts
+    (and lines with repeated x values) get their GROUP BY and top-N pushed down to
+    MySQL, while other line and scatter charts stream only their plotted columns
+    and are downsampled batch by batch. Falls back to the first rows.
+    """
+    plan, strategy = await run_in_render_pool(plan_reduction, sample, chart_type)
+    quote = get_engine().dialect.identifier_preparer.quote
+    reduced = None
+    try:
+        if strategy == "aggregate" and plan["chart_type"] in ("bar", "pie"):
+            print(f"[GRAPH] Pushing {plan['chart_type']} aggregation by {plan['x']} down to the database")
+            reduced = await execute_to_dataframe(http_request, aggregate_sql(sql_query, plan, quote))
+        elif strategy == "aggregate":
+            print(f"[GRAPH] Pushing line aggregation by {plan['x']} down to the database and downsampling")
+            reduced = await stream_reduced(http_request, aggregate_sql(sql_query, plan, quote), plan)
+        elif strategy == "stream":
+            print(f"[GRAPH] Streaming {plan['chart_type']} columns and downsampling")
+            reduced = await stream_reduced(http_request, projection_sql(sql_query, plan, quote), plan)
+    except HTTPException as e:
+        if e.status_code != 422:
+            raise
+        # Rejected by the cost guard; the chart falls back to the first rows
+        reduced = None
+
+    if reduced is None:
+        print(f"[GRAPH] Charting the first {GRAPH_MAX_ROWS} rows of a larger result")
+        return sample.iloc[:GRAPH_MAX_ROWS]
+    return reduced
+
+
+async def load_chart_dataframe(http_request: Request, sql_query: str, result_id: str | None, chart_type: str):
+    """
+    DataFrame to draw a chart from, with its size bounded however large the result is.
+
+    Returns (df, downsampled, summary); df is None if the query fails. A result of
+    at most GRAPH_MAX_ROWS rows is charted directly. A larger one is aggregated or
+    downsampled (in memory for a stored result, otherwise in the database or while
+    streaming, see reduce_large_result), and summary describes the full result so
+    the key insights aren't drawn from the reduced rows (None if it can't be had).
+    """
+    if result_id:
+        stored = await run_in_render_pool(result_store.get, result_id, get_connection_key(), sql_query)
+        if stored is not None:
+            df = await run_in_render_pool(stored.to_pandas)
+            if len(df) <= GRAPH_MAX_ROWS:
+                return df, False, None
+            summary = await run_in_render_pool(summarize_frame, df)
+            return await run_in_render_pool(reduce_frame, df, chart_type), True, summary
+
+    sample = await execute_to_dataframe(http_request, inject_limit(sql_query, GRAPH_MAX_ROWS + 1) or sql_query)
+    if sample is None or len(sample) <= GRAPH_MAX_ROWS:
+        return sample, False, None
+
+    reduced, summary = await asyncio.gather(
+        reduce_large_result(http_request, sql_query, sample, chart_type),
+        summarize_full_result(http_request, sql_query, sample)
+    )
+    return reduced, True, summary
 
 
 @router.post("/generate_graph")
-async def generate_graph_route(request: GraphRequest):
+async def generate_graph_route(request: GraphRequest, http_request: Request):
     if not is_connected():
         raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
 
-    exec_result = execute_query(request.sql_query)
-    if exec_result is None:
+    df, downsampled, summary = await load_chart_dataframe(http_request, request.sql_query, request.result_id, request.chart_type)
+    if df is None:
         return {"error": "Error executing the SQL query."}
 
-    rows = exec_result["result"]
-    if hasattr(rows, "__iter__") and rows:
-        # Convert row sequence to DataFrame
-        serialized_rows = []
-        for row in rows:
-            if hasattr(row, "_mapping"):
-                serialized_rows.append(dict(row._mapping))
-            else:
-                try:
-                    serialized_rows.append(dict(row))
-                except Exception:
-                    serialized_rows.append({"values": list(row)})
-        df = pd.DataFrame(serialized_rows)
-    else:
-        df = pd.DataFrame()
+    chart_name = request.chart_name or request.chart_type
+    # The same data charted the same way is served without any model call or render
+    cache_key = await run_in_render_pool(chart_cache_key, df, request.chart_type, chart_name, summary)
+    cached = await run_in_render_pool(chart_cache.get, cache_key)
+    if cached is not None:
+        print(f"[CHART CACHE] Hit for {request.chart_type} chart '{chart_name}'")
+        return {**cached, "chart_cache": "hit"}
 
-    img_b64 = generate_graph_png_base64(df, request.chart_type, request.chart_name or request.chart_type)
+    # The graph and the key insights only depend on the data, so run them concurrently
+    img_b64, insights = await asyncio.gather(
+        generate_graph_png_base64(df, request.chart_type, chart_name),
+        generate_key_insights(df, request.chart_type, summary)
+    )
     if not img_b64:
         return {"error": "Failed to generate graph image."}
-    
-    # Generate key insights from the data
-    insights = generate_key_insights(df, request.chart_type)
-    
-    return {
-        "image_base64": img_b64,
-        "insights": insights or "Unable to generate insights at this time."
-    }
 
+    # downsampled: the chart was drawn from aggregated or downsampled rows, not the full result
+    chart = {"image_base64": img_b64, "insights": insights, "downsampled": downsampled}
+    if insights:
+        await run_in_render_pool(chart_cache.set, cache_key, chart)
+    else:
+        # Not cached, so the insights are retried next time
+        chart["insights"] = "Unable to generate insights at this time."
+    return {**chart, "chart_cache": "miss"}
+
+
+@router.post("/key_insights")
+async def key_insights_route(request: InsightsRequest, http_request: Request):
+    if not is_connected():
+        raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
+
+    df = await load_dataframe(http_request, request.sql_query, request.result_id)
+    if df is None:
+        return {"error": "Error executing the SQL query."}
 
+    insights = await generate_key_insights(df, request.chart_type)
+    return {"insights": insights or "Unable to generate insights at this time."}
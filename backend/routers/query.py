@@ -1,9 +1,32 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import Literal
 from pydantic import BaseModel
-from ..database import is_connected
-from ..query_generator import generate_sql_query, execute_query
-import pandas as pd
+from ..database import is_connected, get_connection_key, engine_stats, get_engine
+from ..query_generator import (
+    generate_sql_query_with_cache_status, execute_query, execute_query_page, stream_query, is_select,
+    encode_page_token, decode_page_token, sql_cache, semantic_sql_cache,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_BATCH_SIZE, PREVIEW_ROWS
+)
+from ..result_store import result_store
+from ..result_cache import result_cache, is_write
+from ..serialization import dumps, shape_rows, encode_ndjson_rows, JSON_MEDIA_TYPE
+from ..llm_client import coalesced_call_count
+from ..render_pool import render_pool_stats
+from ..chart_cache import chart_cache
+from ..concurrency import run_in_db_pool, run_in_render_pool
+from ..query_control import (
+    run_cancellable, stream_cancellable, QueryCancelled, QUERY_TIMEOUT_SECONDS, STREAM_IDLE_TIMEOUT_SECONDS
+)
+from ..cost_guard import guard_query
+from ..sql_rewrite import inject_limit
+from ..schema_cache import get_cached_schema_entry
+from ..arrow_export import (
+    ArrowStreamEncoder, ParquetStreamEncoder, infer_schema, rows_to_record_batch,
+    ARROW_STREAM_MEDIA_TYPE, PARQUET_MEDIA_TYPE
+)
+import csv
+import pyarrow as pa
 from io import StringIO
 
 
@@ -12,84 +35,527 @@ router = APIRouter(prefix="", tags=["query"])
 
 class QueryRequest(BaseModel):
     query: str
+    # Stream every row as NDJSON from a server-side cursor instead of one JSON body
+    stream: bool = False
+    # With stream: also store the streamed rows and send their result_id on the final line
+    keep_result: bool = False
+    # Cursor-based pagination: pass page_size, then the returned next_page_token
+    page_size: int | None = None
+    page_token: str | None = None
+    # Handle returned by /execute_sql; downloads reuse that result instead of re-running the query
+    result_id: str | None = None
+    # "compact" sends column names once and each row as an array; "columns" sends one array per column
+    shape: Literal["records", "compact", "columns"] = "records"
+    # Return only the first preview_rows rows (PREVIEW_ROWS by default) and whether there are more;
+    # the full result is then fetched with "stream": true, "keep_result": true
+    preview: bool = False
+    preview_rows: int | None = None
 
 
 @router.post("/generate_sql")
 async def generate_sql(request: QueryRequest):
     if not is_connected():
         raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
-    sql_query = generate_sql_query(request.query)
+    sql_query, cache_status = await generate_sql_query_with_cache_status(request.query)
     if not sql_query:
         return {"error": "Failed to generate SQL query."}
-    return {"sql_query": sql_query}
+    return {"sql_query": sql_query, "cache": cache_status}
+
+
+@router.get("/cache_stats")
+async def cache_stats():
+    return {
+        "sql_cache": sql_cache.stats(),
+        "semantic_sql_cache": semantic_sql_cache.stats(),
+        "result_store": result_store.stats(),
+        "result_cache": result_cache.stats(),
+        "engines": engine_stats(),
+        "render_pool": render_pool_stats(),
+        "chart_cache": chart_cache.stats(),
+        "llm_coalesced_calls": coalesced_call_count()
+    }
+
+
+async def run_query(http_request: Request, fn, sql_query: str, *args):
+    """
+    Runs a query function, fn(sql_query, *args), under the request's time limit. The
+    statement is killed when it times out or the client disconnects, freeing its
+    connection and thread. Once it has run (or failed, or been cancelled), a
+    statement that may have written drops its connection's cached results.
+    """
+    try:
+        result, status = await run_cancellable(http_request, fn, sql_query, *args)
+    finally:
+        discard_results_after_write(sql_query)
+    raise_if_cancelled(status, QUERY_TIMEOUT_SECONDS)
+    return result
+
+
+def discard_results_after_write(sql_query: str):
+    """Drops the connection's cached results after a statement that may have changed the tables they read"""
+    if is_write(sql_query):
+        result_cache.discard_connection(get_connection_key())
+
+
+def cancelled_detail(status, timeout):
+    if status == "disconnected":
+        return "Client disconnected; query cancelled."
+    return f"Query exceeded the {timeout:g} second limit and was cancelled."
+
+
+def raise_if_cancelled(status, timeout):
+    if status == "timeout":
+        raise HTTPException(status_code=504, detail=cancelled_detail(status, timeout))
+    if status == "disconnected":
+        # 499: client closed the request; nobody is waiting for this response
+        raise HTTPException(status_code=499, detail=cancelled_detail(status, timeout))
+
+
+async def open_stream(http_request: Request, sql_query: str):
+    """
+    Opens a query for streaming from a server-side cursor, after the EXPLAIN cost
+    guard (which may reject it or, in "limit" mode, cap its rows). The statement is
+    killed if opening it or fetching any one batch takes longer than
+    STREAM_IDLE_TIMEOUT_SECONDS, or the client disconnects. Returns (columns, async
+    iterator of row batches, cost estimate).
+    """
+    sql_to_run, estimate = await check_query_cost(sql_query)
+    try:
+        opened, status = await stream_cancellable(http_request, stream_query, sql_to_run)
+    finally:
+        discard_results_after_write(sql_to_run)
+    raise_if_cancelled(status, STREAM_IDLE_TIMEOUT_SECONDS)
+    if opened is None:
+        raise HTTPException(status_code=500, detail="Error executing the SQL query.")
+    columns, batches = opened
+    return columns, batches, estimate
+
+
+def is_row_limited(estimate):
+    """Whether the cost guard capped the query's rows, so its output is not the full result"""
+    return estimate is not None and estimate.get('action') == "limited"
+
+
+def cost_guard_headers(estimate, headers=None):
+    """Response headers for a streamed download, flagging one the cost guard truncated"""
+    headers = dict(headers or {})
+    if is_row_limited(estimate):
+        headers["X-Cost-Guard-Row-Limit"] = str(estimate['limit'])
+    return headers
+
+
+async def first_batch(row_batches):
+    """Reads a stream's first batch before the response starts, so a cancelled query still gets an HTTP error"""
+    try:
+        return await anext(row_batches, None)
+    except QueryCancelled as e:
+        raise_if_cancelled(str(e), STREAM_IDLE_TIMEOUT_SECONDS)
+        raise
+
+
+async def check_query_cost(sql_query: str):
+    """
+    Runs the EXPLAIN cost guard. Returns (sql_to_run, estimate); raises 422 when the
+    query is over budget and the guard is configured to reject it.
+    """
+    schema_entry = await run_in_db_pool(get_cached_schema_entry)
+    sql_to_run, estimate, error = await run_in_db_pool(
+        guard_query, get_engine(), sql_query, schema_entry['schema'] if schema_entry else None
+    )
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+    return sql_to_run, estimate
 
 
 @router.post("/execute_sql")
-async def execute_sql(request: QueryRequest):
+async def execute_sql(request: QueryRequest, http_request: Request,
+                      format: str = Query("json", pattern="^(json|arrow)$")):
     if not is_connected():
         raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
     
     print(f"[ROUTER DEBUG] Received query: {request.query[:100]}")
-    results = execute_query(request.query)
+    if format == "arrow":
+        return await stream_encoded(request, http_request, ArrowStreamEncoder, ARROW_STREAM_MEDIA_TYPE)
+    if request.stream:
+        return await stream_ndjson(request, http_request)
+
+    estimate = None
+    paginated = request.page_size is not None or request.page_token is not None
+    if request.preview and not paginated:
+        return await execute_preview(request, http_request)
+    if paginated:
+        page_size = min(max(request.page_size or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+        offset, page_result_id = 0, request.result_id
+        if request.page_token:
+            token = decode_page_token(request.query, request.page_token)
+            if token is None:
+                raise HTTPException(status_code=400, detail="Invalid page_token for this query.")
+            offset, page_result_id = token
+        results, page_result_id, estimate = await execute_page(
+            request, http_request, page_size, offset, page_result_id
+        )
+    else:
+        connection = get_connection_key()
+        cached_id, result_cache_status = await run_in_db_pool(result_cache.lookup, request.query, connection)
+        stored = await run_in_render_pool(result_store.get, cached_id, connection) if cached_id else None
+        if stored is not None:
+            # Served from the result store without touching MySQL
+            results = {"result": await run_in_render_pool(stored.rows), "columns": stored.columns}
+        else:
+            if result_cache_status == "hit":
+                # The entry outlived its stored result
+                result_cache_status = "miss"
+            dependencies = None
+            if result_cache_status != "bypass":
+                dependencies = await run_in_db_pool(result_cache.dependencies, request.query, connection)
+            sql_to_run, estimate = await check_query_cost(request.query)
+            results = await run_query(http_request, execute_query, sql_to_run)
     
     if results is None:
         print("[ROUTER ERROR] execute_query returned None")
         return {"error": "Error executing the SQL query. Check backend logs for details."}
 
-    # Convert SQLAlchemy Row objects to dicts for JSON serialization
     raw_rows = results.get("result", [])
+    columns = results.get("columns", [])
     print(f"[ROUTER DEBUG] Raw rows type: {type(raw_rows)}, count: {len(raw_rows) if raw_rows else 0}")
-    
-    serialized_rows = []
-    for row in raw_rows:
-        if hasattr(row, "_mapping"):
-            serialized_rows.append(dict(row._mapping))
-        else:
-            try:
-                serialized_rows.append(dict(row))
-            except Exception as e:
-                print(f"[ROUTER WARNING] Failed to dict(row): {e}, falling back to list")
-                serialized_rows.append({"values": list(row)})
 
-    print(f"[ROUTER DEBUG] Returning {len(serialized_rows)} serialized rows")
-    return {"results": serialized_rows, "optimization_tips": results.get("optimization_tips", "")}
+    response = {"optimization_tips": results.get("optimization_tips", "")}
+    if estimate is not None:
+        response["cost_estimate"] = estimate
+    if paginated:
+        next_offset = results["next_offset"]
+        response["next_page_token"] = (
+            encode_page_token(request.query, next_offset, page_result_id) if next_offset is not None else None
+        )
+        if page_result_id is not None:
+            response["result_id"] = page_result_id
+    elif stored is not None:
+        response["result_id"] = cached_id
+        response["result_cache"] = result_cache_status
+    elif sql_to_run == request.query:
+        response["result_id"] = await store_result(connection, request.query, columns, raw_rows, dependencies)
+        response["result_cache"] = result_cache_status
+    else:
+        # Rows capped by the cost guard aren't the query's result, so they aren't kept under it
+        response["result_cache"] = "bypass"
+
+    def serialize():
+        # Encoded here rather than by FastAPI, whose generic encoder walks every value in Python
+        return dumps({**shape_rows(columns, raw_rows, request.shape), **response})
+
+    content = await run_in_render_pool(serialize)
+    print(f"[ROUTER DEBUG] Returning {len(raw_rows)} serialized rows")
+    return Response(content=content, media_type=JSON_MEDIA_TYPE)
+
+
+async def store_result(connection, sql_query, columns, rows, dependencies, table=None):
+    """
+    Keeps a full result so the CSV download and graph don't have to run the query
+    again, and caches its handle when `dependencies` (taken before the query ran)
+    is given. The result is given as row tuples, or as an Arrow `table` already
+    built from them. Returns the result_id, or None if the result is too large to keep.
+    """
+    if table is not None:
+        result_id = await run_in_render_pool(result_store.put_table, connection, sql_query, table)
+    else:
+        result_id = await run_in_render_pool(result_store.put, connection, sql_query, columns, rows)
+    if dependencies is not None:
+        result_cache.add(sql_query, connection, result_id, dependencies)
+    return result_id
+
+
+async def execute_preview(request: QueryRequest, http_request: Request):
+    """
+    Runs the query with its LIMIT added or tightened to one more than the preview
+    size, so MySQL stops after the first rows instead of producing the whole result.
+    The extra row only tells whether there is more. A cached full result is sliced
+    instead of running anything, and a result that turns out to fit in the preview
+    is stored like a full execution.
+    """
+    preview_rows = min(max(request.preview_rows or PREVIEW_ROWS, 1), MAX_PAGE_SIZE)
+    connection = get_connection_key()
+    response = {}
+
+    cached_id, result_cache_status = await run_in_db_pool(result_cache.lookup, request.query, connection)
+    stored = await run_in_render_pool(result_store.get, cached_id, connection) if cached_id else None
+    if stored is not None:
+        rows = await run_in_render_pool(stored.rows, 0, preview_rows + 1)
+        columns = stored.columns
+        response["optimization_tips"] = ""
+        response["result_id"] = cached_id
+        response["result_cache"] = result_cache_status
+    else:
+        if result_cache_status == "hit":
+            # The entry outlived its stored result
+            result_cache_status = "miss"
+        dependencies = None
+        if result_cache_status != "bypass":
+            dependencies = await run_in_db_pool(result_cache.dependencies, request.query, connection)
+        # Statements that can't take a LIMIT (not a SELECT, FOR UPDATE, ...) run as they are and are truncated
+        limited_sql = inject_limit(request.query, preview_rows + 1)
+        sql_to_run, estimate = await check_query_cost(limited_sql or request.query)
+        results = await run_query(http_request, execute_query, sql_to_run)
+        if results is None:
+            print("[ROUTER ERROR] execute_query returned None")
+            return {"error": "Error executing the SQL query. Check backend logs for details."}
+        rows, columns = results.get("result", []), results.get("columns", [])
+        response["optimization_tips"] = results.get("optimization_tips", "")
+        if estimate is not None:
+            response["cost_estimate"] = estimate
+        # The whole result was fetched (it fit in the preview, or no LIMIT could be added), so keep it
+        if (limited_sql is None or len(rows) <= preview_rows) and sql_to_run == (limited_sql or request.query):
+            response["result_id"] = await store_result(connection, request.query, columns, rows, dependencies)
+            response["result_cache"] = result_cache_status
+
+    response["has_more"] = len(rows) > preview_rows
+    response["preview_rows"] = preview_rows
+    rows = rows[:preview_rows]
+
+    def serialize():
+        return dumps({**shape_rows(columns, rows, request.shape), **response})
+
+    content = await run_in_render_pool(serialize)
+    print(f"[ROUTER DEBUG] Returning {len(rows)} preview rows (has_more={response['has_more']})")
+    return Response(content=content, media_type=JSON_MEDIA_TYPE)
+
+
+async def stream_ndjson(request: QueryRequest, http_request: Request):
+    """
+    Streams query results as NDJSON: a {"columns": [...]} line, one JSON array per
+    row, then a {"row_count": n} line ({"row_count": n, "error": ...} if the query
+    was cancelled part-way). Memory use is bounded by the batch size,
+    and keep_result doesn't change that: each batch is also appended to an Arrow
+    table, columnar and far smaller than the rows, which is stored at the end so
+    the final line carries a result_id for the CSV download and graph. A result
+    that outgrows the result store (or whose later rows don't fit the column types
+    of the first batch) stops being kept and gets no result_id.
+    """
+    connection = get_connection_key()
+    dependencies = None
+    if request.keep_result:
+        _, result_cache_status = await run_in_db_pool(result_cache.lookup, request.query, connection)
+        if result_cache_status != "bypass":
+            dependencies = await run_in_db_pool(result_cache.dependencies, request.query, connection)
+    columns, batches, estimate = await open_stream(http_request, request.query)
+    head = await first_batch(batches)
+
+    async def body():
+        header = {"columns": columns}
+        if estimate is not None:
+            header["cost_estimate"] = estimate
+        yield dumps(header) + b"\n"
+        # A result the cost guard truncated isn't the query's result, so it isn't kept
+        kept = [] if request.keep_result and not is_row_limited(estimate) else None
+        kept_bytes = 0
+        schema = infer_schema(columns, head or [])
+        row_count = 0
+        try:
+            async for batch in _prepend(head, batches):
+                row_count += len(batch)
+                if kept is not None:
+                    try:
+                        record_batch = await run_in_render_pool(rows_to_record_batch, batch, schema)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                        print(f"[RESULT STORE] Not keeping streamed result: {e}")
+                        kept = None
+                    else:
+                        kept_bytes += record_batch.nbytes
+                        kept.append(record_batch)
+                        if kept_bytes > result_store.max_result_bytes:
+                            print("[RESULT STORE] Not keeping streamed result: larger than the result store")
+                            kept = None
+                yield await run_in_render_pool(encode_ndjson_rows, batch)
+        except QueryCancelled as e:
+            # The rows so far went out under a 200, so the last line reports the stream as incomplete
+            yield dumps({"row_count": row_count, "error": cancelled_detail(str(e), STREAM_IDLE_TIMEOUT_SECONDS)}) + b"\n"
+            return
+        summary = {"row_count": row_count}
+        if request.keep_result:
+            summary["result_id"] = None
+        if kept is not None:
+            table = pa.Table.from_batches(kept, schema=schema)
+            summary["result_id"] = await store_result(connection, request.query, columns, None, dependencies, table)
+        yield dumps(summary) + b"\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def lookup_stored_result(request: QueryRequest):
+    """The stored result for the request's result_id, if it is still live for this query and connection"""
+    if not request.result_id:
+        return None
+    return await run_in_render_pool(result_store.get, request.result_id, get_connection_key(), request.query)
+
+
+async def execute_page(request: QueryRequest, http_request: Request, page_size: int, offset: int, result_id):
+    """
+    One page of a query's results, returned as (results, result_id, cost estimate).
+
+    The query runs once, for the first page, and its full result is kept in the
+    result store (or taken from it, like a full execution); the page token names
+    that result, so later pages are slices of the same rows and cost MySQL
+    nothing. A result too large to store, or truncated by the cost guard, is paged
+    with LIMIT/OFFSET instead, re-running the query for each page: those pages are
+    only consistent with each other when the query is ordered by unique columns.
+    """
+    connection = get_connection_key()
+    if result_id:
+        stored = await run_in_render_pool(result_store.get, result_id, connection, request.query)
+        if stored is not None:
+            return await run_in_render_pool(stored_page, stored, page_size, offset), result_id, None
+        if request.page_token:
+            raise HTTPException(status_code=410, detail="The paged result has expired; request the first page again.")
+
+    if not is_select(request.query):
+        print("[ERROR] Only SELECT statements can be paginated")
+        return None, None, None
+    if offset:
+        sql_to_run, estimate = await check_query_cost(request.query)
+        return await run_query(http_request, execute_query_page, sql_to_run, page_size, offset), None, estimate
+
+    cached_id, result_cache_status = await run_in_db_pool(result_cache.lookup, request.query, connection)
+    stored = await run_in_render_pool(result_store.get, cached_id, connection) if cached_id else None
+    if stored is not None:
+        return await run_in_render_pool(stored_page, stored, page_size, 0), cached_id, None
+
+    dependencies = None
+    if result_cache_status != "bypass":
+        dependencies = await run_in_db_pool(result_cache.dependencies, request.query, connection)
+    sql_to_run, estimate = await check_query_cost(request.query)
+    results = await run_query(http_request, execute_query, sql_to_run)
+    if results is None:
+        return None, None, estimate
+    columns, rows = results["columns"], results["result"]
+    result_id = None
+    if sql_to_run == request.query:
+        result_id = await store_result(connection, request.query, columns, rows, dependencies)
+    next_offset = page_size if len(rows) > page_size else None
+    return {"result": rows[:page_size], "columns": columns, "next_offset": next_offset}, result_id, estimate
+
+
+def stored_page(stored, page_size, offset):
+    """Same shape as execute_query_page, read from a stored result"""
+    rows = stored.rows(offset, page_size)
+    next_offset = offset + page_size if offset + page_size < len(stored) else None
+    return {"result": rows, "columns": stored.columns, "next_offset": next_offset}
+
+
+async def _iterate_stored(stored):
+    for offset in range(0, len(stored), STREAM_BATCH_SIZE):
+        yield await run_in_render_pool(stored.rows, offset, STREAM_BATCH_SIZE)
+
+
+async def abort_if_cancelled(chunks):
+    """
+    Passes a download's chunks through. A query cancelled part-way re-raises, so the
+    server aborts the response without its final chunk and the client sees a failed
+    download instead of a truncated file that looks complete.
+    """
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except QueryCancelled as e:
+        print(f"[QUERY] Aborting download, query cancelled ({e})")
+        raise
+
+
+async def _prepend(batch, row_batches):
+    """The already-read first batch (if any) followed by the rest of the stream"""
+    if batch:
+        yield batch
+    async for batch in row_batches:
+        yield batch
+
+
+async def open_row_batches(request: QueryRequest, http_request: Request):
+    """
+    Returns (columns, async iterator of row batches, cost estimate) for a request. A
+    live result_id for the same query is served from the result store; otherwise
+    the query is streamed again from a server-side cursor (see open_stream).
+    """
+    stored = await lookup_stored_result(request)
+    if stored is not None:
+        return stored.columns, _iterate_stored(stored), None
+    return await open_stream(http_request, request.query)
+
+
+async def stream_encoded(request: QueryRequest, http_request: Request, encoder_class, media_type: str,
+                         headers: dict | None = None):
+    """
+    Streams query results through a columnar encoder (Arrow IPC or Parquet). Each
+    batch is converted straight into an Arrow record batch and sent as soon as it
+    is encoded; the schema is inferred from the first batch. Stored results are
+    already Arrow tables, so their record batches are written as they are.
+    """
+    stored = await lookup_stored_result(request)
+    if stored is not None:
+        encoder = await run_in_render_pool(encoder_class, stored.schema)
+
+        async def stored_body():
+            for batch in stored.table.to_batches(max_chunksize=STREAM_BATCH_SIZE):
+                yield await run_in_render_pool(encoder.encode_batch, batch)
+            yield await run_in_render_pool(encoder.finish)
+
+        return StreamingResponse(stored_body(), media_type=media_type, headers=headers)
+
+    columns, row_batches, estimate = await open_row_batches(request, http_request)
+    head = await first_batch(row_batches) or []
+    encoder = await run_in_render_pool(lambda: encoder_class(infer_schema(columns, head)))
+
+    async def body():
+        async for batch in _prepend(head, row_batches):
+            yield await run_in_render_pool(encoder.encode, batch)
+        yield await run_in_render_pool(encoder.finish)
+
+    return StreamingResponse(
+        abort_if_cancelled(body()), media_type=media_type, headers=cost_guard_headers(estimate, headers)
+    )
+
+
+@router.post("/download_parquet")
+async def download_parquet(request: QueryRequest, http_request: Request):
+    if not is_connected():
+        raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
+
+    return await stream_encoded(
+        request,
+        http_request,
+        ParquetStreamEncoder,
+        PARQUET_MEDIA_TYPE,
+        headers={"Content-Disposition": "attachment; filename=query_results.parquet"}
+    )
 
 
 @router.post("/download_csv")
-async def download_csv(request: QueryRequest):
+async def download_csv(request: QueryRequest, http_request: Request):
     if not is_connected():
         raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
     
-    results = execute_query(request.query)
-    
-    if results is None:
-        raise HTTPException(status_code=500, detail="Error executing the SQL query.")
-    
-    # Convert SQLAlchemy Row objects to dicts
-    raw_rows = results.get("result", [])
-    serialized_rows = []
-    for row in raw_rows:
-        if hasattr(row, "_mapping"):
-            serialized_rows.append(dict(row._mapping))
-        else:
-            try:
-                serialized_rows.append(dict(row))
-            except Exception:
-                serialized_rows.append({"values": list(row)})
-    
-    if not serialized_rows:
+    columns, row_batches, estimate = await open_row_batches(request, http_request)
+
+    # Read the first batch up front so an empty result can still be reported as a 404
+    head = await first_batch(row_batches)
+    if not head:
+        await row_batches.aclose()
         raise HTTPException(status_code=404, detail="No data to download.")
-    
-    # Convert to DataFrame and then to CSV
-    df = pd.DataFrame(serialized_rows)
-    csv_buffer = StringIO()
-    df.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)
-    
+
+    async def body():
+        # Encode batch by batch so the first bytes go out before the whole result is read
+        yield await run_in_render_pool(_encode_csv_rows, head, columns)
+        async for batch in row_batches:
+            yield await run_in_render_pool(_encode_csv_rows, batch)
+
     return StreamingResponse(
-        iter([csv_buffer.getvalue()]),
+        abort_if_cancelled(body()),
         media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=query_results.csv"}
+        headers=cost_guard_headers(estimate, {"Content-Disposition": "attachment; filename=query_results.csv"})
     )
 
 
+def _encode_csv_rows(rows, header=None):
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException
+from ..database import is_connected
+from ..schema_cache import refresh_schema
+from ..concurrency import run_in_db_pool
+
+
+router = APIRouter(prefix="/schema", tags=["schema"])
+
+
+@router.post("/refresh")
+async def refresh_schema_route(mode: str = "full"):
+    if not is_connected():
+        raise HTTPException(status_code=400, detail="Database not connected. Please connect to database first.")
+    if mode not in ("full", "delta"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'delta'.")
+
+    entry = await run_in_db_pool(refresh_schema, mode)
+    if entry is None:
+        return {"error": "Failed to load database schema.", "status": "error"}
+
+    return {
+        "status": "success",
+        "version": entry["version"],
+        "tables": len(entry["schema"].get("tables", {})),
+        "changed_tables": sorted(entry["changed_tables"]) if entry["changed_tables"] is not None else None,
+        "loaded_at": entry["loaded_at"]
+    }
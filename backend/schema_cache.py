@@ -0,0 +1,346 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from .database import get_connection_key, get_schema, get_table_versions, format_schema_for_llm
+
+# How long a cached schema is served before it is revalidated against information_schema
+SCHEMA_CACHE_TTL_SECONDS = int(os.getenv("SCHEMA_CACHE_TTL_SECONDS", "300"))
+# Expired entries are patched incrementally; a full reload still happens at this interval
+# because in-place DDL (e.g. instant ADD COLUMN, dropping an FK) doesn't always bump CREATE_TIME
+SCHEMA_FULL_REFRESH_SECONDS = int(os.getenv("SCHEMA_FULL_REFRESH_SECONDS", "3600"))
+# Where schema snapshots are persisted for warm starts (set to an empty string to disable)
+SCHEMA_SNAPSHOT_DIR = os.getenv(
+    "SCHEMA_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "sql_query_generator", "schema")
+)
+
+# Cached entries keyed by get_connection_key() -> (server, database)
+_schema_cache = {}
+_cache_lock = threading.Lock()
+# Serializes reloads so concurrent requests don't all hit information_schema at once
+_load_lock = threading.Lock()
+# Callbacks run as callback(key, old_version, new_version) when a connection's schema changes
+_change_listeners = []
+
+
+def compute_schema_version(schema_dict):
+    """
+    Returns a short content hash of a schema's structure: tables, columns and their
+    types, keys, foreign keys, indexes and comments. Row estimates and CREATE_TIME
+    are left out, since they change with ordinary DML and table rebuilds, and a
+    new version invalidates the SQL caches and the schema index.
+    """
+    structure = {
+        'tables': schema_dict.get('tables', {}),
+        'relationships': schema_dict.get('relationships', []),
+        'indexes': schema_dict.get('indexes', {}),
+        'comments': {table: meta.get('comment', '') for table, meta in schema_dict.get('table_metadata', {}).items()}
+    }
+    payload = json.dumps(structure, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _is_fresh(entry):
+    return time.time() - entry['loaded_at'] < SCHEMA_CACHE_TTL_SECONDS
+
+
+def compute_versions_fingerprint(table_versions):
+    """Returns a short hash of get_table_versions() output, used to tag disk snapshots"""
+    payload = json.dumps(table_versions or {}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _snapshot_path(key):
+    name = hashlib.sha256(f"{key[0]}/{key[1]}".encode("utf-8")).hexdigest()[:24]
+    return os.path.join(SCHEMA_SNAPSHOT_DIR, f"{name}.json.gz")
+
+
+def _save_snapshot(key, entry):
+    """Persists an entry to disk so a restarted worker can serve it without introspection"""
+    if not SCHEMA_SNAPSHOT_DIR:
+        return
+    snapshot = {
+        'server': key[0],
+        'database': key[1],
+        'fingerprint': compute_versions_fingerprint(entry['table_versions']),
+        'version': entry['version'],
+        'full_loaded_at': entry['full_loaded_at'],
+        'table_versions': entry['table_versions'],
+        'schema': entry['schema']
+    }
+    path = _snapshot_path(key)
+    try:
+        os.makedirs(SCHEMA_SNAPSHOT_DIR, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=SCHEMA_SNAPSHOT_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+            f.write(json.dumps(snapshot, separators=(",", ":"), default=str).encode("utf-8"))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[SCHEMA CACHE] Failed to write schema snapshot: {e}")
+
+
+def _load_snapshot(key):
+    """
+    Reads the persisted entry for this connection, or None if there isn't a usable
+    one. Returns (entry, fingerprint of the table versions it was taken at).
+    """
+    if not SCHEMA_SNAPSHOT_DIR:
+        return None
+    path = _snapshot_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rb") as f:
+            snapshot = json.loads(f.read().decode("utf-8"))
+    except Exception as e:
+        print(f"[SCHEMA CACHE] Ignoring unreadable schema snapshot {path}: {e}")
+        return None
+
+    if (snapshot.get('server'), snapshot.get('database')) != tuple(key):
+        return None
+
+    entry = {
+        'schema': snapshot['schema'],
+        'schema_text': None,
+        'version': snapshot['version'],
+        'loaded_at': time.time(),
+        'full_loaded_at': snapshot['full_loaded_at'],
+        'table_versions': snapshot['table_versions'],
+        'changed_tables': None,
+        'previous_version': None
+    }
+    return entry, snapshot.get('fingerprint')
+
+
+def on_schema_change(callback):
+    """Registers callback(key, old_version, new_version), called when a cached schema version changes"""
+    _change_listeners.append(callback)
+    return callback
+
+
+def _store_entry(key, entry):
+    with _cache_lock:
+        previous = _schema_cache.get(key)
+        _schema_cache[key] = entry
+    if previous is not None and previous['version'] != entry['version']:
+        for callback in _change_listeners:
+            try:
+                callback(key, previous['version'], entry['version'])
+            except Exception as e:
+                print(f"[SCHEMA CACHE] Schema change listener failed: {e}")
+    return entry
+
+
+def _load_entry(key):
+    """Fetches the whole schema from the database and stores it in the cache"""
+    # Read the versions first so changes made during introspection are caught next time
+    table_versions = get_table_versions()
+    schema_dict = get_schema()
+    if not schema_dict:
+        # Don't cache failures, the next request should retry
+        return None
+
+    now = time.time()
+    entry = {
+        'schema': schema_dict,
+        'schema_text': None,
+        'version': compute_schema_version(schema_dict),
+        'loaded_at': now,
+        'full_loaded_at': now,
+        'table_versions': table_versions,
+        'changed_tables': None,  # None means everything was (re)loaded
+        'previous_version': None
+    }
+    print(f"[SCHEMA CACHE] Loaded schema {entry['version']} for {key[0]}/{key[1]} "
+          f"({len(schema_dict.get('tables', {}))} tables)")
+    _store_entry(key, entry)
+    _save_snapshot(key, entry)
+    return entry
+
+
+def _diff_table_versions(old_versions, new_versions):
+    """Returns (changed_or_new_tables, removed_tables) between two get_table_versions() results"""
+    changed = {table for table, version in new_versions.items() if old_versions.get(table) != version}
+    removed = set(old_versions) - set(new_versions)
+    return changed, removed
+
+
+def _patch_schema(schema_dict, partial, stale_tables, removed_tables):
+    """Builds a new schema dict with stale tables replaced by a partial get_schema() result"""
+    patched = {
+        'tables': {t: info for t, info in schema_dict['tables'].items() if t not in stale_tables},
+        'relationships': [
+            rel for rel in schema_dict['relationships']
+            if rel['table'] not in stale_tables and rel['references_table'] not in removed_tables
+        ],
+        'table_metadata': {t: meta for t, meta in schema_dict['table_metadata'].items() if t not in stale_tables},
+        'indexes': {t: idx for t, idx in schema_dict['indexes'].items() if t not in stale_tables}
+    }
+
+    for table, info in patched['tables'].items():
+        if any(fk['references'].split('.')[0] in removed_tables for fk in info['foreign_keys']):
+            patched['tables'][table] = dict(info, foreign_keys=[
+                fk for fk in info['foreign_keys'] if fk['references'].split('.')[0] not in removed_tables
+            ])
+
+    patched['tables'].update(partial['tables'])
+    patched['table_metadata'].update(partial['table_metadata'])
+    patched['indexes'].update(partial['indexes'])
+    patched['relationships'].extend(partial['relationships'])
+    # Keep the same ordering as the full information_schema query
+    patched['relationships'].sort(key=lambda rel: (rel['table'], rel['column']))
+    return patched
+
+
+def _refresh_entry_incremental(key, entry, table_versions=None):
+    """
+    Revalidates a cached entry by re-introspecting only the tables whose
+    CREATE_TIME / UPDATE_TIME changed, or that were added or dropped.
+    `table_versions` is the live get_table_versions() result, if already fetched.
+
+    Returns None when a delta refresh isn't possible, so the caller can fall back to a full load.
+    """
+    if entry.get('table_versions') is None:
+        return None
+
+    if table_versions is None:
+        table_versions = get_table_versions()
+    if table_versions is None:
+        return None
+
+    changed, removed = _diff_table_versions(entry['table_versions'], table_versions)
+    if not changed and not removed:
+        return _store_entry(key, dict(
+            entry, loaded_at=time.time(), changed_tables=set(), previous_version=entry['version']
+        ))
+
+    partial = get_schema(tables=sorted(changed))
+    if not partial:
+        return None
+
+    schema_dict = _patch_schema(entry['schema'], partial, changed | removed, removed)
+    new_entry = dict(
+        entry,
+        schema=schema_dict,
+        schema_text=None,
+        version=compute_schema_version(schema_dict),
+        loaded_at=time.time(),
+        table_versions=table_versions,
+        changed_tables=changed | removed,
+        previous_version=entry['version']
+    )
+    print(f"[SCHEMA CACHE] Patched schema {entry['version']} -> {new_entry['version']} "
+          f"({len(changed)} changed, {len(removed)} removed tables)")
+    _store_entry(key, new_entry)
+    _save_snapshot(key, new_entry)
+    return new_entry
+
+
+def _reload_entry(key, entry, mode, table_versions=None):
+    """Delta-refreshes the entry when possible, otherwise does a full load"""
+    wants_full = (
+        mode == "full"
+        or entry is None
+        or time.time() - entry.get('full_loaded_at', 0) >= SCHEMA_FULL_REFRESH_SECONDS
+    )
+    if not wants_full:
+        refreshed = _refresh_entry_incremental(key, entry, table_versions)
+        if refreshed is not None:
+            return refreshed
+    return _load_entry(key)
+
+
+def _warm_from_snapshot(key):
+    """
+    Loads the persisted snapshot into the cache once it has been checked against
+    the live table versions (one information_schema.tables query): a snapshot
+    taken at the current versions is served as is, an outdated one is patched for
+    the tables that changed. Returns None when there is no snapshot or the
+    versions can't be read.
+    """
+    snapshot = _load_snapshot(key)
+    if snapshot is None:
+        return None
+    entry, fingerprint = snapshot
+    table_versions = get_table_versions()
+    if table_versions is None:
+        return None
+    if fingerprint != compute_versions_fingerprint(table_versions):
+        print(f"[SCHEMA CACHE] Schema snapshot for {key[0]}/{key[1]} is out of date, refreshing it")
+        return _reload_entry(key, entry, "auto", table_versions)
+    _store_entry(key, entry)
+    print(f"[SCHEMA CACHE] Warm-started schema {entry['version']} for {key[0]}/{key[1]} from snapshot")
+    return entry
+
+
+def warm_start_schema_cache():
+    """Loads the snapshot for the configured connection at startup, if there is one"""
+    key = get_connection_key()
+    if key is None:
+        return None
+    with _load_lock:
+        with _cache_lock:
+            if key in _schema_cache:
+                return _schema_cache[key]
+        return _warm_from_snapshot(key)
+
+
+def get_cached_schema_entry(force_refresh=False, mode="auto"):
+    """
+    Returns the cache entry for the current connection, loading it if missing or expired.
+
+    The entry is a dict with 'schema' (the get_schema() dict), 'schema_text'
+    (memoized format_schema_for_llm output, built lazily), 'version', 'loaded_at',
+    'table_versions' and 'changed_tables' (tables patched by the last delta refresh).
+    Expired entries are revalidated incrementally unless mode is "full".
+    Returns None if there is no connection or the schema could not be fetched.
+    """
+    key = get_connection_key()
+    if key is None:
+        return None
+
+    with _cache_lock:
+        entry = _schema_cache.get(key)
+    if entry and not force_refresh and _is_fresh(entry):
+        return entry
+
+    with _load_lock:
+        # Another request may have reloaded it while we were waiting
+        with _cache_lock:
+            current = _schema_cache.get(key)
+        if current is not None and current is not entry and _is_fresh(current):
+            return current
+        if current is None and not force_refresh:
+            warmed = _warm_from_snapshot(key)
+            if warmed is not None:
+                return warmed
+        return _reload_entry(key, current, mode)
+
+
+def get_entry_schema_text(entry):
+    """Formatted schema text for a cache entry, built once per entry"""
+    if entry is None:
+        return format_schema_for_llm({})
+    if entry['schema_text'] is None:
+        entry['schema_text'] = format_schema_for_llm(entry['schema'])
+    return entry['schema_text']
+
+
+def refresh_schema(mode="full"):
+    """Forces a reload of the schema for the current connection ("full" or "delta")"""
+    return get_cached_schema_entry(force_refresh=True, mode=mode)
+
+
+def invalidate_schema_cache(all_connections=False):
+    """Drops the cached schema for the current connection (or every connection)"""
+    with _cache_lock:
+        if all_connections:
+            _schema_cache.clear()
+            return
+        key = get_connection_key()
+        if key is not None:
+            _schema_cache.pop(key, None)
@@ -0,0 +1,236 @@
+import os
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from .text_embedding import embed_texts, EMBEDDING_DIM
+
+# Where per-version schema vector indexes are stored (set to an empty string to keep them in memory only)
+SCHEMA_INDEX_DIR = os.getenv(
+    "SCHEMA_INDEX_DIR", os.path.join(tempfile.gettempdir(), "sql_query_generator", "index")
+)
+# Persisted indexes kept on disk; older versions (least recently used first) are deleted
+SCHEMA_INDEX_MAX_VERSIONS = int(os.getenv("SCHEMA_INDEX_MAX_VERSIONS", "8"))
+# Number of rows (table or column descriptions) retrieved per lookup
+SCHEMA_INDEX_TOP_K = int(os.getenv("SCHEMA_INDEX_TOP_K", "64"))
+
+# Loaded indexes by schema version
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+MAX_LOADED_INDEXES = 4
+
+
+class SchemaIndex:
+    """
+    One L2-normalized vector per table description and per column description.
+
+    `matrix` is a contiguous float32 array of shape (rows, EMBEDDING_DIM), memory-mapped
+    from disk when persisted; `tables[i]` / `columns[i]` label row i (columns[i] is None
+    for a table-level row).
+    """
+
+    def __init__(self, version, matrix, tables, columns):
+        self.version = version
+        self.matrix = matrix
+        self.tables = tables
+        self.columns = columns
+        self._table_array = np.array(tables, dtype=object)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def search(self, questions, k=None):
+        """
+        Returns, per question, a {table: best cosine similarity} dict for the top-k rows.
+
+        All questions are scored with a single matrix product and the top-k rows
+        are selected with argpartition, so cost is one pass over the matrix.
+        """
+        k = SCHEMA_INDEX_TOP_K if k is None else k
+        if not len(self) or not questions:
+            return [{} for _ in questions]
+
+        query_matrix = embed_texts(questions)
+        scores = query_matrix @ self.matrix.T  # (questions, rows)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for q, row_ids in enumerate(top):
+            table_scores = {}
+            for row_id, score in zip(row_ids, scores[q, row_ids]):
+                table = self._table_array[row_id]
+                if score > table_scores.get(table, 0.0):
+                    table_scores[table] = float(score)
+            results.append(table_scores)
+        return results
+
+
+def _describe_table(table_name, table_info, meta):
+    columns = ' '.join(col['name'] for col in table_info['columns'])
+    return f"{table_name} {meta.get('comment', '')} {columns}"
+
+
+def _describe_column(table_name, col):
+    return f"{table_name} {col['name']} {col.get('base_type', '')} {col.get('comment', '')}"
+
+
+def _table_rows(schema_dict, table_name):
+    """(texts, columns) for one table: its own description followed by one per column"""
+    table_info = schema_dict['tables'][table_name]
+    meta = schema_dict.get('table_metadata', {}).get(table_name, {})
+    texts = [_describe_table(table_name, table_info, meta)]
+    columns = [None]
+    for col in table_info['columns']:
+        texts.append(_describe_column(table_name, col))
+        columns.append(col['name'])
+    return texts, columns
+
+
+def _build(schema_dict, version, previous=None, changed_tables=None):
+    """
+    Builds an index for schema_dict. When `previous` is the index of the prior
+    schema version, rows of tables not in `changed_tables` are copied from it and
+    only changed tables are re-embedded.
+    """
+    reuse = previous is not None and changed_tables is not None
+    blocks = []
+    tables = []
+    columns = []
+    prev_rows = {}
+    if reuse:
+        for i, table_name in enumerate(previous.tables):
+            prev_rows.setdefault(table_name, []).append(i)
+
+    for table_name in sorted(schema_dict['tables']):
+        if reuse and table_name not in changed_tables:
+            rows = prev_rows.get(table_name)
+            if rows:
+                blocks.append(np.asarray(previous.matrix[rows]))
+                tables.extend([table_name] * len(rows))
+                columns.extend(previous.columns[i] for i in rows)
+                continue
+        texts, table_columns = _table_rows(schema_dict, table_name)
+        blocks.append(embed_texts(texts))
+        tables.extend([table_name] * len(texts))
+        columns.extend(table_columns)
+
+    matrix = np.ascontiguousarray(
+        np.concatenate(blocks) if blocks else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    )
+    return SchemaIndex(version, matrix, tables, columns)
+
+
+def _index_paths(version):
+    base = os.path.join(SCHEMA_INDEX_DIR, f"schema-{version}-{EMBEDDING_DIM}")
+    return base + ".npy", base + ".json"
+
+
+def _save(index):
+    """Persists the index and returns it re-opened as a read-only memory map"""
+    if not SCHEMA_INDEX_DIR or not len(index):
+        return index
+    matrix_path, labels_path = _index_paths(index.version)
+    try:
+        os.makedirs(SCHEMA_INDEX_DIR, exist_ok=True)
+        fd, tmp_matrix = tempfile.mkstemp(dir=SCHEMA_INDEX_DIR, suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, index.matrix)
+        fd, tmp_labels = tempfile.mkstemp(dir=SCHEMA_INDEX_DIR, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({'tables': index.tables, 'columns': index.columns}, f, separators=(",", ":"))
+        os.replace(tmp_labels, labels_path)
+        os.replace(tmp_matrix, matrix_path)
+    except Exception as e:
+        print(f"[SCHEMA INDEX] Failed to persist index {index.version}: {e}")
+        return index
+    _prune()
+    return _load(index.version) or index
+
+
+def _prune():
+    """Deletes persisted indexes beyond the SCHEMA_INDEX_MAX_VERSIONS most recently used"""
+    try:
+        with os.scandir(SCHEMA_INDEX_DIR) as entries:
+            matrices = [
+                (entry.stat().st_mtime, entry.path) for entry in entries
+                if entry.name.startswith("schema-") and entry.name.endswith(".npy")
+            ]
+    except OSError as e:
+        print(f"[SCHEMA INDEX] Failed to list persisted indexes: {e}")
+        return
+    matrices.sort(reverse=True)
+    for _, matrix_path in matrices[max(SCHEMA_INDEX_MAX_VERSIONS, 1):]:
+        # Indexes already memory-mapped stay readable after their files are unlinked
+        for path in (matrix_path, matrix_path[:-len(".npy")] + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _load(version):
+    """Opens a persisted index as a read-only memory map, or returns None"""
+    if not SCHEMA_INDEX_DIR:
+        return None
+    matrix_path, labels_path = _index_paths(version)
+    if not (os.path.exists(matrix_path) and os.path.exists(labels_path)):
+        return None
+    try:
+        matrix = np.load(matrix_path, mmap_mode='r')
+        with open(labels_path) as f:
+            labels = json.load(f)
+        # The modification time doubles as last use for pruning
+        os.utime(matrix_path)
+    except Exception as e:
+        print(f"[SCHEMA INDEX] Ignoring unreadable index {version}: {e}")
+        return None
+    if matrix.shape != (len(labels['tables']), EMBEDDING_DIM):
+        return None
+    return SchemaIndex(version, matrix, labels['tables'], labels['columns'])
+
+
+def _remember(index):
+    with _indexes_lock:
+        _indexes[index.version] = index
+        _indexes.move_to_end(index.version)
+        while len(_indexes) > MAX_LOADED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_schema_index(schema_entry):
+    """
+    Returns the vector index for a schema cache entry, building it at most once per version.
+
+    If the entry came from a delta refresh and the previous version's index is
+    available, only the entry's 'changed_tables' are re-embedded.
+    """
+    version = schema_entry['version']
+    with _indexes_lock:
+        index = _indexes.get(version)
+        if index is not None:
+            _indexes.move_to_end(version)
+            return index
+
+    index = _load(version)
+    if index is not None:
+        return _remember(index)
+
+    previous = None
+    if schema_entry.get('previous_version') and schema_entry.get('changed_tables') is not None:
+        with _indexes_lock:
+            previous = _indexes.get(schema_entry['previous_version'])
+        if previous is None:
+            previous = _load(schema_entry['previous_version'])
+
+    index = _build(
+        schema_entry['schema'],
+        version,
+        previous=previous,
+        changed_tables=schema_entry.get('changed_tables') if previous is not None else None
+    )
+    print(f"[SCHEMA INDEX] Built index {version} with {len(index)} rows"
+          f"{' (incremental)' if previous is not None else ''}")
+    return _remember(_save(index))
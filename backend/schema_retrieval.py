@@ -0,0 +1,217 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from .database import format_schema_for_llm
+from .text_embedding import tokenize
+from .schema_cache import get_entry_schema_text
+from .schema_index import get_schema_index
+
+# Approximate token budget for the schema section of the NL->SQL prompt (0 sends the whole schema)
+SCHEMA_PROMPT_TOKEN_BUDGET = int(os.getenv("SCHEMA_PROMPT_TOKEN_BUDGET", "6000"))
+# Number of best-matching tables used as seeds before expanding along foreign keys
+SCHEMA_PROMPT_TOP_K = int(os.getenv("SCHEMA_PROMPT_TOP_K", "8"))
+# Weight of the vector-index similarity relative to lexical matches (0 disables the index)
+SCHEMA_VECTOR_WEIGHT = float(os.getenv("SCHEMA_VECTOR_WEIGHT", "3.0"))
+# Cosine similarities below this are treated as noise
+SCHEMA_VECTOR_MIN_SIMILARITY = float(os.getenv("SCHEMA_VECTOR_MIN_SIMILARITY", "0.2"))
+
+# Relative weight of a token depending on where it appears in a table's definition
+FIELD_WEIGHTS = {
+    'table': 3.0,
+    'column': 2.0,
+    'comment': 1.0,
+    'type': 0.5
+}
+
+# Rough characters-per-token ratio for English/markdown text
+CHARS_PER_TOKEN = 4
+
+# Prepared lookup structures per schema version (only a few versions are ever live)
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+MAX_PREPARED_VERSIONS = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def subset_schema(schema_dict, tables):
+    """Returns a copy of schema_dict restricted to the given tables"""
+    tables = set(tables)
+    return {
+        'tables': {t: info for t, info in schema_dict['tables'].items() if t in tables},
+        'relationships': [
+            rel for rel in schema_dict.get('relationships', [])
+            if rel['table'] in tables and rel['references_table'] in tables
+        ],
+        'table_metadata': {t: meta for t, meta in schema_dict.get('table_metadata', {}).items() if t in tables},
+        'indexes': {t: idx for t, idx in schema_dict.get('indexes', {}).items() if t in tables}
+    }
+
+
+def _table_terms(table_name, table_info, meta):
+    """Weighted bag of tokens describing one table"""
+    terms = {}
+
+    def add(text, field):
+        for token in tokenize(text):
+            terms[token] = max(terms.get(token, 0.0), FIELD_WEIGHTS[field])
+
+    add(table_name, 'table')
+    add(meta.get('comment', ''), 'comment')
+    for col in table_info['columns']:
+        add(col['name'], 'column')
+        add(col.get('comment', ''), 'comment')
+        add(col.get('base_type', ''), 'type')
+    return terms
+
+
+def _prepare(schema_dict):
+    """Builds the per-version lookup structures used for ranking"""
+    table_terms = {}
+    table_tokens = {}
+    doc_freq = {}
+    for table_name, table_info in schema_dict['tables'].items():
+        meta = schema_dict.get('table_metadata', {}).get(table_name, {})
+        terms = _table_terms(table_name, table_info, meta)
+        table_terms[table_name] = terms
+        for token in terms:
+            doc_freq[token] = doc_freq.get(token, 0) + 1
+        # Size of this table's section in the formatted prompt
+        section = format_schema_for_llm(subset_schema(schema_dict, [table_name]))
+        table_tokens[table_name] = estimate_tokens(section)
+
+    n_tables = max(len(table_terms), 1)
+    idf = {token: math.log(1 + n_tables / df) for token, df in doc_freq.items()}
+
+    neighbors = {table: set() for table in schema_dict['tables']}
+    for rel in schema_dict.get('relationships', []):
+        if rel['table'] in neighbors and rel['references_table'] in neighbors:
+            neighbors[rel['table']].add(rel['references_table'])
+            neighbors[rel['references_table']].add(rel['table'])
+
+    return {
+        'table_terms': table_terms,
+        'table_tokens': table_tokens,
+        'idf': idf,
+        'neighbors': neighbors
+    }
+
+
+def _get_prepared(schema_entry):
+    version = schema_entry['version']
+    with _prepared_lock:
+        prepared = _prepared.get(version)
+        if prepared is not None:
+            _prepared.move_to_end(version)
+            return prepared
+
+    prepared = _prepare(schema_entry['schema'])
+    with _prepared_lock:
+        _prepared[version] = prepared
+        while len(_prepared) > MAX_PREPARED_VERSIONS:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def rank_tables(prepared, question, vector_scores=None):
+    """
+    Scores every table against the question; returns [(table, score)] best first, score > 0 only.
+
+    The score is the IDF-weighted lexical match, plus SCHEMA_VECTOR_WEIGHT times the
+    best cosine similarity from the schema vector index when `vector_scores` is given.
+    """
+    query_tokens = set(tokenize(question))
+    if not query_tokens:
+        return []
+
+    vector_scores = vector_scores or {}
+    scores = []
+    for table, terms in prepared['table_terms'].items():
+        score = sum(terms[token] * prepared['idf'][token] for token in query_tokens if token in terms)
+        similarity = vector_scores.get(table, 0.0)
+        if similarity >= SCHEMA_VECTOR_MIN_SIMILARITY:
+            score += SCHEMA_VECTOR_WEIGHT * similarity
+        if score > 0:
+            scores.append((table, score))
+    scores.sort(key=lambda item: (-item[1], item[0]))
+    return scores
+
+
+def expand_along_foreign_keys(seeds, neighbors):
+    """
+    Returns (bridges, adjacent): tables that connect two seeds through a single
+    intermediate table, and the remaining direct FK neighbours of the seeds.
+    Bridges keep multi-table joins valid; neighbours are lower-priority context.
+    """
+    seed_set = set(seeds)
+    bridges = []
+    adjacent = []
+    for seed in seeds:
+        for neighbor in sorted(neighbors.get(seed, ())):
+            if neighbor in seed_set or neighbor in bridges:
+                continue
+            if len(neighbors.get(neighbor, set()) & seed_set) >= 2:
+                bridges.append(neighbor)
+            elif neighbor not in adjacent:
+                adjacent.append(neighbor)
+    adjacent = [table for table in adjacent if table not in bridges]
+    return bridges, adjacent
+
+
+def select_tables(prepared, question, token_budget=None, top_k=None, vector_scores=None):
+    """
+    Picks the tables to describe in the prompt for this question.
+
+    Returns None when pruning shouldn't be applied (nothing matched the question),
+    otherwise an ordered list of table names that fits the token budget.
+    """
+    token_budget = SCHEMA_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    top_k = SCHEMA_PROMPT_TOP_K if top_k is None else top_k
+
+    ranked = rank_tables(prepared, question, vector_scores)
+    if not ranked:
+        return None
+
+    seeds = [table for table, _ in ranked[:top_k]]
+    bridges, adjacent = expand_along_foreign_keys(seeds, prepared['neighbors'])
+    candidates = seeds[:1] + bridges + seeds[1:] + adjacent
+
+    selected = []
+    used = 0
+    for table in candidates:
+        cost = prepared['table_tokens'][table]
+        # The best match is always included, even if it alone exceeds the budget
+        if selected and used + cost > token_budget:
+            continue
+        selected.append(table)
+        used += cost
+    return selected
+
+
+def build_schema_context(schema_entry, question):
+    """
+    Returns the schema text to paste into the NL->SQL prompt.
+
+    The whole (memoized) schema is used when it fits SCHEMA_PROMPT_TOKEN_BUDGET or
+    nothing in the question matches a table; otherwise only the best-matching tables
+    plus their foreign-key neighbourhood are formatted.
+    """
+    full_text = get_entry_schema_text(schema_entry)
+    if not schema_entry or SCHEMA_PROMPT_TOKEN_BUDGET <= 0:
+        return full_text
+    if estimate_tokens(full_text) <= SCHEMA_PROMPT_TOKEN_BUDGET:
+        return full_text
+
+    prepared = _get_prepared(schema_entry)
+    vector_scores = None
+    if SCHEMA_VECTOR_WEIGHT > 0:
+        vector_scores = get_schema_index(schema_entry).search([question])[0]
+    tables = select_tables(prepared, question, vector_scores=vector_scores)
+    if not tables:
+        return full_text
+
+    print(f"[SCHEMA RETRIEVAL] Using {len(tables)}/{len(schema_entry['schema']['tables'])} tables: {', '.join(tables)}")
+    return format_schema_for_llm(subset_schema(schema_entry['schema'], tables))
@@ -0,0 +1,49 @@
+import re
+from .cache_utils import TTLCache
+from .text_embedding import tokenize
+
+
+def question_key(question):
+    """
+    Quoted literals, numbers and the set of content words of a question. Rewordings
+    (word order, stopwords such as 'show' or 'list', plurals) share a key, while
+    questions that differ in a filter value ('west' / 'east', 'pending' / 'cancelled')
+    or a number don't, so they are never served each other's SQL.
+    """
+    literals = re.findall(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?", question)
+    return tuple(sorted(literal.lower() for literal in literals)), frozenset(tokenize(question))
+
+
+class SemanticCache:
+    """
+    SQL for rewordings of earlier questions: an exact lookup on question_key()
+    together with the schema version and model, in an LRU cache whose entries
+    expire after ttl_seconds.
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self._cache = TTLCache(max_entries, ttl_seconds)
+
+    def lookup(self, question, schema_version, model):
+        """Returns (sql, matched_question) for an earlier rewording of the question, else None"""
+        match = self._cache.get((question_key(question), schema_version, model))
+        if match is None:
+            return None
+        matched_question, sql = match
+        return sql, matched_question
+
+    def add(self, question, schema_version, model, sql):
+        self._cache.set((question_key(question), schema_version, model), (question, sql))
+
+    def invalidate_version(self, schema_version):
+        """Drops every entry generated against the given schema version"""
+        return self._cache.remove_where(lambda key: key[1] == schema_version)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
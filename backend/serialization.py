@@ -0,0 +1,76 @@
+import json
+import base64
+import decimal
+import datetime
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is used without it
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+# Response shapes for query results:
+#   records - [{"col": value, ...}, ...], one object per row (the default)
+#   compact - {"columns": [...], "rows": [[value, ...], ...]}, column names sent once
+#   columns - {"columns": [...], "data": [[values of column 0], [values of column 1], ...]}
+RESULT_SHAPES = ("records", "compact", "columns")
+
+
+def _default(value):
+    """JSON form of values the encoder doesn't handle natively, matching FastAPI's encoder"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(payload):
+    """Encodes payload as JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def rows_to_records(columns, rows):
+    """One dict per row; SQLAlchemy Rows and plain tuples both iterate as their values"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def rows_to_arrays(rows):
+    return [list(row) for row in rows]
+
+
+def rows_to_columns(columns, rows):
+    if not rows:
+        return [[] for _ in columns]
+    return [list(values) for values in zip(*rows)]
+
+
+def shape_rows(columns, rows, shape="records"):
+    """The JSON-ready body fields for a result in the requested shape"""
+    if shape == "compact":
+        return {"columns": list(columns), "rows": rows_to_arrays(rows)}
+    if shape == "columns":
+        return {"columns": list(columns), "data": rows_to_columns(columns, rows)}
+    return {"results": rows_to_records(columns, rows)}
+
+
+def encode_ndjson_rows(rows):
+    """One JSON array per row, newline-terminated"""
+    if orjson is not None:
+        return b"".join(
+            orjson.dumps(tuple(row), default=_default, option=orjson.OPT_APPEND_NEWLINE) for row in rows
+        )
+    return "".join(json.dumps(list(row), default=_default, separators=(",", ":")) + "\n" for row in rows).encode("utf-8")
@@ -0,0 +1,31 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key, among coroutines on one event loop.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and share its result (or exception). Nothing is cached:
+    once the call finishes, the next caller for the key starts a new one.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.coalesced = 0
+
+    async def do_async(self, key, coro_fn):
+        """
+        Awaits coro_fn() once per key among concurrent callers and returns its result.
+
+        The shared call runs as its own task, so a caller that is cancelled (e.g. its
+        client disconnected) doesn't cancel the request for the others.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
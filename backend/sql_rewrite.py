@@ -0,0 +1,101 @@
+import sqlparse
+from sqlparse import sql as sql_tokens
+from sqlparse import tokens as T
+
+# Top-level clauses that must follow LIMIT, so a LIMIT can't simply be appended
+_AFTER_LIMIT_KEYWORDS = {'FOR', 'LOCK', 'INTO'}
+
+
+def _single_select(sql_query):
+    """The parsed statement if sql_query is exactly one SELECT, else None"""
+    statements = [s for s in sqlparse.parse(sql_query) if s.token_first(skip_cm=True) is not None]
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        return None
+    return statements[0]
+
+
+def _meaningful(tokens):
+    return [token for token in tokens if not token.is_whitespace and token.ttype not in T.Comment
+            and not isinstance(token, sql_tokens.Comment)]
+
+
+def _limit_clause(statement):
+    """
+    Locates the statement's own LIMIT (not one inside a subquery or before a UNION).
+
+    Returns (limit_token, count_token) where count_token holds the row count, or
+    (limit_token, None) when the clause isn't a plain integer count; (None, None)
+    when there is no top-level LIMIT.
+    """
+    tokens = _meaningful(statement.tokens)
+    limit_index = None
+    for index, token in enumerate(tokens):
+        if token.ttype in T.Keyword and token.normalized == 'LIMIT':
+            limit_index = index
+        elif token.ttype in T.Keyword and token.normalized.startswith('UNION'):
+            # A LIMIT before UNION belongs to the first SELECT only
+            limit_index = None
+    if limit_index is None:
+        return None, None
+
+    limit_token = tokens[limit_index]
+    following = tokens[limit_index + 1:]
+    if not following:
+        return limit_token, None
+    first = following[0]
+    if first.ttype in T.Number.Integer:
+        # LIMIT n or LIMIT n OFFSET m
+        return limit_token, first
+    if isinstance(first, sql_tokens.IdentifierList):
+        # LIMIT offset, n
+        parts = _meaningful(first.tokens)
+        if len(parts) == 3 and parts[0].ttype in T.Number.Integer and parts[2].ttype in T.Number.Integer:
+            return limit_token, parts[2]
+    return limit_token, None
+
+
+def has_top_level_limit(statement):
+    """True if a parsed SELECT already ends in its own LIMIT (not one inside a subquery)"""
+    return _limit_clause(statement)[0] is not None
+
+
+def _without_trailing(statement):
+    """Statement text without the trailing semicolon, whitespace and comments"""
+    flat = list(statement.flatten())
+    end = len(flat)
+    while end and (flat[end - 1].is_whitespace or flat[end - 1].ttype in T.Comment
+                   or (flat[end - 1].ttype in T.Punctuation and flat[end - 1].value == ';')):
+        end -= 1
+    return ''.join(token.value for token in flat[:end])
+
+
+def inject_limit(sql_query, limit):
+    """
+    Rewrites a single SELECT so it returns at most `limit` rows.
+
+    An existing top-level LIMIT is kept when it is already at most `limit` and
+    tightened otherwise (its OFFSET is preserved); without one, a LIMIT clause is
+    appended to the statement itself rather than wrapping it in a derived table,
+    so MySQL can still stop scanning as soon as enough rows are produced.
+
+    Returns the rewritten SQL, or None when the statement can't be limited this way
+    (not a single SELECT, or it ends in FOR UPDATE / LOCK IN SHARE MODE / INTO).
+    """
+    limit = int(limit)
+    statement = _single_select(sql_query)
+    if statement is None:
+        return None
+
+    limit_token, count_token = _limit_clause(statement)
+    if limit_token is not None:
+        if count_token is None:
+            # LIMIT with a placeholder or expression: cap it from outside
+            return f"SELECT * FROM ({_without_trailing(statement)}) AS _limited LIMIT {limit}"
+        if int(count_token.value) > limit:
+            count_token.value = str(limit)
+        return _without_trailing(statement)
+
+    if any(token.ttype in T.Keyword and token.normalized in _AFTER_LIMIT_KEYWORDS
+           for token in _meaningful(statement.tokens)):
+        return None
+    return f"{_without_trailing(statement)} LIMIT {limit}"
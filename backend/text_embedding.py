@@ -0,0 +1,72 @@
+import os
+import re
+import zlib
+import numpy as np
+
+# Dimensionality of the hashed text vectors; 128 keeps a 10k-column index scan under a millisecond
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "128"))
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'get', 'give', 'has', 'have',
+    'how', 'i', 'in', 'is', 'it', 'list', 'me', 'many', 'much', 'of', 'on', 'or', 'per',
+    'show', 'the', 'their', 'them', 'there', 'to', 'what', 'when', 'where', 'which', 'who',
+    'with', 'all', 'each', 'every', 'find', 'return', 'display', 'please', 'us', 'we', 'that'
+}
+
+def tokenize(text):
+    """Splits free text or identifiers (snake_case, camelCase) into normalized tokens"""
+    if not text:
+        return []
+    text = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', str(text))
+    tokens = []
+    for token in re.split(r'[^A-Za-z0-9]+', text.lower()):
+        if not token or token in STOPWORDS:
+            continue
+        tokens.append(normalize_token(token))
+    return tokens
+
+
+def normalize_token(token):
+    """Very small plural stemmer so 'orders' matches 'order' and 'categories' matches 'category'"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+
+def _bucket(feature):
+    """Deterministic (process-independent) hash bucket and sign for a feature string"""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % EMBEDDING_DIM, 1.0 if (h >> 31) & 1 else -1.0
+
+
+def embed_texts(texts):
+    """
+    Embeds texts as L2-normalized float32 vectors using feature hashing.
+
+    Each token contributes a whole-word feature plus its character trigrams, so
+    close spellings ('orderdate' / 'order_date', 'cust' / 'customer') land near
+    each other. No model or network access is needed and the output is
+    stable across processes, so vectors can be persisted. Returns an array of
+    shape (len(texts), EMBEDDING_DIM).
+    """
+    matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for i, text in enumerate(texts):
+        row = matrix[i]
+        for token in tokenize(text):
+            bucket, sign = _bucket(token)
+            row[bucket] += sign
+            padded = f"#{token}#"
+            for j in range(len(padded) - 2):
+                bucket, sign = _bucket(padded[j:j + 3])
+                row[bucket] += 0.5 * sign
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def embed_text(text):
+    """Embeds a single text; see embed_texts()"""
+    return embed_texts([text])[0]
@@ -1,6 +1,19 @@
 import axios from 'axios';
 
-const API_BASE_URL = import.meta.env.VITE_API_URL;
+export const API_BASE_URL = import.meta.env.VITE_API_URL;
+
+// Returned by /connect_database; the backend routes each request to this connection's engine
+const CONNECTION_ID_KEY = 'connectionId';
+
+export const setConnectionId = (connectionId?: string) => {
+  if (connectionId) {
+    sessionStorage.setItem(CONNECTION_ID_KEY, connectionId);
+  } else {
+    sessionStorage.removeItem(CONNECTION_ID_KEY);
+  }
+};
+
+export const getConnectionId = () => sessionStorage.getItem(CONNECTION_ID_KEY);
 
 export const apiClient = axios.create({
   baseURL: API_BASE_URL,
@@ -9,4 +22,12 @@ export const apiClient = axios.create({
   },
 });
 
-export default apiClient;
\ No newline at end of file
+apiClient.interceptors.request.use((config) => {
+  const connectionId = getConnectionId();
+  if (connectionId) {
+    config.headers['X-Connection-Id'] = connectionId;
+  }
+  return config;
+});
+
+export default apiClient;
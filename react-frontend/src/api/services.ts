@@ -1,4 +1,4 @@
-import apiClient from './client';
+import apiClient, { API_BASE_URL, getConnectionId, setConnectionId } from './client';
 
 export interface DatabaseCredentials {
   host: string;
@@ -14,6 +14,7 @@ export interface GenerateSQLRequest {
 
 export interface GenerateSQLResponse {
   sql_query?: string;
+  cache?: 'hit' | 'semantic_hit' | 'miss' | 'bypass';
   error?: string;
 }
 
@@ -25,16 +26,66 @@ export const queryService = {
     return response.data;
   },
 
-  executeSQL: async (sqlQuery: string) => {
+  executeSQL: async (sqlQuery: string, preview = false) => {
     const response = await apiClient.post('/execute_sql', {
       query: sqlQuery,
+      preview,
     });
     return response.data;
   },
 
-  downloadCSV: async (sqlQuery: string) => {
+  // Reads every row from the NDJSON stream of /execute_sql, calling onRows as batches arrive, and
+  // returns the result_id the server stored the rows under (if it could keep them).
+  // Uses fetch because axios can't hand over a response body before it has fully arrived.
+  streamSQL: async (sqlQuery: string, onRows: (rows: Record<string, any>[]) => void): Promise<string | undefined> => {
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    const connectionId = getConnectionId();
+    if (connectionId) {
+      headers['X-Connection-Id'] = connectionId;
+    }
+    const response = await fetch(`${API_BASE_URL}/execute_sql`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({ query: sqlQuery, stream: true, keep_result: true }),
+    });
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => null);
+      throw new Error(body?.detail || 'Failed to fetch all rows');
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let columns: string[] = [];
+    let resultId: string | undefined;
+    let buffered = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffered += value;
+      const lines = buffered.split('\n');
+      buffered = lines.pop() ?? '';
+      const rows: Record<string, any>[] = [];
+      for (const line of lines) {
+        if (!line) continue;
+        const parsed = JSON.parse(line);
+        if (Array.isArray(parsed)) {
+          rows.push(Object.fromEntries(columns.map((column, i) => [column, parsed[i]])));
+        } else if (parsed.columns) {
+          columns = parsed.columns;
+        } else if (parsed.error) {
+          throw new Error(parsed.error);
+        } else if (parsed.result_id) {
+          resultId = parsed.result_id;
+        }
+      }
+      if (rows.length > 0) onRows(rows);
+    }
+    return resultId;
+  },
+
+  downloadCSV: async (sqlQuery: string, resultId?: string) => {
     const response = await apiClient.post('/download_csv', {
       query: sqlQuery,
+      result_id: resultId,
     }, {
       responseType: 'blob',
     });
@@ -49,6 +100,9 @@ export const queryService = {
       database,
       port,
     });
+    if (response.data.status === 'success') {
+      setConnectionId(response.data.connection_id);
+    }
     return response.data;
   },
 
@@ -57,11 +111,12 @@ export const queryService = {
     return response.data;
   },
 
-  generateGraph: async (sqlQuery: string, chartType: string, chartName?: string) => {
+  generateGraph: async (sqlQuery: string, chartType: string, chartName?: string, resultId?: string) => {
     const response = await apiClient.post('/generate_graph', {
       sql_query: sqlQuery,
       chart_type: chartType,
       chart_name: chartName,
+      result_id: resultId,
     });
     return response.data;
   },
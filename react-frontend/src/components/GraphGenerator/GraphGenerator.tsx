@@ -17,12 +17,14 @@ import { queryService } from '../../api/services';
 interface GraphGeneratorProps {
   sqlQuery: string;
   hasResults: boolean;
+  resultId?: string;
 }
 
-const GraphGenerator = ({ sqlQuery, hasResults }: GraphGeneratorProps) => {
+const GraphGenerator = ({ sqlQuery, hasResults, resultId }: GraphGeneratorProps) => {
   const [chartType, setChartType] = useState('bar');
   const [graphImage, setGraphImage] = useState('');
   const [insights, setInsights] = useState('');
+  const [downsampled, setDownsampled] = useState(false);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
 
@@ -36,11 +38,14 @@ const GraphGenerator = ({ sqlQuery, hasResults }: GraphGeneratorProps) => {
     setError('');
     setGraphImage('');
     setInsights('');
+    setDownsampled(false);
 
     try {
       const response = await queryService.generateGraph(
         sqlQuery,
-        chartType
+        chartType,
+        undefined,
+        resultId
       );
 
       if (response.error) {
@@ -48,6 +53,7 @@ const GraphGenerator = ({ sqlQuery, hasResults }: GraphGeneratorProps) => {
       } else if (response.image_base64) {
         setGraphImage(response.image_base64);
         setInsights(response.insights || '');
+        setDownsampled(Boolean(response.downsampled));
       } else {
         setError('Failed to generate graph');
       }
@@ -188,6 +194,12 @@ const GraphGenerator = ({ sqlQuery, hasResults }: GraphGeneratorProps) => {
           )}
         </Box>
 
+        {graphImage && downsampled && (
+          <Typography sx={{ fontSize: '12px', color: '#666', marginTop: 1 }}>
+            Large result: the chart shows aggregated or downsampled rows; insights use the full result.
+          </Typography>
+        )}
+
         {/* Key Insights Component */}
         {insights && <KeyInsights insights={insights} />}
       </Box>
@@ -12,6 +12,7 @@ import {
   CircularProgress,
   Alert,
   IconButton,
+  Button,
 } from '@mui/material';
 import { MdDownload } from 'react-icons/md';
 import { queryService } from '../../api/services';
@@ -19,7 +20,7 @@ import { queryService } from '../../api/services';
 interface QueryExecutorProps {
   sqlQuery: string;
   onExecute?: (execute: () => Promise<void>) => void;
-  onResultsChange?: (hasResults: boolean) => void;
+  onResultsChange?: (hasResults: boolean, resultId?: string) => void;
 }
 
 const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorProps) => {
@@ -27,6 +28,11 @@ const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorPr
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [downloading, setDownloading] = useState(false);
+  const [resultId, setResultId] = useState<string | undefined>(undefined);
+  const [costEstimate, setCostEstimate] = useState<any>(null);
+  // Set while only the preview rows are shown and the query returned more
+  const [hasMore, setHasMore] = useState(false);
+  const [loadingAll, setLoadingAll] = useState(false);
 
   const handleExecuteSQL = async () => {
     if (!sqlQuery.trim()) {
@@ -37,9 +43,13 @@ const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorPr
     setLoading(true);
     setError('');
     setResults(null);
+    setResultId(undefined);
+    setCostEstimate(null);
+    setHasMore(false);
 
     try {
-      const response = await queryService.executeSQL(sqlQuery);
+      // Preview first: the query runs with a LIMIT, and the rest is only fetched on request
+      const response = await queryService.executeSQL(sqlQuery, true);
 
       if (response.error) {
         setError(response.error);
@@ -47,7 +57,10 @@ const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorPr
         if (onResultsChange) onResultsChange(false);
       } else if (response.results) {
         setResults(response.results);
-        if (onResultsChange) onResultsChange(response.results.length > 0);
+        setResultId(response.result_id || undefined);
+        setCostEstimate(response.cost_estimate || null);
+        setHasMore(Boolean(response.has_more));
+        if (onResultsChange) onResultsChange(response.results.length > 0, response.result_id || undefined);
       } else {
         setError('No results returned');
         setResults(null);
@@ -62,6 +75,27 @@ const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorPr
     }
   };
 
+  const handleLoadAll = async () => {
+    setLoadingAll(true);
+    setError('');
+    try {
+      let allRows: any[] = [];
+      const fullResultId = await queryService.streamSQL(sqlQuery, (rows) => {
+        allRows = allRows.concat(rows);
+        setResults(allRows);
+      });
+      setResults(allRows);
+      setHasMore(false);
+      // The server kept the full result, so the CSV download and graph reuse it
+      setResultId(fullResultId);
+      if (onResultsChange) onResultsChange(allRows.length > 0, fullResultId);
+    } catch (err: any) {
+      setError(err.message || 'Failed to fetch all rows');
+    } finally {
+      setLoadingAll(false);
+    }
+  };
+
   // Expose the execute function to parent component
   useEffect(() => {
     if (onExecute) {
@@ -76,7 +110,7 @@ const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorPr
 
     setDownloading(true);
     try {
-      const blob = await queryService.downloadCSV(sqlQuery);
+      const blob = await queryService.downloadCSV(sqlQuery, resultId);
       
       // Create a download link
       const url = window.URL.createObjectURL(new Blob([blob]));
@@ -243,6 +277,32 @@ const QueryExecutor = ({ sqlQuery, onExecute, onResultsChange }: QueryExecutorPr
         </Alert>
       )}
 
+      {/* Cost guard notice: results were capped, or the query was expensive */}
+      {costEstimate && (costEstimate.action === 'limited' || costEstimate.over_budget) && (
+        <Alert severity={costEstimate.action === 'limited' ? 'info' : 'warning'} sx={{ marginBottom: 2, flexShrink: 0 }}>
+          {costEstimate.action === 'limited'
+            ? `Showing the first ${costEstimate.limit} rows: the full query would examine about ${costEstimate.rows_examined.toLocaleString()} rows.`
+            : `Expensive query: about ${costEstimate.rows_examined.toLocaleString()} rows examined.`}
+        </Alert>
+      )}
+
+      {/* Preview notice: only the first rows were fetched */}
+      {hasMore && results && (
+        <Alert
+          severity="info"
+          sx={{ marginBottom: 2, flexShrink: 0 }}
+          action={
+            <Button color="inherit" size="small" onClick={handleLoadAll} disabled={loadingAll}>
+              {loadingAll ? <CircularProgress size={16} /> : 'Load all rows'}
+            </Button>
+          }
+        >
+          {loadingAll
+            ? `Loading all rows (${results.length.toLocaleString()} so far)...`
+            : `Showing the first ${results.length.toLocaleString()} rows.`}
+        </Alert>
+      )}
+
       {/* Results Section */}
       <Box sx={{ flex: 1, display: 'flex', flexDirection: 'column' }}>
         <Paper
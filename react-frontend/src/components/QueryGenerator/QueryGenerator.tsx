@@ -13,6 +13,7 @@ const QueryGenerator = () => {
   const [error, setError] = useState('');
   const [executingQuery, setExecutingQuery] = useState(false);
   const [hasResults, setHasResults] = useState(false);
+  const [resultId, setResultId] = useState<string | undefined>(undefined);
   const [copied, setCopied] = useState(false);
   const executeQueryRef = useRef<(() => Promise<void>) | null>(null);
 
@@ -268,7 +269,10 @@ const QueryGenerator = () => {
           onExecute={(execute) => {
             executeQueryRef.current = execute;
           }}
-          onResultsChange={(hasData) => setHasResults(hasData)}
+          onResultsChange={(hasData, id) => {
+            setHasResults(hasData);
+            setResultId(id);
+          }}
         />
       </Box>
 
@@ -282,6 +286,7 @@ const QueryGenerator = () => {
         <GraphGenerator 
           sqlQuery={generatedQuery}
           hasResults={hasResults}
+          resultId={resultId}
         />
       </Box>
     </Box>
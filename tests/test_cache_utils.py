@@ -0,0 +1,76 @@
+import threading
+from backend import cache_utils
+from backend.cache_utils import TTLCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_get_set_and_counters():
+    cache = TTLCache(10, 60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b", "default") == "default"
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_utils, "time", clock)
+    cache = TTLCache(10, 60)
+    cache.set("a", 1)
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_zero_size_disables_the_cache():
+    cache = TTLCache(0, 60)
+    cache.set("a", 1)
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_pop_remove_where_and_clear():
+    cache = TTLCache(10, 60)
+    for key in [("x", 1), ("x", 2), ("y", 1)]:
+        cache.set(key, key[1])
+    assert cache.pop(("y", 1)) == 1 and cache.pop(("y", 1), "gone") == "gone"
+    assert cache.remove_where(lambda key: key[0] == "x") == 2
+    cache.set("z", 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_concurrent_writers_respect_the_bound():
+    cache = TTLCache(50, 60)
+
+    def write(start):
+        for i in range(start, start + 500):
+            cache.set(i, i)
+            cache.get(i - 1)
+
+    threads = [threading.Thread(target=write, args=(n * 1000,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache) == 50
@@ -0,0 +1,121 @@
+import json
+from types import SimpleNamespace
+import pytest
+from backend import cost_guard
+
+
+class _FakeConnection:
+    def __init__(self, plan):
+        self.plan = plan
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+        return SimpleNamespace(scalar=lambda: json.dumps(self.plan))
+
+
+def _engine(plan):
+    connection = _FakeConnection(plan)
+    return SimpleNamespace(dialect=SimpleNamespace(name="mysql"), connect=lambda: connection), connection
+
+
+def _scan_plan(rows, blocking=False):
+    block = {
+        'cost_info': {'query_cost': str(rows / 10)},
+        'table': {'table_name': 'orders', 'access_type': 'ALL', 'rows_examined_per_scan': rows}
+    }
+    if blocking:
+        block = {'cost_info': block['cost_info'], 'grouping_operation': {'table': block['table']}}
+    return {'query_block': block}
+
+
+SCHEMA = {'table_metadata': {'orders': {'estimated_rows': 5_000_000}}}
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MAX_ROWS_EXAMINED", 1000)
+    monkeypatch.setattr(cost_guard, "COST_GUARD_ROW_LIMIT", 50)
+    monkeypatch.setattr(cost_guard, "COST_GUARD_FULL_SCAN_ROWS", 1000)
+
+
+def test_off_mode_skips_explain(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "off")
+    engine, connection = _engine(_scan_plan(5_000_000))
+    assert cost_guard.guard_query(engine, "SELECT * FROM orders", SCHEMA) == ("SELECT * FROM orders", None, None)
+    assert connection.statements == []
+
+
+def test_non_mysql_and_non_select_are_not_explained(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "reject")
+    engine, connection = _engine(_scan_plan(5_000_000))
+    sqlite = SimpleNamespace(dialect=SimpleNamespace(name="sqlite"))
+    assert cost_guard.guard_query(sqlite, "SELECT * FROM orders", SCHEMA)[2] is None
+    assert cost_guard.guard_query(engine, "DELETE FROM orders", SCHEMA) == ("DELETE FROM orders", None, None)
+    assert connection.statements == []
+
+
+def test_warn_mode_runs_over_budget_query(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "warn")
+    engine, _ = _engine(_scan_plan(5_000_000))
+    sql, estimate, error = cost_guard.guard_query(engine, "SELECT * FROM orders", SCHEMA)
+    assert sql == "SELECT * FROM orders" and error is None
+    assert estimate['over_budget'] and estimate['action'] == "none"
+    assert estimate['full_scans'][0]['table'] == "orders"
+
+
+def test_within_budget_passes_in_reject_mode(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "reject")
+    engine, _ = _engine(_scan_plan(500))
+    sql, estimate, error = cost_guard.guard_query(engine, "SELECT * FROM orders", SCHEMA)
+    assert error is None and not estimate['over_budget']
+
+
+def test_reject_mode_refuses_over_budget_query(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "reject")
+    engine, _ = _engine(_scan_plan(5_000_000))
+    sql, estimate, error = cost_guard.guard_query(engine, "SELECT * FROM orders", SCHEMA)
+    assert estimate['action'] == "rejected"
+    assert "Query rejected" in error and "orders" in error
+
+
+def test_limit_mode_caps_a_streaming_plan(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "limit")
+    engine, _ = _engine(_scan_plan(5_000_000))
+    sql, estimate, error = cost_guard.guard_query(engine, "SELECT * FROM orders", SCHEMA)
+    assert error is None
+    assert sql.rstrip().upper().endswith("LIMIT 50")
+    assert estimate['action'] == "limited" and estimate['limit'] == 50
+
+
+def test_limit_mode_rejects_a_blocking_plan(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "limit")
+    engine, _ = _engine(_scan_plan(5_000_000, blocking=True))
+    sql, estimate, error = cost_guard.guard_query(
+        engine, "SELECT customer, COUNT(*) FROM orders GROUP BY customer", SCHEMA
+    )
+    assert error is not None and estimate['action'] == "rejected"
+    assert sql == "SELECT customer, COUNT(*) FROM orders GROUP BY customer"
+
+
+def test_existing_limit_on_streaming_plan_is_within_budget(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "reject")
+    engine, _ = _engine(_scan_plan(5_000_000))
+    sql, estimate, error = cost_guard.guard_query(engine, "SELECT * FROM orders LIMIT 10", SCHEMA)
+    assert error is None and not estimate['over_budget']
+
+
+def test_explain_failure_lets_the_query_through(monkeypatch, budget):
+    monkeypatch.setattr(cost_guard, "COST_GUARD_MODE", "reject")
+
+    def broken_connect():
+        raise RuntimeError("no such table")
+
+    engine = SimpleNamespace(dialect=SimpleNamespace(name="mysql"), connect=broken_connect)
+    assert cost_guard.guard_query(engine, "SELECT * FROM missing", SCHEMA) == ("SELECT * FROM missing", None, None)
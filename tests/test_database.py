@@ -0,0 +1,105 @@
+import contextvars
+from collections import OrderedDict
+import pytest
+from fastapi.testclient import TestClient
+from backend import database
+from backend.app import app
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch, tmp_path):
+    for name in ("MYSQL_PUBLIC_URL", "MYSQL_URL", "MYSQL_HOST", "MYSQL_USER", "MYSQL_PASSWORD", "MYSQL_DATABASE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(database, "_engines", OrderedDict())
+    monkeypatch.setattr(database, "_engine_last_used", {})
+    monkeypatch.setattr(database, "_default_connection_id", None)
+    yield tmp_path
+    database.dispose_engines()
+
+
+def _url(tmp_path, name):
+    return f"sqlite:///{tmp_path / name}.db"
+
+
+def _in_context(fn, *args):
+    """Runs fn in a fresh context, as each request does"""
+    return contextvars.Context().run(fn, *args)
+
+
+def test_same_credentials_share_an_engine(registry):
+    first = database.register_engine(_url(registry, "shop"))
+    assert database.register_engine(_url(registry, "shop")) == first
+    assert database.register_engine(_url(registry, "crm")) != first
+    assert database.engine_stats()['engines'] == 2
+
+
+def test_connection_id_depends_on_the_password_without_revealing_it():
+    one = database.credential_fingerprint("mysql+mysqlconnector://app:secret@db:3306/shop")
+    other = database.credential_fingerprint("mysql+mysqlconnector://app:other@db:3306/shop")
+    assert one != other
+    assert "secret" not in one
+
+
+def test_each_context_is_routed_to_its_own_engine(registry):
+    shop = database.register_engine(_url(registry, "shop"))
+    crm = database.register_engine(_url(registry, "crm"))
+
+    def database_for(connection_id):
+        database.use_connection(connection_id)
+        return database.get_engine().url.database
+
+    assert _in_context(database_for, shop).endswith("shop.db")
+    assert _in_context(database_for, crm).endswith("crm.db")
+
+
+def test_without_a_connection_id_the_default_engine_is_used(registry, monkeypatch):
+    assert _in_context(database.get_engine) is None
+    monkeypatch.setenv("MYSQL_URL", _url(registry, "default"))
+    assert _in_context(lambda: database.get_engine().url.database).endswith("default.db")
+
+
+def test_unknown_connection_id_does_not_fall_back_to_the_default(registry, monkeypatch):
+    monkeypatch.setenv("MYSQL_URL", _url(registry, "default"))
+    database.load_from_env()
+
+    def engine_for_unknown():
+        database.use_connection("0" * 32)
+        return database.get_engine()
+
+    assert _in_context(engine_for_unknown) is None
+
+
+def test_least_recently_used_engines_are_disposed_but_not_the_default(registry, monkeypatch):
+    monkeypatch.setattr(database, "MAX_ENGINES", 3)
+    monkeypatch.setenv("MYSQL_URL", _url(registry, "default"))
+    database.load_from_env()
+    default = database._default_connection_id
+    first = database.register_engine(_url(registry, "a"))
+    second = database.register_engine(_url(registry, "b"))
+    third = database.register_engine(_url(registry, "c"))
+    assert first not in database._engines
+    assert {default, second, third} <= set(database._engines)
+
+
+def test_idle_engines_are_disposed(registry, monkeypatch):
+    idle = database.register_engine(_url(registry, "idle"))
+    database._engine_last_used[idle] -= database.ENGINE_IDLE_SECONDS
+    database.register_engine(_url(registry, "busy"))
+    assert idle not in database._engines
+
+
+def test_failed_login_keeps_no_engine(registry, monkeypatch):
+    kept = database.register_engine(_url(registry, "shop"))
+    # A database file in a directory that doesn't exist can't be opened
+    monkeypatch.setattr(database, "build_database_url", lambda *args: _url(registry / "missing", "crm"))
+    before = list(database._engines)
+    assert _in_context(database.set_database_credentials, "db", "app", "wrong", "crm") is None
+    assert list(database._engines) == before == [kept]
+
+
+def test_failed_connect_database_keeps_no_engine(registry, monkeypatch):
+    monkeypatch.setattr(database, "build_database_url", lambda *args: _url(registry / "missing", "crm"))
+    credentials = {"host": "db", "user": "app", "password": "wrong", "database": "crm"}
+    response = TestClient(app).post("/connect_database", json=credentials).json()
+    assert response["status"] == "error"
+    assert len(database._engines) == 0
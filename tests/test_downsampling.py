@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from backend.downsampling import lttb_indices, minmax_indices, downsample_line, thin_scatter
+from backend.chart_data import StreamingReducer, summary_sql, summarize_result
+
+
+def _series(n=10_000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.float64)
+    y = np.sin(x / 200) + rng.normal(0, 0.1, n)
+    return x, y
+
+
+def test_lttb_keeps_endpoints_and_count():
+    x, y = _series()
+    indices = lttb_indices(x, y, 500)
+    assert len(indices) == 500
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_returns_everything_when_small():
+    x, y = _series(50)
+    assert np.array_equal(lttb_indices(x, y, 100), np.arange(50))
+
+
+def test_minmax_keeps_the_extremes():
+    x, y = _series()
+    y[1234], y[8765] = 50.0, -50.0
+    indices = minmax_indices(y, 100)
+    assert 1234 in indices and 8765 in indices
+    assert len(indices) <= 2 * 100 + 2
+
+
+def test_downsample_line_bounds_points():
+    x, y = _series()
+    data = pd.DataFrame({"x": x, "a": y, "b": -y})
+    assert len(downsample_line(data, "x", ["a"], 300)) == 300
+    assert len(downsample_line(data, "x", ["a", "b"], 300)) <= 302
+    small = data.iloc[:100]
+    assert downsample_line(small, "x", ["a"], 300) is small
+
+
+def test_thin_scatter_bounds_points_and_keeps_an_outlier():
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame({"x": rng.normal(size=50_000), "y": rng.normal(size=50_000)})
+    data.loc[len(data)] = [100.0, 100.0]
+    thinned = thin_scatter(data, "x", "y", 2000)
+    assert len(thinned) <= 2000
+    assert (thinned["x"] == 100.0).any()
+
+
+def test_streaming_reducer_stays_bounded():
+    plan = {"chart_type": "line", "x": "x", "y": ["y"]}
+    reducer = StreamingReducer(plan, max_points=500)
+    x, y = _series(50_000)
+    y[30_000] = 99.0
+    for start in range(0, len(x), 5000):
+        reducer.add(["x", "y"], list(zip(x[start:start + 5000], y[start:start + 5000])))
+        assert reducer._buffered <= 4 * 500 + 5000
+    result = reducer.result()
+    assert reducer.rows_seen == 50_000
+    assert result["y"].max() == 99.0
+
+
+def test_summary_describes_the_full_result():
+    sample = pd.DataFrame({"d": ["a", "b", "c", "d"], "v": [1, 2, 3, 4]})
+    sql = summary_sql("SELECT d, v FROM big;", ["v"], lambda name: f"`{name}`")
+    assert sql == "SELECT COUNT(*), COUNT(`v`), AVG(`v`), MIN(`v`), MAX(`v`) FROM (SELECT d, v FROM big) AS _summary"
+    summary = summarize_result(sample, ["v"], [20000, 20000, 9999.5, 0, 19999])
+    assert summary["row_count"] == 20000
+    assert summary["columns"] == ["d", "v"]
+    assert "19999" in summary["summary_stats"] and "9999.5" in summary["summary_stats"]
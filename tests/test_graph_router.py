@@ -0,0 +1,31 @@
+import asyncio
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from backend import database
+from backend.routers import graph as graph_router
+
+
+@pytest.fixture
+def connection(tmp_path):
+    url = f"sqlite:///{tmp_path / 'shop.db'}"
+    create_engine(url).dispose()
+    database.use_connection(database.register_engine(url))
+
+
+def test_reduction_rejected_by_the_cost_guard_charts_the_first_rows(connection, monkeypatch):
+    async def reject(sql_query):
+        raise HTTPException(status_code=422, detail="Query is over the cost budget.")
+
+    monkeypatch.setattr(graph_router, "check_query_cost", reject)
+    monkeypatch.setattr(graph_router, "GRAPH_MAX_ROWS", 3)
+    # A bar chart's aggregation and a line chart's streamed projection are both pushed down
+    for chart_type, sample in [
+        ("bar", pd.DataFrame({"region": list("abcdab"), "total": range(6)})),
+        ("line", pd.DataFrame({"day": range(6), "total": range(6)})),
+    ]:
+        _, strategy = graph_router.plan_reduction(sample, chart_type)
+        assert strategy is not None
+        reduced = asyncio.run(graph_router.reduce_large_result(None, "SELECT * FROM orders", sample, chart_type))
+        assert reduced.equals(sample.iloc[:3])
@@ -0,0 +1,89 @@
+import time
+import asyncio
+from unittest import mock
+import pytest
+from backend import query_control
+from backend.query_control import stream_cancellable, kill_query, QueryCancelled
+
+
+def _slow_stream(delays):
+    """stream_query stand-in: registers a MySQL thread id, then yields one batch per delay"""
+    query_control._running_query.get().attach("engine", 42)
+
+    def batches():
+        for delay in delays:
+            time.sleep(delay)
+            yield [(delay,)]
+
+    return ["value"], batches()
+
+
+@pytest.fixture
+def kills():
+    killed = []
+    with mock.patch.object(query_control, "kill_query", lambda engine, thread_id: killed.append(thread_id)):
+        yield killed
+
+
+def test_stream_completes_within_the_limit(kills):
+    async def run():
+        (columns, batches), status = await stream_cancellable(None, _slow_stream, [0, 0], timeout=5)
+        return columns, [batch async for batch in batches], status
+
+    columns, batches, status = asyncio.run(run())
+    assert (columns, batches, status) == (["value"], [[(0,)], [(0,)]], "ok")
+    assert kills == []
+
+
+def test_stream_longer_than_the_limit_runs_while_batches_keep_coming(kills):
+    async def run():
+        (_, batches), status = await stream_cancellable(None, _slow_stream, [0.15] * 4, timeout=0.3)
+        return [batch async for batch in batches], status
+
+    batches, status = asyncio.run(run())
+    assert (len(batches), status) == (4, "ok")
+    assert kills == []
+
+
+def test_stream_is_killed_when_a_batch_stalls_past_the_limit(kills):
+    async def run():
+        (columns, batches), status = await stream_cancellable(None, _slow_stream, [0, 2], timeout=0.3)
+        received = []
+        with pytest.raises(QueryCancelled, match="timeout"):
+            async for batch in batches:
+                received.append(batch)
+        return received
+
+    assert asyncio.run(run()) == [[(0,)]]
+    assert kills == [42]
+
+
+def test_stream_is_killed_when_the_client_disconnects(kills, monkeypatch):
+    monkeypatch.setattr(query_control, "DISCONNECT_POLL_SECONDS", 0.05)
+
+    class Request:
+        disconnect_at = time.monotonic() + 0.3
+
+        async def is_disconnected(self):
+            return time.monotonic() >= self.disconnect_at
+
+    async def run():
+        (_, batches), status = await stream_cancellable(Request(), _slow_stream, [0, 2], timeout=5)
+        assert status == "ok"
+        with pytest.raises(QueryCancelled, match="disconnected"):
+            async for _ in batches:
+                pass
+
+    asyncio.run(run())
+    assert kills == [42]
+
+
+def test_kill_query_uses_a_connection_outside_the_pool():
+    engine = mock.MagicMock()
+    engine.dialect.create_connect_args.return_value = (["arg"], {"user": "u"})
+    kill_query(engine, 7)
+    engine.connect.assert_not_called()
+    engine.dialect.connect.assert_called_once_with("arg", user="u")
+    side_connection = engine.dialect.connect.return_value
+    side_connection.cursor.return_value.execute.assert_called_once_with("KILL QUERY 7")
+    side_connection.close.assert_called_once()
@@ -0,0 +1,143 @@
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from backend import database, query_generator, query_control
+from backend.app import app
+from backend.result_cache import result_cache
+from backend.result_store import result_store
+from backend.query_control import QueryCancelled
+from backend.routers import query as query_router
+
+
+@pytest.fixture
+def client(tmp_path):
+    url = f"sqlite:///{tmp_path / 'shop.db'}"
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (id INTEGER, total INTEGER)"))
+        connection.execute(text("INSERT INTO orders VALUES " + ", ".join(f"({i}, {i * 10})" for i in range(20))))
+    engine.dispose()
+    connection_id = database.register_engine(url)
+    result_cache.clear()
+    result_store.clear()
+    # Not entered as a context manager, so the render processes aren't started
+    yield TestClient(app, headers={"X-Connection-Id": connection_id})
+    result_cache.clear()
+    result_store.clear()
+
+
+@pytest.fixture
+def row_limit(monkeypatch):
+    def guard(engine, sql_query, schema):
+        return f"{sql_query} LIMIT 5", {'action': "limited", 'limit': 5}, None
+
+    monkeypatch.setattr(query_router, "guard_query", guard)
+
+
+def test_limited_run_is_not_stored_or_cached(client, row_limit):
+    query = {"query": "SELECT id, total FROM orders"}
+    first = client.post("/execute_sql", json=query).json()
+    assert len(first["results"]) == 5
+    assert first["cost_estimate"]["action"] == "limited"
+    assert first.get("result_id") is None
+    assert len(result_cache._entries) == 0 and len(result_store._entries) == 0
+
+    again = client.post("/execute_sql", json=query).json()
+    assert again["result_cache"] != "hit"
+    assert again["cost_estimate"]["action"] == "limited"
+
+
+def _cache_a_select(client):
+    client.post("/execute_sql", json={"query": "SELECT id FROM orders"})
+    assert client.post("/execute_sql", json={"query": "SELECT id FROM orders"}).json()["result_cache"] == "hit"
+
+
+def _select_is_cached(client):
+    return client.post("/execute_sql", json={"query": "SELECT id FROM orders"}).json()["result_cache"] == "hit"
+
+
+def test_write_discards_cached_results(client):
+    _cache_a_select(client)
+    client.post("/execute_sql", json={"query": "DELETE FROM orders WHERE id = 1"})
+    assert not _select_is_cached(client)
+
+
+def test_write_through_preview_discards_cached_results(client):
+    _cache_a_select(client)
+    client.post("/execute_sql", json={"query": "DELETE FROM orders WHERE id = 1", "preview": True})
+    assert not _select_is_cached(client)
+
+
+def test_write_through_stream_discards_cached_results(client):
+    _cache_a_select(client)
+    client.post("/execute_sql", json={"query": "DELETE FROM orders WHERE id = 1", "stream": True})
+    assert not _select_is_cached(client)
+
+
+def test_write_through_pagination_discards_cached_results(client):
+    _cache_a_select(client)
+    # Pagination only runs statements that start with a SELECT
+    client.post("/execute_sql", json={"query": "SELECT id FROM orders; DELETE FROM orders", "page_size": 5})
+    assert not _select_is_cached(client)
+
+
+def test_reads_keep_cached_results(client):
+    _cache_a_select(client)
+    client.post("/execute_sql", json={"query": "SELECT total FROM orders", "preview": True})
+    client.post("/execute_sql", json={"query": "SELECT total FROM orders", "page_size": 5})
+    assert _select_is_cached(client)
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_kept_stream_is_stored(client, monkeypatch):
+    monkeypatch.setattr(query_generator, "STREAM_BATCH_SIZE", 6)
+    lines = _ndjson(client.post("/execute_sql", json={
+        "query": "SELECT id, total FROM orders", "stream": True, "keep_result": True
+    }))
+    assert lines[-1]["row_count"] == 20
+    csv_response = client.post("/download_csv", json={"query": "SELECT id, total FROM orders", "result_id": lines[-1]["result_id"]})
+    assert csv_response.text.splitlines()[1:4] == ["0,0", "1,10", "2,20"]
+    assert len(csv_response.text.splitlines()) == 21
+
+
+def test_stream_larger_than_the_store_is_not_kept(client, monkeypatch):
+    monkeypatch.setattr(query_generator, "STREAM_BATCH_SIZE", 6)
+    monkeypatch.setattr(result_store, "memory_bytes", 100)
+    monkeypatch.setattr(result_store, "directory", "")
+    lines = _ndjson(client.post("/execute_sql", json={
+        "query": "SELECT id, total FROM orders", "stream": True, "keep_result": True
+    }))
+    assert lines[-1] == {"row_count": 20, "result_id": None}
+    assert len(result_store._entries) == 0
+
+
+@pytest.fixture
+def stalled_stream(monkeypatch):
+    """stream_query stand-in whose second batch never arrives within the idle timeout"""
+    def stream(sql_query, batch_size=None):
+        def batches():
+            yield [(1, 10), (2, 20)]
+            time.sleep(1)
+            yield [(3, 30)]
+
+        return ["id", "total"], batches()
+
+    monkeypatch.setattr(query_router, "stream_query", stream)
+    monkeypatch.setattr(query_control, "STREAM_IDLE_TIMEOUT_SECONDS", 0.2)
+
+
+def test_stalled_stream_ends_with_an_error_line(client, stalled_stream):
+    lines = _ndjson(client.post("/execute_sql", json={"query": "SELECT id, total FROM orders", "stream": True}))
+    assert lines[1:3] == [[1, 10], [2, 20]]
+    assert lines[-1]["row_count"] == 2
+    assert "cancelled" in lines[-1]["error"]
+
+
+def test_stalled_download_is_aborted(client, stalled_stream):
+    with pytest.raises(QueryCancelled):
+        client.post("/download_csv", json={"query": "SELECT id, total FROM orders"})
@@ -0,0 +1,39 @@
+from backend.result_cache import ResultCache, is_write
+
+SHOP = ('db.example:3306', 'shop')
+OTHER = ('db.example:3306', 'other')
+
+
+def _cache(versions):
+    return ResultCache(100, 60, 3600, lambda: {table: {'updated': v} for table, v in versions.items()})
+
+
+def test_is_write():
+    assert not is_write("SELECT * FROM orders")
+    assert not is_write("-- totals\nSELECT COUNT(*) FROM orders;")
+    assert is_write("UPDATE orders SET status = 'shipped'")
+    assert is_write("SELECT 1; DELETE FROM orders")
+    assert is_write("ALTER TABLE orders ADD COLUMN note TEXT")
+
+
+def test_discard_connection_drops_only_that_connections_results():
+    versions = {'orders': '2024-01-01 00:00:00'}
+    cache = _cache(versions)
+    for connection in (SHOP, OTHER):
+        cache.add("SELECT * FROM orders", connection, f"result-{connection[1]}", cache.dependencies("SELECT * FROM orders", connection))
+    assert cache.lookup("SELECT * FROM orders", SHOP) == ("result-shop", "hit")
+
+    cache.discard_connection(SHOP)
+    assert cache.lookup("SELECT * FROM orders", SHOP) == (None, "miss")
+    assert cache.lookup("SELECT * FROM orders", OTHER) == ("result-other", "hit")
+
+
+def test_discard_connection_rereads_table_versions():
+    versions = {'orders': '2024-01-01 00:00:00'}
+    cache = _cache(versions)
+    before = cache.dependencies("SELECT * FROM orders", SHOP)
+    versions['orders'] = '2024-01-02 00:00:00'
+    # Within version_check_seconds the snapshot is reused
+    assert cache.dependencies("SELECT * FROM orders", SHOP) == before
+    cache.discard_connection(SHOP)
+    assert cache.dependencies("SELECT * FROM orders", SHOP) == {'orders': '2024-01-02 00:00:00'}
@@ -0,0 +1,94 @@
+import copy
+import time
+import pytest
+from backend import schema_cache
+from backend.schema_cache import compute_schema_version
+
+SCHEMA = {
+    'tables': {
+        'orders': {
+            'columns': [
+                {'name': 'id', 'type': 'int', 'base_type': 'int', 'nullable': False, 'default': None,
+                 'extra': 'auto_increment', 'comment': '', 'is_primary': True, 'is_unique': False, 'is_indexed': False},
+                {'name': 'status', 'type': 'varchar(20)', 'base_type': 'varchar', 'nullable': True, 'default': None,
+                 'extra': '', 'comment': '', 'is_primary': False, 'is_unique': False, 'is_indexed': True},
+            ],
+            'primary_keys': ['id'],
+            'foreign_keys': []
+        }
+    },
+    'relationships': [],
+    'table_metadata': {'orders': {'comment': 'Customer orders', 'estimated_rows': 100, 'created': '2024-01-01 00:00:00'}},
+    'indexes': {'orders': {'idx_status': {'columns': ['status'], 'unique': False}}}
+}
+
+
+def test_row_estimates_and_create_time_do_not_change_the_version():
+    changed = copy.deepcopy(SCHEMA)
+    changed['table_metadata']['orders'].update(estimated_rows=101, created='2024-02-01 00:00:00')
+    assert compute_schema_version(changed) == compute_schema_version(SCHEMA)
+
+
+def test_key_order_does_not_change_the_version():
+    reordered = dict(reversed(list(copy.deepcopy(SCHEMA).items())))
+    assert compute_schema_version(reordered) == compute_schema_version(SCHEMA)
+
+
+def test_structural_changes_change_the_version():
+    versions = {compute_schema_version(SCHEMA)}
+
+    column_type = copy.deepcopy(SCHEMA)
+    column_type['tables']['orders']['columns'][1]['type'] = 'varchar(40)'
+    added_index = copy.deepcopy(SCHEMA)
+    added_index['indexes']['orders']['idx_id'] = {'columns': ['id'], 'unique': True}
+    comment = copy.deepcopy(SCHEMA)
+    comment['table_metadata']['orders']['comment'] = 'Orders placed online'
+    for schema in (column_type, added_index, comment):
+        versions.add(compute_schema_version(schema))
+    assert len(versions) == 4
+
+
+KEY = ('db.example:3306', 'shop')
+VERSIONS = {'orders': {'created': '2024-01-01 00:00:00', 'updated': '2024-03-01 00:00:00'}}
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema_cache, "SCHEMA_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(schema_cache, "_schema_cache", {})
+    schema_cache._save_snapshot(KEY, {
+        'schema': SCHEMA, 'version': compute_schema_version(SCHEMA),
+        'full_loaded_at': time.time(), 'table_versions': VERSIONS
+    })
+    return tmp_path
+
+
+def test_snapshot_at_the_live_versions_is_served(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(schema_cache, "get_table_versions", lambda: copy.deepcopy(VERSIONS))
+    monkeypatch.setattr(schema_cache, "get_schema", lambda tables=None: pytest.fail("schema was reloaded"))
+    entry = schema_cache._warm_from_snapshot(KEY)
+    assert entry['version'] == compute_schema_version(SCHEMA)
+
+
+def test_outdated_snapshot_is_refreshed_before_it_is_served(snapshot_dir, monkeypatch):
+    live = copy.deepcopy(VERSIONS)
+    live['orders']['created'] = '2024-04-01 00:00:00'
+    altered = copy.deepcopy(SCHEMA)
+    altered['tables']['orders']['columns'][1]['type'] = 'varchar(40)'
+    requested = []
+
+    def get_schema(tables=None):
+        requested.append(tables)
+        return copy.deepcopy(altered)
+
+    monkeypatch.setattr(schema_cache, "get_table_versions", lambda: copy.deepcopy(live))
+    monkeypatch.setattr(schema_cache, "get_schema", get_schema)
+    entry = schema_cache._warm_from_snapshot(KEY)
+    assert requested == [['orders']]
+    assert entry['version'] == compute_schema_version(altered)
+    assert entry['table_versions'] == live
+
+
+def test_snapshot_is_not_served_when_versions_cannot_be_read(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(schema_cache, "get_table_versions", lambda: None)
+    assert schema_cache._warm_from_snapshot(KEY) is None
@@ -0,0 +1,42 @@
+import os
+import pytest
+from backend import schema_index
+
+
+def _entry(version, column):
+    schema = {
+        'tables': {'orders': {'columns': [{'name': column, 'base_type': 'int'}], 'primary_keys': [], 'foreign_keys': []}},
+        'relationships': [],
+        'table_metadata': {'orders': {'comment': ''}},
+        'indexes': {}
+    }
+    return {'version': version, 'schema': schema, 'previous_version': None, 'changed_tables': None}
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema_index, "SCHEMA_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(schema_index, "SCHEMA_INDEX_MAX_VERSIONS", 2)
+    schema_index._indexes.clear()
+    yield tmp_path
+    schema_index._indexes.clear()
+
+
+def test_superseded_versions_are_pruned(index_dir):
+    for i in range(4):
+        index = schema_index.get_schema_index(_entry(f"v{i}", f"col{i}"))
+        assert index.tables == ['orders', 'orders']
+        os.utime(index_dir / f"schema-v{i}-{schema_index.EMBEDDING_DIM}.npy", (i, i))
+
+    schema_index.get_schema_index(_entry("v4", "col4"))
+    names = sorted(path.name for path in index_dir.iterdir())
+    dim = schema_index.EMBEDDING_DIM
+    assert names == [f"schema-v3-{dim}.json", f"schema-v3-{dim}.npy", f"schema-v4-{dim}.json", f"schema-v4-{dim}.npy"]
+
+
+def test_persisted_index_is_reloaded(index_dir):
+    built = schema_index.get_schema_index(_entry("v1", "amount"))
+    schema_index._indexes.clear()
+    loaded = schema_index.get_schema_index(_entry("v1", "amount"))
+    assert loaded is not built
+    assert (loaded.matrix == built.matrix).all()
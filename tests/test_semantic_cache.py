@@ -0,0 +1,52 @@
+import pytest
+from backend.semantic_cache import SemanticCache, question_key
+
+VERSION, MODEL = "v1", "model"
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(100, 3600)
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("total revenue in the west region grouped by quarter", "total revenue in the east region grouped by quarter"),
+    ("list all pending orders", "list all cancelled orders"),
+    ("customers located in california", "customers located in nevada"),
+    ("top 5 products by sales", "top 10 products by sales"),
+    ("orders shipped in 'March'", "orders shipped in 'April'"),
+    ("products with the highest price", "products with the lowest price"),
+    ("revenue by month last year", "monthly revenue for last year"),
+])
+def test_near_misses_are_not_served(cache, cached, asked):
+    cache.add(cached, VERSION, MODEL, "SELECT 1")
+    assert cache.lookup(asked, VERSION, MODEL) is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("show total sales by region", "total sales per region"),
+    ("list the orders for each customer", "customer orders"),
+])
+def test_rewordings_are_served(cache, cached, asked):
+    cache.add(cached, VERSION, MODEL, "SELECT 1")
+    assert cache.lookup(asked, VERSION, MODEL) == ("SELECT 1", cached)
+
+
+def test_lookup_is_scoped_to_schema_version_and_model(cache):
+    cache.add("total sales by region", VERSION, MODEL, "SELECT 1")
+    assert cache.lookup("total sales by region", "v2", MODEL) is None
+    assert cache.lookup("total sales by region", VERSION, "other") is None
+    assert cache.invalidate_version(VERSION) == 1
+    assert cache.lookup("total sales by region", VERSION, MODEL) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SemanticCache(0, 3600)
+    cache.add("total sales by region", VERSION, MODEL, "SELECT 1")
+    assert cache.lookup("total sales by region", VERSION, MODEL) is None
+
+
+def test_key_includes_literals_and_content_words():
+    literals, words = question_key("Top 5 customers in 'Tokyo'")
+    assert literals == ("'tokyo'", "5")
+    assert {"top", "customer", "tokyo"} <= words
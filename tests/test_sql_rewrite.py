@@ -0,0 +1,40 @@
+import sqlparse
+from backend.sql_rewrite import inject_limit, has_top_level_limit
+
+
+def test_appends_a_limit():
+    assert inject_limit("SELECT * FROM orders", 100) == "SELECT * FROM orders LIMIT 100"
+
+
+def test_drops_trailing_semicolon_and_comment():
+    assert inject_limit("SELECT * FROM orders; -- all of them\n", 10) == "SELECT * FROM orders LIMIT 10"
+
+
+def test_keeps_a_smaller_limit():
+    assert inject_limit("SELECT * FROM orders LIMIT 5", 100) == "SELECT * FROM orders LIMIT 5"
+
+
+def test_tightens_a_larger_limit_and_keeps_its_offset():
+    assert inject_limit("SELECT * FROM orders LIMIT 500 OFFSET 20", 100) == "SELECT * FROM orders LIMIT 100 OFFSET 20"
+    assert inject_limit("SELECT * FROM orders LIMIT 20, 500", 100) == "SELECT * FROM orders LIMIT 20, 100"
+
+
+def test_a_subquery_limit_is_not_the_statements_limit():
+    sql = "SELECT * FROM (SELECT * FROM orders LIMIT 5) AS recent"
+    assert inject_limit(sql, 100) == f"{sql} LIMIT 100"
+
+
+def test_a_limit_before_union_belongs_to_the_first_select():
+    sql = "(SELECT id FROM a LIMIT 5) UNION ALL SELECT id FROM b"
+    assert not has_top_level_limit(sqlparse.parse(sql)[0])
+
+
+def test_non_integer_limit_is_capped_from_outside():
+    assert inject_limit("SELECT * FROM orders LIMIT ?", 10) == "SELECT * FROM (SELECT * FROM orders LIMIT ?) AS _limited LIMIT 10"
+
+
+def test_statements_that_cannot_be_limited():
+    assert inject_limit("UPDATE orders SET status = 'x'", 10) is None
+    assert inject_limit("SELECT 1; SELECT 2", 10) is None
+    assert inject_limit("SELECT * FROM orders FOR UPDATE", 10) is None
+    assert inject_limit("SELECT * FROM orders LOCK IN SHARE MODE", 10) is None